@@ -0,0 +1,179 @@
+"""
+Shared helpers for the RxVision25 benchmark suite.
+
+Every benchmark writes one JSON document holding the environment (commit,
+library versions, CPU count), its configuration and its results, so runs on
+different commits can be compared with ``python -m benchmarks.compare``.
+"""
+
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def git_commit() -> Optional[str]:
+    """Return the current commit hash, with a ``-dirty`` suffix for local changes."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info() -> Dict[str, Any]:
+    """Describe the machine and software a benchmark ran on."""
+    versions = {}
+    for module in ('numpy', 'tensorflow', 'onnxruntime', 'PIL', 'fastapi'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': versions
+    }
+
+
+def synthetic_jpegs(
+    count: int,
+    size: Sequence[int] = (1024, 768),
+    quality: int = 90,
+    seed: int = 0
+) -> List[bytes]:
+    """Encode distinct phone-photo-sized JPEGs (smooth gradients plus noise).
+
+    Args:
+        count: Number of images
+        size: (width, height) of each image
+        quality: JPEG quality
+        seed: Random seed
+
+    Returns:
+        Encoded images, all different so caches never hit
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    images = []
+    for _ in range(count):
+        base = rng.uniform(0, 255, 3)
+        slope = rng.uniform(-0.2, 0.2, (2, 3))
+        pixels = base + x[..., None] * slope[0] + y[..., None] * slope[1]
+        pixels += rng.normal(0, 12, pixels.shape)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(
+            buffer, format='JPEG', quality=quality
+        )
+        images.append(buffer.getvalue())
+    return images
+
+
+def time_calls(fn: Callable[[], Any], repeats: int, warmup: int = 2) -> List[float]:
+    """Call ``fn`` ``warmup`` times untimed, then return ``repeats`` durations in seconds."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def latency_summary(seconds: Sequence[float], items_per_call: int = 1) -> Dict[str, Any]:
+    """Summarize durations as mean and p50/p95/p99 milliseconds plus items/sec."""
+    if not len(seconds):
+        return {'count': 0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+        'items_per_second': float(items_per_call * 1000 / ms.mean()) if ms.mean() > 0 else None
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """Current resident memory of another process in MB (Linux only)."""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def save_results(
+    name: str,
+    config: Dict[str, Any],
+    results: Dict[str, Any],
+    output: Optional[str] = None
+) -> Path:
+    """Write a benchmark document as JSON.
+
+    Args:
+        name: Benchmark name
+        config: Settings the benchmark ran with
+        results: Measurements
+        output: Output file, defaults to
+            ``benchmarks/results/<name>-<commit>.json``
+
+    Returns:
+        Path of the written file
+    """
+    environment = environment_info()
+    if output is None:
+        commit = (environment['commit'] or 'unknown')[:12]
+        output = RESULTS_DIR / f"{name}-{commit}.json"
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(output, 'w') as f:
+        json.dump({
+            'benchmark': name,
+            'environment': environment,
+            'config': config,
+            'results': results
+        }, f, indent=2)
+    logger.info(f"Saved {name} results to {output}")
+    return output
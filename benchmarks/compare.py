@@ -0,0 +1,115 @@
+"""
+Compare two benchmark result files, e.g. from two commits.
+
+Every numeric result present in both files is listed with its relative
+change. Metrics where lower is better (``*_ms``, ``*_mb``, ``error_rate``)
+and where higher is better (``*_per_second``, ``*_rps``) are flagged when
+they get worse by more than ``--threshold``; the exit code is 1 if any did,
+so the comparison can gate CI.
+
+Usage:
+    python -m benchmarks.compare benchmarks/results/inference_micro-<old>.json \\
+        benchmarks/results/inference_micro-<new>.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+LOWER_IS_BETTER = ('_ms', '_mb', 'error_rate')
+HIGHER_IS_BETTER = ('_per_second', '_rps')
+
+
+def flatten(results: Any, prefix: str = '') -> Dict[str, float]:
+    """Flatten nested results into ``{'a.b.c': value}`` for numeric leaves."""
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(results, list):
+        for index, value in enumerate(results):
+            # Entries of per-rate lists are keyed by their target rate
+            key = value.get('target_rps', index) if isinstance(value, dict) else index
+            flat.update(flatten(value, f"{prefix}[{key}]"))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix] = float(results)
+    return flat
+
+
+def _direction(name: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None if neither."""
+    parts = name.replace('[', '.').split('.')
+    if any(part.endswith(HIGHER_IS_BETTER) for part in parts):
+        return 1
+    if any(part.endswith(LOWER_IS_BETTER) for part in parts):
+        return -1
+    return None
+
+
+def compare(
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    threshold: float = 0.1
+) -> List[Tuple[str, float, float, Optional[float], bool]]:
+    """Compare the ``results`` of two benchmark documents.
+
+    Args:
+        old: Baseline document
+        new: Document to check
+        threshold: Relative change beyond which a worse metric is a regression
+
+    Returns:
+        Rows of (metric, old, new, relative change, regressed)
+    """
+    old_flat, new_flat = flatten(old['results']), flatten(new['results'])
+    rows = []
+    for name in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[name], new_flat[name]
+        change = (after - before) / abs(before) if before else None
+        direction = _direction(name)
+        if direction is None:
+            regressed = False
+        elif change is None:
+            # No relative change from zero, e.g. an error rate that appears
+            regressed = direction * (after - before) < 0
+        else:
+            regressed = -direction * change > threshold
+        rows.append((name, before, after, change, regressed))
+    return rows
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('old', help="Baseline results JSON")
+    parser.add_argument('new', help="Results JSON to check")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative change that counts as a regression")
+    parser.add_argument('--all', action='store_true', help="Also list metrics that did not regress")
+
+    args = parser.parse_args()
+
+    with open(args.old, 'r') as f:
+        old = json.load(f)
+    with open(args.new, 'r') as f:
+        new = json.load(f)
+    if old.get('benchmark') != new.get('benchmark'):
+        sys.exit(f"Cannot compare {old.get('benchmark')} with {new.get('benchmark')} results")
+
+    print(f"{old['benchmark']}: {old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    rows = compare(old, new, args.threshold)
+    regressions = 0
+    for name, before, after, change, regressed in rows:
+        regressions += regressed
+        if not (args.all or regressed):
+            continue
+        change_text = f"{change:+.1%}" if change is not None else 'n/a'
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:60s} {before:12.3f} {after:12.3f} {change_text:>8s}{flag}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%} in {len(rows)} metrics")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
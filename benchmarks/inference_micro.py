@@ -0,0 +1,153 @@
+"""
+Inference micro-benchmarks for RxVision25.
+
+Times each stage of a prediction on its own: JPEG decode near the model
+resolution, batch preprocessing, the forward pass at several batch sizes
+and top-k postprocessing, plus decode-to-result end to end. By default the
+model is ``create_placeholder_model``, so the suite runs offline with no
+trained weights; pass ``--model`` to measure a real artifact.
+
+Usage:
+    python -m benchmarks.inference_micro
+    python -m benchmarks.inference_micro --model models/best_model.onnx \\
+        --batch-sizes 1 8 32 64 --output micro.json
+"""
+
+import argparse
+import itertools
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from src.data.preprocessing import decode_image
+from src.inference.placeholder_model import create_placeholder_model
+from src.inference.predictor import RxPredictor
+
+from .common import latency_summary, peak_rss_mb, save_results, synthetic_jpegs, time_calls
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run_micro_benchmarks(
+    model_path: Optional[str] = None,
+    backend: Optional[str] = None,
+    batch_sizes: Sequence[int] = (1, 8, 32, 64),
+    repeats: int = 20,
+    warmup: int = 3,
+    num_classes: int = 15,
+    top_k: int = 5,
+    image_size: Sequence[int] = (1024, 768)
+) -> Dict[str, Any]:
+    """Time decode, preprocess, forward and postprocess separately.
+
+    Args:
+        model_path: Model to load; a placeholder model when omitted
+        backend: Inference backend, inferred from the model file by default
+        batch_sizes: Batch sizes for the batched stages
+        repeats: Timed calls per measurement
+        warmup: Untimed calls before each measurement
+        num_classes: Classes of the placeholder model
+        top_k: Predictions returned per image
+        image_size: (width, height) of the synthetic JPEGs
+
+    Returns:
+        Latency summaries per stage, keyed by batch size for batched stages
+    """
+    with tempfile.TemporaryDirectory(prefix='rxvision-bench-') as tmp:
+        if model_path is None:
+            model_path = str(Path(tmp) / 'placeholder_model.h5')
+            create_placeholder_model(num_classes=num_classes).save(model_path)
+        predictor = RxPredictor(model_path, batch_size=max(batch_sizes), backend=backend)
+
+    payloads = synthetic_jpegs(max(batch_sizes), size=image_size)
+    results: Dict[str, Any] = {}
+
+    # Decode one upload at a time, as the service does per request
+    decoded = [decode_image(data, target_size=predictor.target_size)[0] for data in payloads]
+    uploads = itertools.cycle(payloads)
+    results['decode'] = latency_summary(time_calls(
+        lambda: decode_image(next(uploads), target_size=predictor.target_size),
+        repeats=max(repeats, len(payloads)),
+        warmup=warmup
+    ))
+    logger.info(f"decode: {results['decode']['p50_ms']:.2f} ms p50 per image")
+
+    for stage in ('preprocess', 'forward', 'postprocess', 'end_to_end'):
+        results[stage] = {}
+
+    for batch_size in batch_sizes:
+        images = decoded[:batch_size]
+        batch = np.array(predictor.preprocess_batch(images))
+        probabilities = predictor.backend.predict(batch)
+
+        timings = {
+            'preprocess': lambda: predictor.preprocess_batch(images),
+            'forward': lambda: predictor.backend.predict(batch),
+            'postprocess': lambda: predictor.format_predictions(probabilities, top_k),
+            'end_to_end': lambda: predictor.predict_batch(
+                [decode_image(data, target_size=predictor.target_size)[0]
+                 for data in payloads[:batch_size]],
+                return_top_k=top_k
+            )
+        }
+        for stage, fn in timings.items():
+            summary = latency_summary(time_calls(fn, repeats, warmup), items_per_call=batch_size)
+            results[stage][str(batch_size)] = summary
+        logger.info(
+            f"batch {batch_size}: preprocess {results['preprocess'][str(batch_size)]['p50_ms']:.2f} ms, "
+            f"forward {results['forward'][str(batch_size)]['p50_ms']:.2f} ms, "
+            f"postprocess {results['postprocess'][str(batch_size)]['p50_ms']:.3f} ms, "
+            f"end to end {results['end_to_end'][str(batch_size)]['items_per_second']:.1f} images/s"
+        )
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    predictor.backend.close()
+    return results
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 inference micro-benchmarks")
+    parser.add_argument('--model', default=None, help="Model file (placeholder model by default)")
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--num-classes', type=int, default=15)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--image-size', type=int, nargs=2, default=[1024, 768],
+                        metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+
+    args = parser.parse_args()
+
+    config = {
+        'model': args.model or 'placeholder',
+        'backend': args.backend,
+        'batch_sizes': args.batch_sizes,
+        'repeats': args.repeats,
+        'warmup': args.warmup,
+        'num_classes': args.num_classes,
+        'top_k': args.top_k,
+        'image_size': args.image_size
+    }
+    results = run_micro_benchmarks(
+        model_path=args.model,
+        backend=args.backend,
+        batch_sizes=args.batch_sizes,
+        repeats=args.repeats,
+        warmup=args.warmup,
+        num_classes=args.num_classes,
+        top_k=args.top_k,
+        image_size=args.image_size
+    )
+    save_results('inference_micro', config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
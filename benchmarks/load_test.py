@@ -0,0 +1,309 @@
+"""
+Load test for the RxVision25 inference service.
+
+Starts ``src.inference.service`` under uvicorn with a placeholder model (or
+targets a running server) and sends ``/predict`` uploads at fixed request
+rates. Requests are sent open-loop on a fixed schedule whatever the server's
+response times, and latency is measured from each request's scheduled send
+time, so a saturated server shows up as growing latency instead of a
+quietly lower send rate. For every rate the report holds achieved
+throughput, p50/p95/p99 latency, status codes and the server's memory,
+and the report includes the server's cold start breakdown from ``/ready``.
+
+Usage:
+    python -m benchmarks.load_test --rates 5 10 20 --duration 30
+    python -m benchmarks.load_test --url http://localhost:8000 --pid 1234
+"""
+
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from .common import latency_summary, process_rss_mb, save_results, synthetic_jpegs
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(
+    model_path: str,
+    port: int,
+    env: Optional[Dict[str, str]] = None,
+    timeout: float = 180.0
+) -> subprocess.Popen:
+    """Start the service under uvicorn and wait until ``/ready`` answers.
+
+    Args:
+        model_path: Model served by the service
+        port: Local port to listen on
+        env: Extra ``RXVISION_*`` settings
+        timeout: Seconds to wait for the model to load
+
+    Returns:
+        The server process
+
+    Raises:
+        RuntimeError: If the server exits or does not become ready in time
+    """
+    server_env = dict(os.environ)
+    # Distinct synthetic uploads never hit the cache; keep it out of the numbers
+    server_env.setdefault('RXVISION_CACHE_MAX_ENTRIES', '0')
+    server_env.update(env or {})
+    server_env['RXVISION_MODEL_PATH'] = model_path
+
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'uvicorn', 'src.inference.service:app',
+            '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'
+        ],
+        env=server_env
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1.0).status_code == 200:
+                logger.info(f"Server ready on port {port} (pid {process.pid})")
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+
+    stop_server(process)
+    raise RuntimeError(f"Server did not become ready within {timeout:.0f}s")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    """Terminate a server started by ``start_server``."""
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def _sample_memory(pid: int, samples: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        rss = process_rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_rate(
+    client: httpx.AsyncClient,
+    url: str,
+    payloads: Sequence[bytes],
+    rate: float,
+    duration: float,
+    top_k: int = 1,
+    pid: Optional[int] = None
+) -> Dict[str, Any]:
+    """Send ``/predict`` requests at a fixed rate for ``duration`` seconds.
+
+    Args:
+        client: HTTP client
+        url: Base URL of the service
+        payloads: JPEG uploads, sent in rotation
+        rate: Requests per second
+        duration: Seconds to send for
+        top_k: ``return_top_k`` of each request
+        pid: Server process to sample memory from
+
+    Returns:
+        Throughput, latency summary, status counts and memory
+    """
+    loop = asyncio.get_running_loop()
+    count = max(1, int(rate * duration))
+    statuses: Dict[str, int] = collections.Counter()
+    latencies: List[float] = []
+    completions: List[float] = []
+
+    async def send(index: int, scheduled: float) -> None:
+        payload = payloads[index % len(payloads)]
+        try:
+            response = await client.post(
+                f"{url}/predict",
+                params={'return_top_k': top_k},
+                files={'file': (f"image_{index}.jpg", payload, 'image/jpeg')}
+            )
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finished = loop.time()
+        statuses[status] += 1
+        if status == '200':
+            latencies.append(finished - scheduled)
+            completions.append(finished)
+
+    memory: List[float] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_memory(pid, memory, stop)) if pid else None
+
+    start = loop.time()
+    tasks = []
+    for index in range(count):
+        scheduled = start + index / rate
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(index, scheduled)))
+    await asyncio.gather(*tasks)
+
+    stop.set()
+    if sampler is not None:
+        await sampler
+
+    elapsed = (max(completions) if completions else loop.time()) - start
+    result = {
+        'target_rps': rate,
+        'sent': count,
+        'succeeded': len(latencies),
+        'throughput_rps': len(latencies) / elapsed if elapsed > 0 else None,
+        'error_rate': 1 - len(latencies) / count,
+        'statuses': dict(statuses),
+        'latency': latency_summary(latencies),
+        'server_rss_mb': {
+            'mean': sum(memory) / len(memory),
+            'peak': max(memory)
+        } if memory else None
+    }
+    logger.info(
+        f"{rate:g} req/s: {result['throughput_rps'] or 0:.1f} req/s achieved, "
+        f"p50 {result['latency'].get('p50_ms', 0):.1f} ms, "
+        f"p95 {result['latency'].get('p95_ms', 0):.1f} ms, "
+        f"p99 {result['latency'].get('p99_ms', 0):.1f} ms, "
+        f"errors {result['error_rate']:.1%}"
+    )
+    return result
+
+
+async def run_load_test(
+    url: str,
+    rates: Sequence[float],
+    duration: float = 20.0,
+    top_k: int = 1,
+    num_images: int = 64,
+    image_size: Sequence[int] = (1024, 768),
+    pid: Optional[int] = None,
+    timeout: float = 60.0
+) -> Dict[str, Any]:
+    """Run ``run_rate`` for each rate in turn against a running service."""
+    payloads = synthetic_jpegs(num_images, size=image_size)
+    limits = httpx.Limits(max_connections=512, max_keepalive_connections=512)
+    results: Dict[str, Any] = {'rates': []}
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        # Warm the model and connection pool before measuring
+        for payload in payloads[:4]:
+            await client.post(f"{url}/predict", files={'file': ('warmup.jpg', payload, 'image/jpeg')})
+        if pid:
+            results['server_rss_mb_idle'] = process_rss_mb(pid)
+        try:
+            startup = (await client.get(f"{url}/ready")).json()['startup']
+            results['startup'] = {
+                f"{phase[:-len('_seconds')]}_ms": seconds * 1000.0
+                for phase, seconds in startup.items() if seconds is not None
+            }
+        except (httpx.HTTPError, ValueError, KeyError):
+            results['startup'] = None
+
+        for rate in rates:
+            results['rates'].append(
+                await run_rate(client, url, payloads, rate, duration, top_k=top_k, pid=pid)
+            )
+
+        try:
+            results['server_stats'] = (await client.get(f"{url}/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            results['server_stats'] = None
+    return results
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 service load test")
+    parser.add_argument('--rates', type=float, nargs='+', default=[5, 10, 20, 40],
+                        help="Request rates (req/s) to run, in order")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per rate")
+    parser.add_argument('--top-k', type=int, default=1)
+    parser.add_argument('--num-images', type=int, default=64)
+    parser.add_argument('--image-size', type=int, nargs=2, default=[1024, 768],
+                        metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--url', default=None, help="Target a running server instead")
+    parser.add_argument('--pid', type=int, default=None, help="Server pid for memory sampling with --url")
+    parser.add_argument('--model', default=None, help="Model to serve (placeholder model by default)")
+    parser.add_argument('--num-classes', type=int, default=15)
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help="Extra service settings, e.g. RXVISION_INFERENCE_PROCESSES=2")
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+
+    args = parser.parse_args()
+
+    config = {
+        'rates': args.rates,
+        'duration': args.duration,
+        'top_k': args.top_k,
+        'num_images': args.num_images,
+        'image_size': args.image_size,
+        'url': args.url,
+        'model': args.model or ('placeholder' if args.url is None else None),
+        'env': args.env
+    }
+
+    server = None
+    with tempfile.TemporaryDirectory(prefix='rxvision-load-') as tmp:
+        url, pid = args.url, args.pid
+        if url is None:
+            model_path = args.model
+            if model_path is None:
+                from src.inference.placeholder_model import create_placeholder_model
+                model_path = str(Path(tmp) / 'placeholder_model.h5')
+                create_placeholder_model(num_classes=args.num_classes).save(model_path)
+            port = _free_port()
+            env = dict(item.split('=', 1) for item in args.env)
+            server = start_server(model_path, port, env=env)
+            url, pid = f"http://127.0.0.1:{port}", server.pid
+
+        try:
+            results = asyncio.run(run_load_test(
+                url,
+                args.rates,
+                duration=args.duration,
+                top_k=args.top_k,
+                num_images=args.num_images,
+                image_size=args.image_size,
+                pid=pid
+            ))
+        finally:
+            if server is not None:
+                stop_server(server)
+
+    save_results('load_test', config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
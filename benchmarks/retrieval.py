@@ -0,0 +1,185 @@
+"""
+Embedding index benchmark for RxVision25.
+
+Grows a reference index step by step (1k, 10k, then 100k rows by default)
+and at each size times insertion, exact search and IVF search for single
+queries and query batches, and measures the recall of IVF search against
+exact search. Every step adds new labels (NDCs) with a fixed number of
+references each, as onboarding new pills does. The embeddings are
+synthetic: unit vectors scattered around one center per label, so no model
+or images are needed.
+
+Usage:
+    python -m benchmarks.retrieval
+    python -m benchmarks.retrieval --sizes 1000 10000 100000 1000000 --dtypes int8
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+from src.inference.embedding_index import EmbeddingIndex
+
+from .common import latency_summary, peak_rss_mb, save_results, time_calls
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def synthetic_embeddings(
+    labels: np.ndarray,
+    centers: np.ndarray,
+    rng: np.random.Generator,
+    spread: float = 0.5
+) -> np.ndarray:
+    """Unit vectors scattered around the centers of ``labels``."""
+    vectors = centers[labels] + spread * rng.standard_normal(
+        (len(labels), centers.shape[1]), dtype=np.float32
+    ) / np.sqrt(centers.shape[1])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _recall(approximate: np.ndarray, exact: np.ndarray) -> float:
+    """Fraction of the exact top-k rows that approximate search also found."""
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approximate, exact))
+    return hits / exact.size
+
+
+def run_retrieval_benchmark(
+    sizes: Sequence[int] = (1000, 10000, 100000),
+    dtypes: Sequence[str] = ('float16', 'int8'),
+    dim: int = 1280,
+    references_per_label: int = 20,
+    query_batch_sizes: Sequence[int] = (1, 32),
+    k: int = 10,
+    nprobe: int = 8,
+    repeats: int = 20,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """Time inserts and searches while the index grows.
+
+    Args:
+        sizes: Index sizes to measure at, in increasing order
+        dtypes: Storage dtypes to compare
+        dim: Embedding dimension (1280 matches EfficientNetV2-B0)
+        references_per_label: Reference embeddings of every label
+        query_batch_sizes: Queries per search call
+        k: Rows returned per query
+        nprobe: IVF partitions searched per query
+        repeats: Timed calls per measurement
+        seed: Random seed
+
+    Returns:
+        Per dtype and size: insert throughput, IVF training time, exact and
+        IVF search latency per batch size, IVF recall and index size on disk
+    """
+    rng = np.random.default_rng(seed)
+    num_labels = -(-max(sizes) // references_per_label)
+    centers = rng.standard_normal((num_labels, dim), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    names = [f"ndc-{i}" for i in range(num_labels)]
+
+    results = {}
+    for dtype in dtypes:
+        results[dtype] = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            index = EmbeddingIndex.create(tmp, dim, dtype=dtype)
+            for size in sorted(sizes):
+                added, insert_seconds = size - len(index), 0.0
+                while len(index) < size:
+                    rows = np.arange(len(index), min(len(index) + 10000, size))
+                    vectors = synthetic_embeddings(rows // references_per_label, centers, rng)
+                    labels = [names[row // references_per_label] for row in rows]
+                    start = time.perf_counter()
+                    index.add(vectors, labels)
+                    insert_seconds += time.perf_counter() - start
+
+                # New photos of pills that already have references
+                query_labels = rng.integers(-(-size // references_per_label), size=max(query_batch_sizes))
+                queries = synthetic_embeddings(query_labels, centers, rng)
+                entry = {
+                    'size': size,
+                    'labels': len(index.label_names),
+                    'insert_rows_per_second': added / insert_seconds if insert_seconds else None
+                }
+                for batch_size in query_batch_sizes:
+                    batch = queries[:batch_size]
+                    entry[f'exact_batch_{batch_size}'] = latency_summary(
+                        time_calls(lambda: index.search(batch, k), repeats), batch_size
+                    )
+
+                nlist = max(1, int(4 * np.sqrt(size)))
+                start = time.perf_counter()
+                index.train_ivf(nlist, seed=seed)
+                entry['nlist'] = nlist
+                entry['ivf_train_ms'] = (time.perf_counter() - start) * 1000
+                for batch_size in query_batch_sizes:
+                    batch = queries[:batch_size]
+                    entry[f'ivf_batch_{batch_size}'] = latency_summary(
+                        time_calls(lambda: index.search(batch, k, nprobe=nprobe), repeats),
+                        batch_size
+                    )
+                exact_rows, _ = index.search(queries, k)
+                ivf_rows, _ = index.search(queries, k, nprobe=nprobe)
+                entry[f'ivf_recall_at_{k}'] = _recall(ivf_rows, exact_rows)
+                entry['index_mb'] = index.stats()['disk_mb']
+                results[dtype][str(size)] = entry
+
+                latency = ', '.join(
+                    f"{kind} b{batch_size} {entry[f'{kind}_batch_{batch_size}']['p50_ms']:.2f} ms"
+                    for kind in ('exact', 'ivf') for batch_size in query_batch_sizes
+                )
+                logger.info(
+                    f"{dtype}, {size} rows: {latency} (nlist {nlist}, nprobe {nprobe}); "
+                    f"recall@{k} {entry[f'ivf_recall_at_{k}']:.3f}, {entry['index_mb']:.1f} MB"
+                )
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 embedding index benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--dtypes', nargs='+', choices=['float16', 'int8'],
+                        default=['float16', 'int8'])
+    parser.add_argument('--dim', type=int, default=1280)
+    parser.add_argument('--references-per-label', type=int, default=20)
+    parser.add_argument('--query-batch-sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+
+    args = parser.parse_args()
+
+    config = {
+        'sizes': args.sizes,
+        'dtypes': args.dtypes,
+        'dim': args.dim,
+        'references_per_label': args.references_per_label,
+        'query_batch_sizes': args.query_batch_sizes,
+        'k': args.k,
+        'nprobe': args.nprobe,
+        'repeats': args.repeats
+    }
+    results = run_retrieval_benchmark(
+        sizes=args.sizes,
+        dtypes=args.dtypes,
+        dim=args.dim,
+        references_per_label=args.references_per_label,
+        query_batch_sizes=args.query_batch_sizes,
+        k=args.k,
+        nprobe=args.nprobe,
+        repeats=args.repeats
+    )
+    save_results('retrieval', config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Pre-decoded, memory-mapped dataset format for RxVision25 training.
+
+Training always consumes fixed-size images, so decoding and resizing every
+JPEG each epoch is repeated work. ``compile_dataset`` does it once: images
+from a class-per-directory split are resized to ``img_size`` and stored as
+uint8 rows in ``.npy`` shards, with an ``index.json`` describing every
+source file (class, size, mtime, shard and row) plus the class names. Re-running the compiler
+only decodes files that are new or changed since the last run.
+
+``CompiledDataset`` memory-maps the shards for random access, so shuffled
+batches are gathered straight from the page cache with no decode cost.
+``create_dataset`` in ``src.data.pipeline`` uses it automatically when given
+a compiled directory.
+
+Usage:
+    python -m src.data.compiled_dataset data/train data/compiled/train
+    python -m src.data.compiled_dataset data/val data/compiled/val
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from .preprocessing import list_labeled_images, load_image
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+
+# Resampling filters by the names used for tf.image.resize
+RESAMPLE_FILTERS = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC
+}
+
+
+def is_compiled_dataset(path: str) -> bool:
+    """Return whether ``path`` is a directory written by ``compile_dataset``."""
+    return (Path(path) / INDEX_FILE).is_file()
+
+
+def _write_index(output_dir: Path, index: Dict[str, Any]) -> None:
+    """Atomically replace the index so an interrupted compile stays readable."""
+    tmp = output_dir / (INDEX_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, output_dir / INDEX_FILE)
+
+
+def compile_dataset(
+    data_dir: str,
+    output_dir: str,
+    img_size: int = 224,
+    shard_size: int = 2048,
+    resample: str = 'nearest',
+    num_workers: Optional[int] = None,
+    rebuild: bool = False
+) -> Dict[str, Any]:
+    """Compile or update a memory-mapped copy of a class-per-directory split.
+
+    Args:
+        data_dir: Split directory with one sub-directory per class
+        output_dir: Directory for the shards and index
+        img_size: Height and width images are resized to
+        shard_size: Maximum images per shard file
+        resample: 'nearest' (as ``flow_from_directory``), 'bilinear' or 'bicubic'
+        num_workers: Decode threads, defaults to the CPU count
+        rebuild: Discard an existing compiled copy instead of updating it
+
+    Returns:
+        Summary with added, removed, unchanged and failed file counts
+
+    Raises:
+        ValueError: If an existing copy was compiled with other settings
+    """
+    data_dir = Path(data_dir)
+    output_dir = Path(output_dir)
+    if resample not in RESAMPLE_FILTERS:
+        raise ValueError(f"Unknown resample '{resample}', expected one of {list(RESAMPLE_FILTERS)}")
+
+    if rebuild and output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    index = {
+        'version': INDEX_VERSION,
+        'img_size': img_size,
+        'resample': resample,
+        'shards': [],
+        'entries': []
+    }
+    if is_compiled_dataset(output_dir):
+        with open(output_dir / INDEX_FILE, 'r') as f:
+            index = json.load(f)
+        if index['img_size'] != img_size or index['resample'] != resample:
+            raise ValueError(
+                f"{output_dir} was compiled at {index['img_size']}px/{index['resample']}; "
+                f"pass rebuild=True to recompile at {img_size}px/{resample}"
+            )
+
+    # Keep entries whose source file is unchanged
+    paths, _, class_names = list_labeled_images(data_dir)
+    index['class_names'] = class_names
+    current = {}
+    for path in paths:
+        stat = path.stat()
+        current[path.relative_to(data_dir).as_posix()] = (stat.st_size, stat.st_mtime_ns)
+
+    kept = [
+        entry for entry in index['entries']
+        if current.get(entry['path']) == (entry['size'], entry['mtime_ns'])
+    ]
+    known = {entry['path'] for entry in kept}
+    new_files = sorted(path for path in current if path not in known)
+    removed = len(index['entries']) - len(kept)
+    unchanged = len(kept)
+    index['entries'] = kept
+
+    start = time.perf_counter()
+    failed = []
+    filter_ = RESAMPLE_FILTERS[resample]
+
+    def decode(args) -> Optional[str]:
+        rel_path, out = args
+        try:
+            image = load_image(data_dir / rel_path)
+            if image.size != (img_size, img_size):
+                image = image.resize((img_size, img_size), filter_)
+            out[...] = np.asarray(image)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count() or 1) as pool:
+        for offset in range(0, len(new_files), shard_size):
+            chunk = new_files[offset:offset + shard_size]
+            shard_name = f"images-{len(index['shards']):05d}.npy"
+            shard = np.lib.format.open_memmap(
+                output_dir / shard_name,
+                mode='w+',
+                dtype=np.uint8,
+                shape=(len(chunk), img_size, img_size, 3)
+            )
+            errors = list(pool.map(decode, zip(chunk, shard)))
+            shard.flush()
+            del shard
+
+            shard_id = len(index['shards'])
+            index['shards'].append(shard_name)
+            for row, (rel_path, error) in enumerate(zip(chunk, errors)):
+                if error is not None:
+                    logger.warning(f"Skipping {rel_path}: {error}")
+                    failed.append(rel_path)
+                    continue
+                size, mtime_ns = current[rel_path]
+                index['entries'].append({
+                    'path': rel_path,
+                    'class': rel_path.split('/', 1)[0],
+                    'size': size,
+                    'mtime_ns': mtime_ns,
+                    'shard': shard_id,
+                    'row': row
+                })
+
+            # Commit after every shard so an interrupted compile keeps its progress
+            _write_index(output_dir, index)
+            logger.info(f"Compiled {offset + len(chunk)}/{len(new_files)} new images")
+
+    index['entries'].sort(key=lambda entry: entry['path'])
+    _write_index(output_dir, index)
+
+    elapsed = time.perf_counter() - start
+    added = len(new_files) - len(failed)
+    total_rows = sum(
+        np.load(output_dir / name, mmap_mode='r').shape[0] for name in index['shards']
+    )
+    summary = {
+        'output_dir': str(output_dir),
+        'images': len(index['entries']),
+        'added': added,
+        'removed': removed,
+        'unchanged': unchanged,
+        'failed': failed,
+        'unreferenced_rows': total_rows - len(index['entries']),
+        'seconds': elapsed,
+        'images_per_second': added / elapsed if elapsed > 0 and added else None
+    }
+    logger.info(
+        f"Compiled dataset at {output_dir}: {summary['images']} images "
+        f"({added} added, {removed} removed, {len(failed)} failed)"
+    )
+    if summary['unreferenced_rows'] > len(index['entries']) // 4:
+        logger.warning(
+            f"{summary['unreferenced_rows']} rows belong to removed or changed files; "
+            f"rebuild to reclaim the space"
+        )
+    return summary
+
+
+class CompiledDataset:
+    """Random-access reader for a dataset written by ``compile_dataset``."""
+
+    def __init__(self, path: str):
+        """Open the index and memory-map the shards.
+
+        Args:
+            path: Directory written by ``compile_dataset``
+        """
+        self.path = Path(path)
+        with open(self.path / INDEX_FILE, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported compiled dataset version {index.get('version')}")
+
+        self.img_size = index['img_size']
+        self.entries = index['entries']
+        self.shards = [np.load(self.path / name, mmap_mode='r') for name in index['shards']]
+
+        # Label indices follow the sorted class directories, as in
+        # flow_from_directory, even when a class has no usable images
+        self.class_names = index.get('class_names') or sorted({e['class'] for e in self.entries})
+        class_ids = {name: idx for idx, name in enumerate(self.class_names)}
+        self.labels = np.array([class_ids[e['class']] for e in self.entries], dtype=np.int32)
+        self._shard_ids = np.array([e['shard'] for e in self.entries], dtype=np.int32)
+        self._rows = np.array([e['row'] for e in self.entries], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def split_indices(
+        self,
+        validation_split: Optional[float] = None,
+        subset: Optional[str] = None
+    ) -> np.ndarray:
+        """Return the entry indices of a ``flow_from_directory``-style subset.
+
+        With ``validation_split``, the first ``int(split * n)`` files of each
+        class (in sorted path order) are the 'validation' subset and the rest
+        the 'training' subset.
+        """
+        if not validation_split:
+            return np.arange(len(self), dtype=np.int64)
+        if subset not in ('training', 'validation'):
+            raise ValueError("subset must be 'training' or 'validation' with validation_split")
+
+        selected = []
+        for label in range(len(self.class_names)):
+            members = np.flatnonzero(self.labels == label)
+            cut = int(validation_split * len(members))
+            selected.append(members[:cut] if subset == 'validation' else members[cut:])
+        return np.concatenate(selected) if selected else np.arange(0, dtype=np.int64)
+
+    def gather(self, indices: Sequence[int]) -> np.ndarray:
+        """Copy the images of ``indices`` into a new (N, H, W, 3) uint8 array."""
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices), self.img_size, self.img_size, 3), dtype=np.uint8)
+        shard_ids = self._shard_ids[indices]
+        rows = self._rows[indices]
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            out[mask] = self.shards[shard_id][rows[mask]]
+        return out
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Compile a split into memory-mapped shards")
+    parser.add_argument('data_dir', help="Split directory, e.g. data/train")
+    parser.add_argument('output_dir', help="Output directory, e.g. data/compiled/train")
+    parser.add_argument('--img-size', type=int, default=224)
+    parser.add_argument('--shard-size', type=int, default=2048)
+    parser.add_argument('--resample', default='nearest', choices=list(RESAMPLE_FILTERS))
+    parser.add_argument('--num-workers', type=int, default=None)
+    parser.add_argument('--rebuild', action='store_true', help="Recompile from scratch")
+
+    args = parser.parse_args()
+
+    compile_dataset(
+        args.data_dir,
+        args.output_dir,
+        img_size=args.img_size,
+        shard_size=args.shard_size,
+        resample=args.resample,
+        num_workers=args.num_workers,
+        rebuild=args.rebuild
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+tf.data input pipeline for RxVision25 training.
+
+Replaces ``ImageDataGenerator.flow_from_directory`` with a graph-level
+pipeline: files are read and decoded in parallel, augmentation runs inside
+the graph on whole batches (see ``src.data.augmentation``), and decoded images can be cached in memory or
+on disk so later epochs skip JPEG decoding. Directory layout, class order
+and ``validation_split`` subsets match ``flow_from_directory``, so results
+stay comparable with earlier runs. Directories written by
+``src.data.compiled_dataset`` are read from their memory-mapped shards
+instead, with no decoding at all.
+
+Usage:
+    python -m src.data.pipeline benchmark data/train --augment --batches 200
+"""
+
+import argparse
+import io
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from .augmentation import BatchAugmenter
+from .compiled_dataset import CompiledDataset, is_compiled_dataset
+from .preprocessing import IMAGE_EXTENSIONS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# Accepted extensions that tf.io.decode_image cannot read; decoded with PIL
+PIL_ONLY_EXTENSIONS = tuple(
+    ext for ext in IMAGE_EXTENSIONS if ext not in ('.png', '.jpg', '.jpeg', '.bmp')
+)
+_PIL_ONLY_PATTERN = '.*(' + '|'.join(ext.replace('.', '\\.') for ext in PIL_ONLY_EXTENSIONS) + ')'
+
+
+def _decode_with_pil(data: tf.Tensor) -> np.ndarray:
+    """Decode image bytes to an RGB uint8 array with PIL."""
+    with Image.open(io.BytesIO(data.numpy())) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def decode_image_file(path: tf.Tensor) -> tf.Tensor:
+    """Read and decode any ``IMAGE_EXTENSIONS`` file to an (H, W, 3) uint8 tensor.
+
+    PNG, JPEG and BMP are decoded in the graph; TIFF and PPM fall back to PIL
+    through ``tf.py_function``.
+    """
+    data = tf.io.read_file(path)
+    needs_pil = tf.strings.regex_full_match(tf.strings.lower(path), _PIL_ONLY_PATTERN)
+
+    def pil_decode():
+        return tf.py_function(_decode_with_pil, [data], tf.uint8)
+
+    def tf_decode():
+        return tf.io.decode_image(data, channels=3, expand_animations=False)
+
+    image = tf.cond(needs_pil, pil_decode, tf_decode)
+    image.set_shape((None, None, 3))
+    return image
+
+
+def list_split_files(
+    data_dir: str,
+    validation_split: Optional[float] = None,
+    subset: Optional[str] = None
+) -> Tuple[List[str], List[int], List[str]]:
+    """List images and labels the way ``flow_from_directory`` does.
+
+    Classes are the sorted sub-directory names. With ``validation_split``,
+    the first ``int(split * n)`` sorted files of each class form the
+    'validation' subset and the rest the 'training' subset.
+
+    Args:
+        data_dir: Directory containing one sub-directory per class
+        validation_split: Fraction of each class held out for validation
+        subset: 'training' or 'validation' when ``validation_split`` is set
+
+    Returns:
+        Tuple of (file paths, class indices, class names)
+    """
+    data_dir = Path(data_dir)
+    if not data_dir.exists():
+        raise FileNotFoundError(f"Data directory not found: {data_dir}")
+    if validation_split and subset not in ('training', 'validation'):
+        raise ValueError("subset must be 'training' or 'validation' with validation_split")
+
+    class_names = sorted(p.name for p in data_dir.iterdir() if p.is_dir())
+    paths, labels = [], []
+    for idx, class_name in enumerate(class_names):
+        files = sorted(
+            str(p) for p in (data_dir / class_name).rglob('*')
+            if p.suffix.lower() in IMAGE_EXTENSIONS
+        )
+        if validation_split:
+            cut = int(validation_split * len(files))
+            files = files[:cut] if subset == 'validation' else files[cut:]
+        paths.extend(files)
+        labels.extend([idx] * len(files))
+
+    logger.info(
+        f"Found {len(paths)} images belonging to {len(class_names)} classes"
+        + (f" ({subset})" if validation_split else "")
+    )
+    return paths, labels, class_names
+
+
+def create_dataset(
+    data_dir: str,
+    img_size: int = 224,
+    batch_size: int = 32,
+    validation_split: Optional[float] = None,
+    subset: Optional[str] = None,
+    augment: bool = False,
+    shuffle: bool = False,
+    seed: int = 1337,
+    cache: Union[bool, str] = False,
+    shuffle_buffer: int = 10000,
+    interpolation: str = 'nearest'
+) -> tf.data.Dataset:
+    """Build a batched ``(images, one_hot_labels)`` dataset from a directory.
+
+    Images are scaled to [0, 1] like ``ImageDataGenerator(rescale=1./255)``.
+    Decoded images are cached as uint8 before augmentation, so every epoch
+    still sees fresh augmentations.
+
+    Args:
+        data_dir: Directory containing one sub-directory per class, or a
+            compiled dataset directory
+        img_size: Output image height and width
+        batch_size: Images per batch
+        validation_split: Fraction of each class held out for validation
+        subset: 'training' or 'validation' when ``validation_split`` is set
+        augment: Whether to apply random augmentation
+        shuffle: Whether to shuffle every epoch
+        seed: Seed for shuffling and augmentation, making runs repeatable
+        cache: True to cache decoded images in memory, a path to cache on
+            disk, False to decode every epoch
+        shuffle_buffer: Shuffle buffer size when shuffling cached images
+        interpolation: Resize method; 'nearest' matches ``flow_from_directory``
+
+    Returns:
+        Dataset yielding float32 images of shape (N, img_size, img_size, 3)
+        and one-hot float32 labels; its ``class_names`` and ``batch_size``
+        attributes give the classes in label order and the batch size
+    """
+    if is_compiled_dataset(data_dir):
+        return _create_compiled_dataset(
+            data_dir, img_size, batch_size, validation_split, subset, augment, shuffle, seed
+        )
+
+    paths, labels, class_names = list_split_files(data_dir, validation_split, subset)
+    if not paths:
+        raise ValueError(f"No images found in {data_dir}")
+
+    def load(path, label):
+        image = decode_image_file(path)
+        image = tf.image.resize(image, (img_size, img_size), method=interpolation)
+        image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+        return image, label
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if shuffle and not cache:
+        # Shuffling file names is cheap, so use a full buffer
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE, deterministic=True)
+    if cache:
+        dataset = dataset.cache('' if cache is True else str(cache))
+        if shuffle:
+            dataset = dataset.shuffle(
+                min(len(paths), shuffle_buffer), seed=seed, reshuffle_each_iteration=True
+            )
+
+    dataset = dataset.batch(batch_size, num_parallel_calls=AUTOTUNE, deterministic=True)
+    return _finish(dataset, class_names, batch_size, augment, seed)
+
+
+def _create_compiled_dataset(
+    data_dir: str,
+    img_size: int,
+    batch_size: int,
+    validation_split: Optional[float],
+    subset: Optional[str],
+    augment: bool,
+    shuffle: bool,
+    seed: int
+) -> tf.data.Dataset:
+    """Batches gathered from a compiled dataset's memory-mapped shards."""
+    compiled = CompiledDataset(data_dir)
+    if compiled.img_size != img_size:
+        raise ValueError(
+            f"{data_dir} was compiled at {compiled.img_size}px, but {img_size}px was requested"
+        )
+    indices = compiled.split_indices(validation_split, subset)
+    if not len(indices):
+        raise ValueError(f"No images found in {data_dir}")
+    logger.info(
+        f"Using {len(indices)} pre-decoded images belonging to "
+        f"{len(compiled.class_names)} classes from {data_dir}"
+    )
+
+    def gather(batch_indices):
+        batch_indices = np.asarray(batch_indices)
+        return compiled.gather(batch_indices), compiled.labels[batch_indices]
+
+    def load(batch_indices):
+        images, labels = tf.numpy_function(gather, [batch_indices], [tf.uint8, tf.int32])
+        images.set_shape((None, img_size, img_size, 3))
+        labels.set_shape((None,))
+        return images, labels
+
+    # Shuffle indices, not images: a full-size buffer costs 8 bytes per image
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE, deterministic=True)
+    return _finish(dataset, compiled.class_names, batch_size, augment, seed)
+
+
+def _finish(
+    dataset: tf.data.Dataset,
+    class_names: List[str],
+    batch_size: int,
+    augment: bool,
+    seed: int
+) -> tf.data.Dataset:
+    """Scale, augment and one-hot encode uint8 batches, then prefetch."""
+    num_classes = len(class_names)
+    augmenter = BatchAugmenter() if augment else None
+
+    def finish(images, labels, batch_seed=None):
+        images = tf.cast(images, tf.float32) * (1.0 / 255.0)
+        if augmenter is not None:
+            images = augmenter(images, seed=batch_seed)
+        return images, tf.one_hot(labels, num_classes)
+
+    if augmenter is not None:
+        # A seed per batch from a seeded stream keeps augmentation repeatable
+        # under parallel map, while each epoch still draws new seeds
+        seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True)
+        seeds = seeds.batch(2).map(lambda pair: tf.cast(pair, tf.int32))
+        dataset = tf.data.Dataset.zip((dataset, seeds)).map(
+            lambda batch, batch_seed: finish(*batch, batch_seed),
+            num_parallel_calls=AUTOTUNE,
+            deterministic=True
+        )
+    else:
+        dataset = dataset.map(finish, num_parallel_calls=AUTOTUNE, deterministic=True)
+    dataset = dataset.prefetch(AUTOTUNE)
+    dataset.class_names = class_names
+    dataset.batch_size = batch_size
+    return dataset
+
+
+def benchmark(
+    dataset: tf.data.Dataset,
+    num_batches: int = 100,
+    warmup_batches: int = 5
+) -> Dict[str, Any]:
+    """Measure how fast a dataset produces batches without a model attached.
+
+    If this is well above the training step rate, training is compute-bound;
+    if it is close to or below it, training is waiting on input.
+
+    Args:
+        dataset: Batched dataset (repeated internally if it runs out)
+        num_batches: Batches to time
+        warmup_batches: Batches consumed before timing starts
+
+    Returns:
+        Images/sec, batches/sec and elapsed time
+    """
+    iterator = iter(dataset.repeat())
+    for _ in range(warmup_batches):
+        next(iterator)
+
+    images = 0
+    start = time.perf_counter()
+    for _ in range(num_batches):
+        batch, _ = next(iterator)
+        images += int(batch.shape[0])
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'batches': num_batches,
+        'images': images,
+        'seconds': elapsed,
+        'images_per_second': images / elapsed,
+        'batches_per_second': num_batches / elapsed
+    }
+    logger.info(
+        f"Input pipeline: {result['images_per_second']:.1f} images/s "
+        f"({result['batches_per_second']:.2f} batches/s)"
+    )
+    return result
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 input pipeline")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bench = subparsers.add_parser('benchmark', help="Measure input images/sec")
+    bench.add_argument('data_dir', nargs='?', default='data/train')
+    bench.add_argument('--img-size', type=int, default=224)
+    bench.add_argument('--batch-size', type=int, default=32)
+    bench.add_argument('--batches', type=int, default=100)
+    bench.add_argument('--augment', action='store_true')
+    bench.add_argument('--cache', action='store_true', help="Cache decoded images in memory")
+
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        dataset = create_dataset(
+            args.data_dir,
+            img_size=args.img_size,
+            batch_size=args.batch_size,
+            augment=args.augment,
+            shuffle=True,
+            cache=args.cache
+        )
+        benchmark(dataset, num_batches=args.batches)
+
+
+if __name__ == "__main__":
+    main()
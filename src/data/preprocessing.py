@@ -1 +1,321 @@
- 
\ No newline at end of file
+"""
+Data preprocessing utilities for RxVision25.
+
+Provides image decoding and batch normalization shared by the inference
+service and offline tools. Directory helpers follow ``flow_from_directory``:
+one sub-directory per class under a split directory (e.g.
+``data/val/<ndc>/<image>.jpg``), with class indices assigned in sorted order
+of the sub-directory names.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import io
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# File extensions accepted by flow_from_directory
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+
+# ImageNet normalization used by the inference service
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+ImageInput = Union[str, Path, bytes, np.ndarray, Image.Image]
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds the configured byte or pixel limits."""
+
+
+def _open(image: ImageInput) -> Image.Image:
+    """Open an image without decoding pixel data where possible."""
+    try:
+        if isinstance(image, (str, Path)):
+            return Image.open(image)
+        if isinstance(image, bytes):
+            return Image.open(io.BytesIO(image))
+    except Image.DecompressionBombError as e:
+        # PIL refuses images over twice Image.MAX_IMAGE_PIXELS before our own check runs
+        raise ImageTooLargeError(str(e)) from e
+    if isinstance(image, np.ndarray):
+        array = image
+        if array.dtype != np.uint8:
+            array = np.clip(array, 0, 255).astype(np.uint8)
+        if array.ndim == 3 and array.shape[-1] == 1:
+            array = array[..., 0]
+        return Image.fromarray(array)
+    return image
+
+
+def load_image(
+    image: ImageInput,
+    draft_size: Optional[Tuple[int, int]] = None,
+    max_pixels: Optional[int] = None
+) -> Image.Image:
+    """Load an image as 3-channel RGB.
+
+    Handles grayscale, palette and alpha images (alpha is composited onto a
+    white background) and applies the EXIF orientation of phone photos.
+    With ``draft_size``, JPEGs are decoded directly at the smallest DCT
+    scale (1/2, 1/4 or 1/8) that still covers the requested size, and other
+    formats are box-reduced by an integer factor after decoding.
+
+    Args:
+        image: File path, encoded bytes, uint8 array (HxW, HxWx1, HxWx3 or
+            HxWx4) or PIL Image
+        draft_size: Optional minimum (width, height) to decode at
+        max_pixels: Optional limit on the source image's pixel count,
+            checked from the header before any pixel data is decoded
+
+    Returns:
+        RGB PIL Image
+
+    Raises:
+        ImageTooLargeError: If the image has more than ``max_pixels`` pixels,
+            or is large enough for PIL to flag it as a decompression bomb
+    """
+    image = _open(image)
+
+    width, height = image.size
+    if max_pixels is not None and width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image of {width}x{height} pixels exceeds the limit of {max_pixels} pixels"
+        )
+
+    if draft_size is not None:
+        # No-op for non-JPEG or already decoded images
+        image.draft('RGB', draft_size)
+        factor = min(image.size[0] // draft_size[0], image.size[1] // draft_size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode == 'RGB':
+        return image
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La'):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    if image.mode.startswith('I') or image.mode == 'F':
+        # 16/32-bit grayscale: rescale to 8 bits before expanding to RGB
+        array = np.asarray(image, dtype=np.float32)
+        peak = array.max() if array.size else 0.0
+        array = array * (255.0 / peak) if peak > 255.0 else array
+        image = Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+    return image.convert('RGB')
+
+
+def decode_image(
+    data: bytes,
+    target_size: Tuple[int, int] = (224, 224),
+    max_bytes: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+    measure_full_decode: bool = False
+) -> Tuple[Image.Image, Dict[str, Any]]:
+    """Decode an uploaded image near the model's input resolution.
+
+    Args:
+        data: Encoded image bytes
+        target_size: Model input size (height, width)
+        max_bytes: Optional limit on the encoded size
+        max_pixels: Optional limit on the source pixel count
+        measure_full_decode: Also time a full-resolution decode of the same
+            bytes, as a baseline for the time saved by reduced decoding
+
+    Returns:
+        Tuple of (RGB image, decode info). The info holds the source and
+        decoded sizes, the decode time and, if requested, the full-resolution
+        decode time.
+
+    Raises:
+        ImageTooLargeError: If the upload exceeds ``max_bytes`` or ``max_pixels``
+    """
+    if max_bytes is not None and len(data) > max_bytes:
+        raise ImageTooLargeError(
+            f"Upload of {len(data)} bytes exceeds the limit of {max_bytes} bytes"
+        )
+
+    start = time.perf_counter()
+    image = _open(data)
+    source_size = image.size
+    height, width = target_size
+    image = load_image(image, draft_size=(width, height), max_pixels=max_pixels)
+    image.load()
+
+    info = {
+        'source_size': source_size,
+        'decoded_size': image.size,
+        'decode_seconds': time.perf_counter() - start
+    }
+
+    if measure_full_decode:
+        start = time.perf_counter()
+        _open(data).load()
+        info['full_decode_seconds'] = time.perf_counter() - start
+
+    return image, info
+
+
+class BatchPreprocessor:
+    """Decodes, resizes and normalizes batches of images into float32 tensors.
+
+    Images are decoded and resized on a thread pool and written straight into
+    a preallocated ``(N, H, W, 3)`` float32 buffer, then normalized in place
+    with a single fused scale-and-offset, ``x * (1 / (255 * std)) - mean / std``.
+    The buffer is reused per thread, so the array returned by ``__call__`` is
+    only valid until the same thread calls it again; pass ``out`` to keep it.
+    """
+
+    def __init__(
+        self,
+        target_size: Tuple[int, int] = (224, 224),
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD,
+        num_workers: Optional[int] = None,
+        resample: int = Image.BICUBIC,
+        max_pixels: Optional[int] = None
+    ):
+        """Initialize the preprocessor.
+
+        Args:
+            target_size: Output image size (height, width)
+            mean: Per-channel mean in [0, 1] units
+            std: Per-channel standard deviation in [0, 1] units
+            num_workers: Decode threads, defaults to min(8, CPU count)
+            resample: PIL resampling filter (bicubic, as in ``Image.resize``)
+            max_pixels: Optional limit on source image pixel counts
+        """
+        self.target_size = tuple(target_size)
+        self.resample = resample
+        self.max_pixels = max_pixels
+        self.num_workers = num_workers or min(8, os.cpu_count() or 1)
+
+        # Fold /255, -mean and /std into one float32 multiply-add
+        std = np.asarray(std, dtype=np.float32)
+        self._scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self._offset = (-np.asarray(mean, dtype=np.float32) / std).astype(np.float32)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the decode thread pool on first use."""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.num_workers,
+                        thread_name_prefix='rxvision-preprocess'
+                    )
+        return self._executor
+
+    def _buffer(self, n: int) -> np.ndarray:
+        """Return this thread's reusable buffer, grown to hold ``n`` images."""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < n:
+            height, width = self.target_size
+            buffer = np.empty((n, height, width, 3), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:n]
+
+    def _load_into(self, image: ImageInput, out: np.ndarray) -> None:
+        """Decode, resize and normalize one image into ``out``."""
+        height, width = self.target_size
+        image = load_image(image, draft_size=(width, height), max_pixels=self.max_pixels)
+        if image.size != (width, height):
+            image = image.resize((width, height), self.resample)
+
+        # uint8 -> float32 conversion happens during the copy into the buffer
+        out[...] = np.asarray(image)
+        np.multiply(out, self._scale, out=out)
+        np.add(out, self._offset, out=out)
+
+    def _try_load_into(self, image: ImageInput, out: np.ndarray) -> Optional[Exception]:
+        """Like ``_load_into`` but return the error instead of raising."""
+        try:
+            self._load_into(image, out)
+        except Exception as e:
+            out[...] = 0.0
+            return e
+        return None
+
+    def __call__(
+        self,
+        images: Sequence[ImageInput],
+        out: Optional[np.ndarray] = None,
+        errors: Optional[List[Optional[Exception]]] = None
+    ) -> np.ndarray:
+        """Preprocess a batch of images.
+
+        Args:
+            images: Images to preprocess
+            out: Optional float32 array of shape (N, H, W, 3) to write into;
+                defaults to the calling thread's reusable buffer
+            errors: Optional list that receives one entry per image, the
+                exception that image raised or None. When given, failed
+                images are zero-filled instead of failing the whole batch.
+
+        Returns:
+            Normalized float32 array of shape (N, H, W, 3)
+        """
+        n = len(images)
+        batch = out if out is not None else self._buffer(n)
+        load = self._load_into if errors is None else self._try_load_into
+
+        if n == 1 or self.num_workers == 1:
+            results = [load(image, batch[i]) for i, image in enumerate(images)]
+        else:
+            # Consume the iterator so worker exceptions propagate
+            results = list(self._get_executor().map(load, images, batch))
+
+        if errors is not None:
+            errors[:] = results
+        return batch
+
+    def close(self) -> None:
+        """Shut down the decode thread pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def list_labeled_images(data_dir: str) -> Tuple[List[Path], List[int], List[str]]:
+    """List images and class indices in a class-per-directory split.
+
+    Args:
+        data_dir: Split directory containing one sub-directory per class
+
+    Returns:
+        Tuple of (image paths, class indices, class names), with paths in
+        sorted order within each class
+    """
+    data_dir = Path(data_dir)
+    if not data_dir.exists():
+        raise FileNotFoundError(f"Data directory not found: {data_dir}")
+
+    class_names = sorted(p.name for p in data_dir.iterdir() if p.is_dir())
+    paths, labels = [], []
+    for idx, class_name in enumerate(class_names):
+        for path in sorted((data_dir / class_name).rglob('*')):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                paths.append(path)
+                labels.append(idx)
+
+    logger.info(f"Found {len(paths)} images in {len(class_names)} classes under {data_dir}")
+    return paths, labels, class_names
@@ -0,0 +1,202 @@
+"""
+Dynamic micro-batching for RxVision25 inference.
+
+Concurrent requests are collected into a single batch until either the
+maximum batch size is reached or the oldest request has waited for the
+maximum wait time. The batch is then run through one forward pass and each
+caller receives its own result through a future.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from .executor import OverloadedError
+from .metrics import LatencyTracker, SizeHistogram
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _PendingItem:
+    """A submitted item waiting in the batching queue."""
+
+    __slots__ = ('item', 'future', 'enqueued_at')
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Groups concurrent requests into batches for a single forward pass."""
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue_size: Optional[int] = None,
+        name: str = 'rxvision-batcher'
+    ):
+        """Initialize the batcher.
+
+        Args:
+            process_batch: Function mapping a list of items to a list of
+                results of the same length and order
+            max_batch_size: Maximum number of items per forward pass
+            max_wait_ms: Maximum time the oldest item waits for a batch to fill
+            max_queue_size: Items allowed to wait before new submissions are
+                shed with ``OverloadedError`` (None = unbounded)
+            name: Name of the background worker thread
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self.shed = 0
+
+        self._queue: 'queue.Queue[Any]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # Tuning metrics
+        self.batch_sizes = SizeHistogram()
+        self.queue_latency = LatencyTracker()
+        self.batch_latency = LatencyTracker()
+
+    def start(self) -> None:
+        """Start the background batching thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Started micro-batcher (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000.0:g})"
+        )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the batching thread after the queued items are processed."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a future for its result.
+
+        Args:
+            item: Item passed to ``process_batch`` as part of a batch
+
+        Returns:
+            Future resolved with the item's result
+
+        Raises:
+            OverloadedError: If the queue already holds ``max_queue_size`` items
+        """
+        if self._thread is None:
+            raise RuntimeError("Batcher is not running")
+        if self.max_queue_size is not None and self._queue.qsize() >= self.max_queue_size:
+            self.shed += 1
+            raise OverloadedError(f"Batching queue full ({self.max_queue_size} items)")
+        pending = _PendingItem(item)
+        self._queue.put(pending)
+        return pending.future
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of items waiting to be batched."""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, shed count, batch size histogram and queueing latency."""
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue_size': self.max_queue_size,
+            'shed': self.shed,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batch_sizes': self.batch_sizes.snapshot(),
+            'queue_latency': self.queue_latency.snapshot(),
+            'batch_latency': self.batch_latency.snapshot()
+        }
+
+    def _collect(self, first: _PendingItem) -> List[Any]:
+        """Collect a batch starting from ``first``.
+
+        Returns:
+            Pending items to process, possibly followed by the stop sentinel
+        """
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    pending = self._queue.get(timeout=remaining)
+                else:
+                    pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(pending)
+            if pending is _STOP:
+                break
+
+        return batch
+
+    def _run(self) -> None:
+        """Worker loop: collect batches and dispatch them."""
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = self._collect(first)
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+
+            self._dispatch(batch)
+            if stop:
+                break
+
+    def _dispatch(self, batch: List[_PendingItem]) -> None:
+        """Run one forward pass for ``batch`` and resolve its futures."""
+        # Callers that gave up (e.g. a disconnected client) are dropped here;
+        # resolving a cancelled future would raise and stop the worker
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        start = time.perf_counter()
+        for pending in batch:
+            self.queue_latency.observe(start - pending.enqueued_at)
+        self.batch_sizes.observe(len(batch))
+
+        try:
+            results = self.process_batch([pending.item for pending in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"Batch function returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(batch)}: {e}")
+            for pending in batch:
+                pending.future.set_exception(e)
+        else:
+            for pending, result in zip(batch, results):
+                pending.future.set_result(result)
+        finally:
+            self.batch_latency.observe(time.perf_counter() - start)
@@ -0,0 +1,377 @@
+"""
+Content-addressed prediction cache for RxVision25.
+
+Results are keyed by a hash of the image bytes, the model namespace (version
+plus a fingerprint of the model artifact) and ``return_top_k``. Several
+model versions can be served side by side, each under its own namespace. The memory
+tier is a bounded LRU with a TTL; an optional disk tier keeps results across
+restarts. Concurrent requests for the same key share one in-flight
+computation instead of each running the model. From async code, disk reads
+and writes run on worker threads, and pruning the disk tier runs on a
+background thread, so the event loop never waits on the filesystem.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _to_json(value: Any) -> Any:
+    """Serialize array values (e.g. numpy top-k results) for the disk tier."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Cannot store {type(value).__name__} in the disk cache")
+
+
+def file_fingerprint(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return a short content hash of a model file or directory."""
+    path = Path(path)
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(str(file.relative_to(path) if path.is_dir() else file.name).encode())
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """Bounded LRU + TTL cache of prediction results with request coalescing."""
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600.0,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 100000
+    ):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of results kept in memory
+            ttl_seconds: Time after which a result is no longer served
+            disk_dir: Optional directory for a restart-surviving disk tier
+            disk_max_entries: Maximum number of results kept on disk
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = disk_max_entries
+        self.namespace = ''
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._disk_count = 0
+        self._pruning = False
+
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def set_namespace(self, namespace: str) -> None:
+        """Switch to a new model namespace, invalidating results of other models.
+
+        Args:
+            namespace: Identifier of the serving model, e.g. version plus
+                artifact fingerprint
+        """
+        with self._lock:
+            if namespace == self.namespace:
+                return
+            self.namespace = namespace
+            self._entries.clear()
+
+        if self.disk_dir is not None:
+            self._disk_namespace_dir().mkdir(parents=True, exist_ok=True)
+            for stale in self.disk_dir.iterdir():
+                if stale.is_dir() and stale != self._disk_namespace_dir():
+                    shutil.rmtree(stale, ignore_errors=True)
+            count = sum(1 for _ in self._disk_namespace_dir().rglob('*.json'))
+            with self._lock:
+                self._disk_count = count
+
+        logger.info(f"Prediction cache namespace set to {namespace}")
+
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """Drop every cached result, or only those of one namespace.
+
+        Args:
+            namespace: Namespace to drop, e.g. of an unloaded model version;
+                all results when omitted
+        """
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                prefix = f"{namespace}:"
+                for key in [key for key in self._entries if key.startswith(prefix)]:
+                    del self._entries[key]
+        if self.disk_dir is None:
+            return
+        if namespace is None:
+            for stale in self.disk_dir.iterdir():
+                if stale.is_dir():
+                    shutil.rmtree(stale, ignore_errors=True)
+        else:
+            shutil.rmtree(self._disk_namespace_dir(namespace), ignore_errors=True)
+        count = sum(1 for _ in self.disk_dir.rglob('*.json'))
+        with self._lock:
+            self._disk_count = count
+
+    def make_key(self, data: bytes, return_top_k: int, namespace: Optional[str] = None) -> str:
+        """Build the cache key for an image and request options.
+
+        Args:
+            data: Encoded image
+            return_top_k: Number of predictions requested
+            namespace: Model namespace, defaults to the current one
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        namespace = self.namespace if namespace is None else namespace
+        return f"{namespace}:{digest}:{return_top_k}"
+
+    def get(self, key: str) -> Any:
+        """Return a cached value, or ``None`` if absent or expired."""
+        value = self._get_memory(key)
+        if value is _MISSING:
+            value = self._get_disk(key)
+        if value is _MISSING:
+            with self._lock:
+                self.misses += 1
+            return None
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a value in the memory tier and, if enabled, on disk."""
+        self._put_memory(key, value)
+        self._put_disk(key, value)
+
+    async def aget(self, key: str) -> Any:
+        """Like ``get``, reading the disk tier on a worker thread."""
+        value = self._get_memory(key)
+        if value is _MISSING and self.disk_dir is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+            if value is not _MISSING:
+                self._put_memory(key, value)
+        if value is _MISSING:
+            with self._lock:
+                self.misses += 1
+            return None
+        return value
+
+    async def aput(self, key: str, value: Any) -> None:
+        """Like ``put``, writing the disk tier on a worker thread."""
+        self._put_memory(key, value)
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._put_disk, key, value)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Return the cached value for ``key`` or compute it once.
+
+        Concurrent callers with the same key share one computation. It runs
+        in its own task, so a caller that is cancelled stops waiting without
+        cancelling the work the others are waiting for.
+
+        Args:
+            key: Cache key from ``make_key``
+            compute: Coroutine function producing the value on a miss
+
+        Returns:
+            Cached or freshly computed value
+        """
+        with self._lock:
+            value = self._lookup_locked(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._fill(key, compute))
+                task.add_done_callback(lambda done: self._finish_inflight(key, done))
+                self._inflight[key] = task
+            else:
+                self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Read ``key`` from disk or compute it, storing the result."""
+        value = _MISSING
+        if self.disk_dir is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is _MISSING:
+            with self._lock:
+                self.misses += 1
+            value = await compute()
+            await self.aput(key, value)
+        else:
+            self._put_memory(key, value)
+        return value
+
+    def _finish_inflight(self, key: str, task: asyncio.Task) -> None:
+        """Forget a finished computation."""
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        # Every waiter may have been cancelled; retrieve the error so it is
+        # not reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit, miss and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'namespace': self.namespace,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk_entries': self._disk_count if self.disk_dir is not None else None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None,
+                'inflight': len(self._inflight)
+            }
+
+    def _lookup_locked(self, key: str) -> Any:
+        """Memory lookup; the caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _get_memory(self, key: str) -> Any:
+        with self._lock:
+            value = self._lookup_locked(key)
+            if value is not _MISSING:
+                self.hits += 1
+            return value
+
+    def _put_memory(self, key: str, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_namespace_dir(self, namespace: Optional[str] = None) -> Path:
+        namespace = self.namespace if namespace is None else namespace
+        name = hashlib.sha256(namespace.encode()).hexdigest()[:16]
+        return self.disk_dir / name
+
+    def _disk_path(self, key: str) -> Path:
+        name = hashlib.sha256(key.encode()).hexdigest()
+        namespace = key.rsplit(':', 2)[0]
+        return self._disk_namespace_dir(namespace) / name[:2] / f"{name}.json"
+
+    def _get_disk(self, key: str) -> Any:
+        if self.disk_dir is None:
+            return _MISSING
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+
+        if record['created'] + self.ttl_seconds < time.time():
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.expirations += 1
+            return _MISSING
+
+        with self._lock:
+            self.disk_hits += 1
+        return record['value']
+
+    def _put_disk(self, key: str, value: Any) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'created': time.time(), 'value': value}, f, default=_to_json)
+            tmp_path.replace(path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not write cache entry to disk: {e}")
+            return
+
+        with self._lock:
+            self._disk_count += 1
+            prune = self._disk_count > self.disk_max_entries and not self._pruning
+            if prune:
+                self._pruning = True
+        if prune:
+            # Scanning up to disk_max_entries files is slow; never do it inline
+            threading.Thread(
+                target=self._prune_disk, name='rxvision-cache-prune', daemon=True
+            ).start()
+
+    def _prune_disk(self) -> None:
+        """Remove the oldest tenth of the disk tier (runs on its own thread).
+
+        Repeats while writes made during a pass keep the tier over its limit.
+        """
+        try:
+            while True:
+                files = []
+                for path in self.disk_dir.rglob('*.json'):
+                    try:
+                        files.append((path.stat().st_mtime, path))
+                    except OSError:
+                        continue
+                files.sort()
+                excess = max(0, len(files) - int(self.disk_max_entries * 0.9))
+                for _, path in files[:excess]:
+                    path.unlink(missing_ok=True)
+                with self._lock:
+                    # Entries written during the scan stay counted
+                    self._disk_count = max(0, self._disk_count - excess)
+                    self.evictions += excess
+                    if self._disk_count <= self.disk_max_entries:
+                        self._pruning = False
+                        return
+        except Exception as e:
+            logger.warning(f"Could not prune the disk cache: {e}")
+            with self._lock:
+                self._pruning = False
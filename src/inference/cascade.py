@@ -0,0 +1,393 @@
+"""
+Confidence-gated model cascade for RxVision25.
+
+A lightweight screening model classifies every image. Only images whose
+top-1 probability is below ``min_confidence``, or whose top-1/top-2 margin
+is below ``min_margin``, go on to the heavy model. They go in one batch per
+incoming batch, and the heavy model's probabilities replace the screening
+result. ``CascadeBackend`` implements the ``InferenceBackend`` interface,
+so ``RxPredictor`` and the service use it like any single model.
+
+The ``calibrate`` command runs both models over a labeled validation split
+and picks the loosest threshold that still reaches a target accuracy.
+
+Usage:
+    python -m src.inference.cascade calibrate models/screen.onnx models/best_model.h5 \\
+        --val-dir data/val --target-accuracy 0.97
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data.preprocessing import list_labeled_images
+
+from .metrics import LatencyTracker
+from .model_loader import InferenceBackend
+from .predictor import RxPredictor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CRITERIA = ('confidence', 'margin')
+
+
+def confidence_scores(probabilities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-1 probability and top-1/top-2 margin of every row."""
+    probabilities = np.asarray(probabilities)
+    if probabilities.shape[-1] < 2:
+        top1 = probabilities[:, 0]
+        return top1, top1
+    top2 = np.partition(probabilities, -2, axis=-1)[:, -2:]
+    return top2[:, 1], top2[:, 1] - top2[:, 0]
+
+
+def needs_escalation(
+    probabilities: np.ndarray,
+    min_confidence: float = 0.9,
+    min_margin: float = 0.0
+) -> np.ndarray:
+    """Boolean mask of rows the screening model is not confident about."""
+    confidence, margin = confidence_scores(probabilities)
+    return (confidence < min_confidence) | (margin < min_margin)
+
+
+def _num_classes(backend: InferenceBackend) -> int:
+    """Number of classes a backend scores, from one blank image."""
+    probabilities = backend.predict(np.zeros((1,) + tuple(backend.input_shape), dtype=np.float32))
+    return int(np.shape(probabilities)[-1])
+
+
+class CascadeBackend(InferenceBackend):
+    """Screens every batch with a fast model and escalates uncertain images."""
+
+    name = 'cascade'
+
+    def __init__(
+        self,
+        fast: InferenceBackend,
+        heavy: InferenceBackend,
+        min_confidence: float = 0.9,
+        min_margin: float = 0.0
+    ):
+        """Initialize the cascade.
+
+        Args:
+            fast: Screening model, run on every image
+            heavy: High-accuracy model, run on escalated images only
+            min_confidence: Escalate when the screening top-1 probability
+                is below this
+            min_margin: Escalate when the screening top-1/top-2 margin is
+                below this
+
+        Raises:
+            ValueError: If the models differ in input shape or class count
+        """
+        if tuple(fast.input_shape) != tuple(heavy.input_shape):
+            raise ValueError(
+                f"Cascade models need the same input shape, got "
+                f"{fast.input_shape} and {heavy.input_shape}"
+            )
+        # Heavy probabilities overwrite screening rows, so both must score the same classes
+        fast_classes = _num_classes(fast)
+        heavy_classes = _num_classes(heavy)
+        if fast_classes != heavy_classes:
+            raise ValueError(
+                f"Cascade models need the same classes, got {fast_classes} from the "
+                f"screening model and {heavy_classes} from the heavy model"
+            )
+        super().__init__(heavy.model_path, heavy.input_shape)
+        self.num_classes = heavy_classes
+        self.fast = fast
+        self.heavy = heavy
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.import_seconds = fast.import_seconds + heavy.import_seconds
+        self.load_seconds = fast.load_seconds + heavy.load_seconds
+
+        # Per-image forward cost of each model, for the latency saved estimate
+        self.fast_latency = LatencyTracker()
+        self.heavy_latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+        self.seconds_saved = 0.0
+        self._heavy_seconds_per_image: Optional[float] = None
+
+    @property
+    def keras_model(self):
+        """The heavy model, which explanations describe."""
+        return self.heavy.keras_model
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        start = time.perf_counter()
+        probabilities = self.fast.predict(batch)
+        fast_seconds = time.perf_counter() - start
+
+        escalate = needs_escalation(probabilities, self.min_confidence, self.min_margin)
+        escalated = int(escalate.sum())
+        heavy_seconds = 0.0
+        if escalated:
+            start = time.perf_counter()
+            heavy_probabilities = self.heavy.predict(np.ascontiguousarray(batch[escalate]))
+            heavy_seconds = time.perf_counter() - start
+            probabilities = np.array(probabilities, copy=True)
+            probabilities[escalate] = heavy_probabilities
+
+        n = len(batch)
+        self.fast_latency.observe(fast_seconds / n)
+        if escalated:
+            self.heavy_latency.observe(heavy_seconds / escalated)
+        with self._lock:
+            if escalated:
+                per_image = heavy_seconds / escalated
+                self._heavy_seconds_per_image = (
+                    per_image if self._heavy_seconds_per_image is None
+                    else 0.9 * self._heavy_seconds_per_image + 0.1 * per_image
+                )
+            self.images += n
+            self.escalated += escalated
+            # Compared with running the heavy model on the whole batch
+            if self._heavy_seconds_per_image is not None:
+                self.seconds_saved += (
+                    self._heavy_seconds_per_image * n - fast_seconds - heavy_seconds
+                )
+        return probabilities
+
+    def warmup(self) -> None:
+        self.fast.warmup()
+        self.heavy.warmup()
+        # Seed the heavy model's per-image cost for the savings estimate
+        sample = np.zeros((1,) + self.input_shape, dtype=np.float32)
+        start = time.perf_counter()
+        self.heavy.predict(sample)
+        with self._lock:
+            self._heavy_seconds_per_image = time.perf_counter() - start
+
+    def escalation_rate(self) -> Optional[float]:
+        """Fraction of images sent on to the heavy model so far."""
+        with self._lock:
+            return self.escalated / self.images if self.images else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return thresholds, escalation rate, per-model latency and time saved."""
+        with self._lock:
+            images, escalated, saved = self.images, self.escalated, self.seconds_saved
+        return {
+            'fast_backend': self.fast.name,
+            'heavy_backend': self.heavy.name,
+            'min_confidence': self.min_confidence,
+            'min_margin': self.min_margin,
+            'images': images,
+            'escalated': escalated,
+            'escalation_rate': escalated / images if images else None,
+            'fast_latency_per_image': self.fast_latency.snapshot(),
+            'heavy_latency_per_image': self.heavy_latency.snapshot(),
+            'estimated_seconds_saved': saved
+        }
+
+    def close(self) -> None:
+        self.fast.close()
+        self.heavy.close()
+
+
+def _predict_split(
+    predictor: RxPredictor,
+    paths: Sequence[Path],
+    batch_size: int
+) -> Tuple[np.ndarray, float]:
+    """Class probabilities for ``paths`` and the mean forward seconds per image."""
+    outputs, forward_seconds = [], 0.0
+    for start in range(0, len(paths), batch_size):
+        batch = predictor.preprocess_batch(paths[start:start + batch_size])
+        begin = time.perf_counter()
+        outputs.append(predictor.backend.predict(batch))
+        forward_seconds += time.perf_counter() - begin
+    return np.concatenate(outputs), forward_seconds / len(paths)
+
+
+def choose_threshold(
+    scores: np.ndarray,
+    fast_correct: np.ndarray,
+    heavy_correct: np.ndarray,
+    target_accuracy: float
+) -> Dict[str, Any]:
+    """Pick the lowest threshold whose cascade accuracy reaches the target.
+
+    Images scoring below the threshold are escalated. Every distinct score
+    is a candidate, so the result is exact for the given split.
+
+    Args:
+        scores: Screening confidence (or margin) per image
+        fast_correct: Whether the screening model is right per image
+        heavy_correct: Whether the heavy model is right per image
+        target_accuracy: Required cascade top-1 accuracy
+
+    Returns:
+        Threshold, resulting accuracy and escalation rate, and whether the
+        target was reached
+    """
+    order = np.argsort(scores, kind='stable')
+    scores = np.asarray(scores)[order]
+    fast_correct = np.asarray(fast_correct, dtype=np.int64)[order]
+    heavy_correct = np.asarray(heavy_correct, dtype=np.int64)[order]
+    n = len(scores)
+
+    # Escalating the i lowest-scoring images, for i = 0..n
+    heavy_part = np.concatenate([[0], np.cumsum(heavy_correct)])
+    fast_part = fast_correct.sum() - np.concatenate([[0], np.cumsum(fast_correct)])
+    accuracy = (heavy_part + fast_part) / n
+
+    # A threshold can only separate distinct scores
+    thresholds = np.concatenate([scores, [np.nextafter(scores[-1], np.inf)]])
+    valid = np.ones(n + 1, dtype=bool)
+    valid[1:n] = scores[1:] > scores[:-1]
+
+    reached = valid & (accuracy >= target_accuracy)
+    if reached.any():
+        cut = int(np.argmax(reached))
+    else:
+        cut = int(np.flatnonzero(valid)[np.argmax(accuracy[valid])])
+    return {
+        'threshold': float(thresholds[cut]),
+        'accuracy': float(accuracy[cut]),
+        'escalation_rate': cut / n,
+        'target_reached': bool(reached.any())
+    }
+
+
+def calibrate(
+    fast_model_path: str,
+    heavy_model_path: str,
+    val_dir: str = 'data/val',
+    target_accuracy: float = 0.97,
+    criterion: str = 'confidence',
+    target_size: Tuple[int, int] = (224, 224),
+    batch_size: int = 32,
+    output_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """Choose the cascade threshold on a labeled split.
+
+    Args:
+        fast_model_path: Screening model
+        heavy_model_path: High-accuracy model
+        val_dir: Class-per-directory validation split
+        target_accuracy: Required cascade top-1 accuracy
+        criterion: 'confidence' (top-1 probability) or 'margin' (top-1
+            minus top-2)
+        target_size: Model input size
+        batch_size: Evaluation batch size
+        output_path: JSON report path, defaults to ``cascade.json`` next to
+            the heavy model
+
+    Returns:
+        Report with the chosen threshold, accuracies, escalation rate and
+        the expected per-image latency
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown criterion '{criterion}', expected one of {CRITERIA}")
+
+    paths, labels, _ = list_labeled_images(val_dir)
+    if not paths:
+        raise ValueError(f"No labeled images found under {val_dir}")
+    labels = np.asarray(labels)
+
+    fast = RxPredictor(fast_model_path, target_size=target_size, batch_size=batch_size)
+    heavy = RxPredictor(heavy_model_path, target_size=target_size, batch_size=batch_size)
+    fast_probs, fast_seconds = _predict_split(fast, paths, batch_size)
+    heavy_probs, heavy_seconds = _predict_split(heavy, paths, batch_size)
+    fast.backend.close()
+    heavy.backend.close()
+
+    fast_correct = fast_probs.argmax(axis=1) == labels
+    heavy_correct = heavy_probs.argmax(axis=1) == labels
+    confidence, margin = confidence_scores(fast_probs)
+    choice = choose_threshold(
+        confidence if criterion == 'confidence' else margin,
+        fast_correct,
+        heavy_correct,
+        target_accuracy
+    )
+
+    expected_seconds = fast_seconds + choice['escalation_rate'] * heavy_seconds
+    report = {
+        'fast_model_path': str(fast_model_path),
+        'heavy_model_path': str(heavy_model_path),
+        'num_images': len(paths),
+        'criterion': criterion,
+        'target_accuracy': target_accuracy,
+        **choice,
+        'min_confidence': choice['threshold'] if criterion == 'confidence' else 0.0,
+        'min_margin': choice['threshold'] if criterion == 'margin' else 0.0,
+        'fast_accuracy': float(fast_correct.mean()),
+        'heavy_accuracy': float(heavy_correct.mean()),
+        'fast_ms_per_image': fast_seconds * 1000.0,
+        'heavy_ms_per_image': heavy_seconds * 1000.0,
+        'cascade_ms_per_image': expected_seconds * 1000.0,
+        'latency_speedup': heavy_seconds / expected_seconds if expected_seconds else None
+    }
+
+    output_path = Path(output_path or Path(heavy_model_path).with_name('cascade.json'))
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if not choice['target_reached']:
+        logger.warning(
+            f"Target accuracy {target_accuracy:.3f} is not reachable on {val_dir}; "
+            f"using the most accurate threshold instead"
+        )
+    logger.info(
+        f"{criterion} threshold {choice['threshold']:.4f}: accuracy {choice['accuracy']:.4f} "
+        f"(fast {report['fast_accuracy']:.4f}, heavy {report['heavy_accuracy']:.4f}), "
+        f"{choice['escalation_rate']:.1%} escalated, "
+        f"{report['cascade_ms_per_image']:.1f} vs {report['heavy_ms_per_image']:.1f} ms/image"
+    )
+    logger.info(
+        f"Serve with RXVISION_CASCADE_FAST_MODEL_PATH={fast_model_path} "
+        f"RXVISION_CASCADE_MIN_CONFIDENCE={report['min_confidence']:.6g} "
+        f"RXVISION_CASCADE_MIN_MARGIN={report['min_margin']:.6g}; report in {output_path}"
+    )
+    return report
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 model cascade tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    calibrate_parser = subparsers.add_parser(
+        'calibrate', help="Pick the escalation threshold on a validation split"
+    )
+    calibrate_parser.add_argument('fast_model', help="Screening model")
+    calibrate_parser.add_argument('heavy_model', help="High-accuracy model")
+    calibrate_parser.add_argument('--val-dir', default='data/val')
+    calibrate_parser.add_argument('--target-accuracy', type=float, default=0.97)
+    calibrate_parser.add_argument('--criterion', choices=CRITERIA, default='confidence')
+    calibrate_parser.add_argument('--img-size', type=int, default=224)
+    calibrate_parser.add_argument('--batch-size', type=int, default=32)
+    calibrate_parser.add_argument('--output', default=None,
+                                  help="Defaults to cascade.json next to the heavy model")
+
+    args = parser.parse_args()
+    if args.command == 'calibrate':
+        calibrate(
+            args.fast_model,
+            args.heavy_model,
+            val_dir=args.val_dir,
+            target_accuracy=args.target_accuracy,
+            criterion=args.criterion,
+            target_size=(args.img_size, args.img_size),
+            batch_size=args.batch_size,
+            output_path=args.output
+        )
+
+
+if __name__ == "__main__":
+    main()
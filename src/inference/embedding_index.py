@@ -0,0 +1,625 @@
+"""
+Embedding index for nearest-reference pill retrieval in RxVision25.
+
+The softmax head only knows the NDCs it was trained on. Retrieval instead
+compares an image's penultimate-layer embedding with stored embeddings of
+reference images, so a new pill is supported by adding its reference
+images to the index, without retraining.
+
+An index is a directory holding a memory-mapped float16 (or int8 with a
+per-row scale) matrix of L2-normalized embeddings, the label of every
+row, and ``index.json`` with the metadata. Rows are appended in place, so
+insertion is incremental. Exact search scans the matrix in blocks with one
+matrix product per block for a whole batch of queries. After
+``train_ivf``, an inverted file index searches only the ``nprobe`` closest
+of ``nlist`` k-means partitions, which is sub-linear in the index size.
+
+Usage:
+    python -m src.inference.embedding_index add data/references --index indexes/references
+    python -m src.inference.embedding_index train-ivf --index indexes/references --nlist 256
+    python -m src.inference.embedding_index search pill.jpg --index indexes/references
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data.preprocessing import list_labeled_images
+
+from .explain import feature_forward
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DTYPES = ('float16', 'int8')
+
+# Rows scored per matrix product in exact search, bounding temporary memory
+SEARCH_BLOCK_ROWS = 8192
+
+_META = 'index.json'
+_VECTORS = 'vectors.bin'
+_SCALES = 'scales.bin'
+_LABELS = 'labels.bin'
+_LISTS = 'lists.bin'
+_CENTROIDS = 'centroids.npy'
+
+
+class EmbeddingExtractor:
+    """Penultimate-layer embeddings and class probabilities in one forward pass."""
+
+    def __init__(self, model, input_shape: Tuple[int, ...]):
+        """Initialize the extractor.
+
+        Args:
+            model: Keras classifier whose last Dense layer is the softmax head
+            input_shape: Per-image input shape (H, W, C)
+
+        Raises:
+            ValueError: If the model has no layer feeding a Dense head, or the
+                extraction path does not reproduce the model's output
+        """
+        import tensorflow as tf
+
+        layers = [
+            layer for layer in model.layers
+            if not isinstance(layer, tf.keras.layers.InputLayer)
+        ]
+        heads = [i for i, layer in enumerate(layers) if isinstance(layer, tf.keras.layers.Dense)]
+        if not heads or heads[-1] == 0:
+            raise ValueError(f"Model {model.name} has no layer feeding a Dense head")
+        self.layer_name = layers[heads[-1] - 1].name
+        self.input_shape = tuple(input_shape)
+        forward = feature_forward(model, [layers[heads[-1] - 1]])
+
+        @tf.function(input_signature=[tf.TensorSpec((None,) + self.input_shape, tf.float32)])
+        def extract(images):
+            features, probabilities = forward(images)
+            features = tf.reshape(tf.cast(features, tf.float32), (tf.shape(images)[0], -1))
+            return tf.math.l2_normalize(features, axis=-1), tf.cast(probabilities, tf.float32)
+
+        self._extract = extract
+
+        # Trace now and check the path against the model itself
+        sample = np.random.default_rng(0).random((1,) + self.input_shape, dtype=np.float32)
+        embeddings, probabilities = self._extract(sample)
+        expected = np.asarray(model(sample, training=False), dtype=np.float32)
+        if not np.allclose(probabilities.numpy(), expected, atol=1e-4):
+            raise ValueError(
+                f"Cannot extract embeddings from {model.name}: running its layers in "
+                f"order does not reproduce its output"
+            )
+        self.dim = int(embeddings.shape[-1])
+        logger.info(f"Built {self.dim}-d embedding extractor on layer {self.layer_name}")
+
+    def __call__(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return L2-normalized embeddings (N, dim) and probabilities (N, num_classes)."""
+        embeddings, probabilities = self._extract(np.asarray(batch, dtype=np.float32))
+        return embeddings.numpy(), probabilities.numpy()
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[np.newaxis]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _merge_top_k(
+    rows: np.ndarray,
+    scores: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k best of each query's candidate rows, best first.
+
+    Equal scores are ordered by row, so the result does not depend on the
+    order the candidates were scored in.
+    """
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        rows = np.take_along_axis(rows, keep, axis=1)
+        scores = np.take_along_axis(scores, keep, axis=1)
+    order = np.lexsort((rows, -scores), axis=1)
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class EmbeddingIndex:
+    """Memory-mapped reference embeddings with exact and IVF top-k search."""
+
+    def __init__(self, directory: str, writable: bool = False):
+        """Open an index created with ``EmbeddingIndex.create``.
+
+        Args:
+            directory: Index directory
+            writable: Whether rows may be added or the IVF retrained
+        """
+        self.directory = Path(directory)
+        self.writable = writable
+        with open(self.directory / _META, 'r') as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.dtype = meta['dtype']
+        self.model_fingerprint = meta.get('model_fingerprint')
+        self.label_names: List[str] = meta['labels']
+        self._label_ids = {name: i for i, name in enumerate(self.label_names)}
+        self._count = meta['count']
+        self._capacity = meta['capacity']
+        self.nlist = meta.get('nlist', 0)
+
+        # Adds and remaps are serialized; searches use a snapshot of the arrays
+        self._lock = threading.Lock()
+        self._map_arrays()
+
+        self._centroids = None
+        self._list_rows: List[np.ndarray] = []
+        if self.nlist:
+            self._centroids = np.load(self.directory / _CENTROIDS)
+            self._build_lists(self._lists[:self._count])
+
+    @classmethod
+    def create(
+        cls,
+        directory: str,
+        dim: int,
+        dtype: str = 'float16',
+        model_fingerprint: Optional[str] = None,
+        capacity: int = 1024
+    ) -> 'EmbeddingIndex':
+        """Create an empty, writable index.
+
+        Args:
+            directory: New index directory
+            dim: Embedding dimension
+            dtype: 'float16', or 'int8' for half the size at a small loss
+                of precision
+            model_fingerprint: Fingerprint of the model whose embeddings
+                are stored, checked before serving retrievals
+            capacity: Initial number of rows allocated
+
+        Returns:
+            The opened index
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype '{dtype}', expected one of {DTYPES}")
+        directory = Path(directory)
+        if (directory / _META).exists():
+            raise ValueError(f"An index already exists at {directory}")
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_meta(directory, {
+            'dim': dim,
+            'dtype': dtype,
+            'model_fingerprint': model_fingerprint,
+            'count': 0,
+            'capacity': capacity,
+            'nlist': 0,
+            'labels': []
+        })
+        index = cls(directory, writable=True)
+        index._resize(capacity)
+        return index
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _map_arrays(self) -> None:
+        """(Re)map the row files at the current capacity."""
+        mode = 'r+' if self.writable else 'r'
+        shape = (self._capacity,)
+
+        def open_array(name, dtype, row_shape=()):
+            path = self.directory / name
+            if not path.exists():
+                return None
+            return np.memmap(path, dtype=dtype, mode=mode, shape=shape + row_shape)
+
+        self._vectors = open_array(_VECTORS, self.dtype, (self.dim,))
+        self._scales = open_array(_SCALES, np.float32) if self.dtype == 'int8' else None
+        self._labels = open_array(_LABELS, np.int32)
+        self._lists = open_array(_LISTS, np.int32) if self.nlist else None
+
+    def _resize(self, capacity: int) -> None:
+        """Grow the row files to ``capacity`` rows and remap them."""
+        sizes = {
+            _VECTORS: np.dtype(self.dtype).itemsize * self.dim,
+            _LABELS: 4
+        }
+        if self.dtype == 'int8':
+            sizes[_SCALES] = 4
+        if self.nlist:
+            sizes[_LISTS] = 4
+        for name, row_bytes in sizes.items():
+            with open(self.directory / name, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self._capacity = capacity
+        self._map_arrays()
+
+    def _save_meta(self) -> None:
+        for array in (self._vectors, self._scales, self._labels, self._lists):
+            if array is not None:
+                array.flush()
+        # Written last, so a crash mid-add leaves the previous rows intact
+        _write_meta(self.directory, {
+            'dim': self.dim,
+            'dtype': self.dtype,
+            'model_fingerprint': self.model_fingerprint,
+            'count': self._count,
+            'capacity': self._capacity,
+            'nlist': self.nlist,
+            'labels': self.label_names
+        })
+
+    def add(self, embeddings: np.ndarray, labels: Sequence[str]) -> int:
+        """Append reference embeddings, no retraining needed.
+
+        Args:
+            embeddings: Embeddings of shape (N, dim), normalized here
+            labels: Label (NDC) of each embedding
+
+        Returns:
+            Index size after the insertion
+        """
+        if not self.writable:
+            raise ValueError(f"Index at {self.directory} was opened read-only")
+        embeddings = _normalize(embeddings)
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {embeddings.shape[1]}-d")
+        if len(labels) != len(embeddings):
+            raise ValueError(f"Got {len(labels)} labels for {len(embeddings)} embeddings")
+
+        with self._lock:
+            start, stop = self._count, self._count + len(embeddings)
+            if stop > self._capacity:
+                self._resize(max(stop, 2 * self._capacity))
+
+            for label in labels:
+                if label not in self._label_ids:
+                    self._label_ids[label] = len(self.label_names)
+                    self.label_names.append(label)
+            self._labels[start:stop] = [self._label_ids[label] for label in labels]
+
+            if self.dtype == 'int8':
+                scales = np.abs(embeddings).max(axis=1) / 127.0
+                scales = np.maximum(scales, 1e-12).astype(np.float32)
+                self._vectors[start:stop] = np.round(embeddings / scales[:, np.newaxis])
+                self._scales[start:stop] = scales
+            else:
+                self._vectors[start:stop] = embeddings
+
+            if self.nlist:
+                lists = np.argmax(embeddings @ self._centroids.T, axis=1).astype(np.int32)
+                self._lists[start:stop] = lists
+                rows = [r.copy() for r in self._list_rows]
+                for list_id in np.unique(lists):
+                    new_rows = start + np.flatnonzero(lists == list_id)
+                    rows[list_id] = np.concatenate([rows[list_id], new_rows])
+                self._list_rows = rows
+
+            self._count = stop
+            self._save_meta()
+        return stop
+
+    def _block_scores(
+        self,
+        queries: np.ndarray,
+        vectors: np.ndarray,
+        scales: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """Cosine similarity of every query with a block of stored rows."""
+        scores = queries @ vectors.astype(np.float32).T
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k stored rows for a batch of query embeddings.
+
+        Args:
+            queries: Query embeddings of shape (Q, dim), normalized here
+            k: Rows returned per query
+            nprobe: IVF partitions searched per query; exact search when
+                None or when no IVF is trained
+
+        Returns:
+            Row indices (Q, k), -1 past the index size, and cosine scores
+        """
+        queries = _normalize(queries)
+        with self._lock:
+            count = self._count
+            vectors, scales = self._vectors, self._scales
+            list_rows, centroids = self._list_rows, self._centroids
+
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if count == 0:
+            return rows, scores
+
+        if nprobe and centroids is not None:
+            probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :nprobe]
+            # Group queries by probed partition so each partition is scored
+            # against all of its queries in one matmul
+            partitions = probes.ravel()
+            members = np.repeat(np.arange(len(queries)), probes.shape[1])
+            order = np.argsort(partitions, kind='stable')
+            partitions, members = partitions[order], members[order]
+            bounds = np.flatnonzero(np.diff(partitions)) + 1
+            for partition, group in zip(partitions[np.r_[0, bounds]], np.split(members, bounds)):
+                candidates = list_rows[partition]
+                if not len(candidates):
+                    continue
+                block = self._block_scores(
+                    queries[group],
+                    vectors[candidates],
+                    scales[candidates] if scales is not None else None
+                )
+                rows[group], scores[group] = _merge_top_k(
+                    np.concatenate([rows[group], np.broadcast_to(candidates, block.shape)], axis=1),
+                    np.concatenate([scores[group], block], axis=1),
+                    k
+                )
+            return rows, scores
+
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, count)
+            block = self._block_scores(
+                queries,
+                vectors[start:stop],
+                scales[start:stop] if scales is not None else None
+            )
+            block_rows = np.broadcast_to(np.arange(start, stop), block.shape)
+            rows, scores = _merge_top_k(
+                np.concatenate([rows, block_rows], axis=1),
+                np.concatenate([scores, block], axis=1),
+                k
+            )
+        return rows, scores
+
+    def nearest_labels(
+        self,
+        queries: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        candidates: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """The k most similar distinct labels per query.
+
+        A label scores as its most similar reference image.
+
+        Args:
+            queries: Query embeddings of shape (Q, dim)
+            k: Labels returned per query
+            nprobe: IVF partitions searched per query
+            candidates: Rows searched before merging labels, defaults to 16k
+
+        Returns:
+            Per query, dicts of 'label', 'score' and 'reference' (row)
+        """
+        rows, scores = self.search(queries, candidates or 16 * k, nprobe=nprobe)
+        labels = np.asarray(self._labels[np.maximum(rows, 0)])
+        results = []
+        for q in range(len(rows)):
+            seen, neighbors = set(), []
+            for row, score, label in zip(rows[q], scores[q], labels[q]):
+                if row < 0 or label in seen:
+                    continue
+                seen.add(label)
+                neighbors.append({
+                    'label': self.label_names[label],
+                    'score': float(score),
+                    'reference': int(row)
+                })
+                if len(neighbors) == k:
+                    break
+            results.append(neighbors)
+        return results
+
+    def train_ivf(
+        self,
+        nlist: int,
+        iterations: int = 10,
+        sample_size: Optional[int] = None,
+        seed: int = 0
+    ) -> None:
+        """Partition the stored rows with spherical k-means for IVF search.
+
+        Rows added later are assigned to their nearest partition; retrain
+        when the reference set has changed substantially.
+
+        Args:
+            nlist: Number of partitions, typically a few times sqrt(size)
+            iterations: k-means iterations
+            sample_size: Rows used to fit the centroids, defaults to 64 per
+                partition
+            seed: Random seed
+        """
+        if not self.writable:
+            raise ValueError(f"Index at {self.directory} was opened read-only")
+        with self._lock:
+            count = self._count
+            if count < nlist:
+                raise ValueError(f"Cannot fit {nlist} partitions to {count} rows")
+            start_time = time.perf_counter()
+            rng = np.random.default_rng(seed)
+
+            sample_rows = np.sort(rng.choice(count, min(count, sample_size or 64 * nlist), replace=False))
+            sample = self._dequantize(sample_rows)
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = self._assign(sample, centroids)
+                # Sum each partition's rows over contiguous runs of a sort
+                order = np.argsort(assignment, kind='stable')
+                sizes = np.bincount(assignment, minlength=nlist)
+                filled = np.flatnonzero(sizes)
+                sums = np.empty_like(centroids)
+                sums[filled] = np.add.reduceat(sample[order], (np.cumsum(sizes) - sizes)[filled])
+                # Re-seed empty partitions from random rows
+                empty = np.flatnonzero(sizes == 0)
+                sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+                centroids = _normalize(sums)
+
+            self._centroids = centroids.astype(np.float32)
+            np.save(self.directory / _CENTROIDS, self._centroids)
+            self.nlist = nlist
+            self._resize(self._capacity)
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                stop = min(start + SEARCH_BLOCK_ROWS, count)
+                self._lists[start:stop] = self._assign(
+                    self._dequantize(np.arange(start, stop)), self._centroids
+                )
+            self._build_lists(self._lists[:count])
+            self._save_meta()
+
+        sizes = [len(rows) for rows in self._list_rows]
+        logger.info(
+            f"Trained {nlist}-partition IVF on {count} rows in "
+            f"{time.perf_counter() - start_time:.1f}s (partition sizes {min(sizes)}-{max(sizes)})"
+        )
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, np.newaxis]
+        return vectors
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def _build_lists(self, lists: np.ndarray) -> None:
+        order = np.argsort(lists, kind='stable')
+        bounds = np.searchsorted(lists[order], np.arange(self.nlist + 1))
+        self._list_rows = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size, layout and on-disk footprint."""
+        return {
+            'size': self._count,
+            'labels': len(self.label_names),
+            'dim': self.dim,
+            'dtype': self.dtype,
+            'nlist': self.nlist,
+            'disk_mb': sum(
+                p.stat().st_size for p in self.directory.iterdir() if p.is_file()
+            ) / (1024 * 1024)
+        }
+
+
+def _write_meta(directory: Path, meta: Dict[str, Any]) -> None:
+    tmp = directory / f"{_META}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, directory / _META)
+
+
+def add_references(
+    predictor,
+    data_dir: str,
+    index_dir: str,
+    dtype: str = 'float16',
+    batch_size: int = 64
+) -> EmbeddingIndex:
+    """Embed a class-per-directory set of reference images into an index.
+
+    Directory names are the labels (NDCs). The index is created when it
+    does not exist yet, otherwise the references are appended.
+
+    Args:
+        predictor: ``RxPredictor`` of the model producing the embeddings
+        data_dir: Directory with one sub-directory of images per label
+        index_dir: Index directory
+        dtype: Storage dtype for a new index
+        batch_size: Images embedded per forward pass
+
+    Returns:
+        The updated index
+    """
+    from .cache import file_fingerprint
+
+    paths, labels, class_names = list_labeled_images(data_dir)
+    if not paths:
+        raise ValueError(f"No labeled images found under {data_dir}")
+    fingerprint = file_fingerprint(str(predictor.model_path))
+
+    if (Path(index_dir) / _META).exists():
+        index = EmbeddingIndex(index_dir, writable=True)
+        if index.model_fingerprint not in (None, fingerprint):
+            raise ValueError(f"Index at {index_dir} holds embeddings of a different model")
+    else:
+        index = EmbeddingIndex.create(
+            index_dir, predictor.embedder.dim, dtype=dtype, model_fingerprint=fingerprint
+        )
+
+    start_time = time.perf_counter()
+    for start in range(0, len(paths), batch_size):
+        embeddings, _ = predictor.embed(paths[start:start + batch_size])
+        index.add(embeddings, [class_names[label] for label in labels[start:start + batch_size]])
+    logger.info(
+        f"Added {len(paths)} references of {len(class_names)} labels to {index_dir} in "
+        f"{time.perf_counter() - start_time:.1f}s ({len(index)} rows)"
+    )
+    return index
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 reference embedding index")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser(
+        'add', help="Embed a class-per-directory reference set into an index"
+    )
+    add_parser.add_argument('data_dir')
+    add_parser.add_argument('--index', required=True)
+    add_parser.add_argument('--model', default='models/best_model.h5')
+    add_parser.add_argument('--dtype', choices=DTYPES, default='float16')
+    add_parser.add_argument('--batch-size', type=int, default=64)
+
+    ivf_parser = subparsers.add_parser('train-ivf', help="Partition an index for IVF search")
+    ivf_parser.add_argument('--index', required=True)
+    ivf_parser.add_argument('--nlist', type=int, default=None,
+                            help="Defaults to 4 * sqrt(index size)")
+    ivf_parser.add_argument('--iterations', type=int, default=10)
+
+    search_parser = subparsers.add_parser('search', help="Nearest reference labels of images")
+    search_parser.add_argument('images', nargs='+')
+    search_parser.add_argument('--index', required=True)
+    search_parser.add_argument('--model', default='models/best_model.h5')
+    search_parser.add_argument('--k', type=int, default=5)
+    search_parser.add_argument('--nprobe', type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'train-ivf':
+        index = EmbeddingIndex(args.index, writable=True)
+        index.train_ivf(args.nlist or max(1, int(4 * np.sqrt(len(index)))), iterations=args.iterations)
+        return
+
+    from .predictor import RxPredictor
+
+    predictor = RxPredictor(args.model)
+    if args.command == 'add':
+        index = add_references(
+            predictor, args.data_dir, args.index, dtype=args.dtype, batch_size=args.batch_size
+        )
+        logger.info(f"Index stats: {index.stats()}")
+    elif args.command == 'search':
+        index = EmbeddingIndex(args.index)
+        embeddings, _ = predictor.embed(args.images)
+        for image, neighbors in zip(args.images, index.nearest_labels(embeddings, args.k, args.nprobe)):
+            print(json.dumps({'image': image, 'neighbors': neighbors}))
+
+
+if __name__ == "__main__":
+    main()
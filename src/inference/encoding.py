@@ -0,0 +1,153 @@
+"""
+Compact binary encoding of top-k predictions for RxVision25.
+
+High-volume internal clients can ask ``/predict`` and ``/predict/batch`` for
+``application/x-rxvision-topk`` in the ``Accept`` header instead of JSON.
+The body packs class ids and probabilities as flat arrays, so a response
+costs a few bytes per prediction and no per-item JSON serialization or
+parsing. Labels are not repeated; ``/model/info`` lists ``class_labels``
+in class id order.
+
+Layout (little-endian):
+    magic        4 bytes, b'RXTK'
+    version      uint8, currently 1
+    reserved     uint8
+    k            uint16, predictions per item
+    n            uint32, number of items
+    time         float32, inference time in seconds
+    model        uint16 length + UTF-8 model version
+    class_ids    int32[n * k], -1 where an item has fewer than k predictions
+    probability  float32[n * k]
+    errors       uint32 length + UTF-8 JSON object {item index: message}
+"""
+
+import json
+import struct
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+MEDIA_TYPE = 'application/x-rxvision-topk'
+
+MAGIC = b'RXTK'
+VERSION = 1
+_HEADER = struct.Struct('<4sBBHIf')
+_LENGTH16 = struct.Struct('<H')
+_LENGTH32 = struct.Struct('<I')
+
+
+def accepts_binary(accept: Optional[str]) -> bool:
+    """Whether an ``Accept`` header asks for the binary top-k encoding."""
+    return bool(accept) and MEDIA_TYPE in accept
+
+
+def stack_topk(
+    results: Sequence[Optional[Tuple[np.ndarray, np.ndarray]]],
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack per-item top-k class id and probability arrays into (n, k) arrays.
+
+    Args:
+        results: Per-item ``(class_ids, probabilities)`` pairs, e.g.
+            ``RxPredictor.topk_results`` output, None for failed items
+        k: Predictions per item
+
+    Returns:
+        int32 class ids (-1 padded) and float32 probabilities of shape (n, k)
+    """
+    if results and all(result is not None and len(result[0]) == k for result in results):
+        return (
+            np.stack([result[0] for result in results]).astype(np.int32, copy=False),
+            np.stack([result[1] for result in results]).astype(np.float32, copy=False)
+        )
+
+    ids = np.full((len(results), k), -1, dtype=np.int32)
+    probabilities = np.zeros((len(results), k), dtype=np.float32)
+    for i, result in enumerate(results):
+        if result is not None:
+            n = min(k, len(result[0]))
+            ids[i, :n] = result[0][:n]
+            probabilities[i, :n] = result[1][:n]
+    return ids, probabilities
+
+
+def encode_topk(
+    class_ids: np.ndarray,
+    probabilities: np.ndarray,
+    model_version: str = '',
+    inference_time: float = 0.0,
+    errors: Optional[Sequence[Optional[str]]] = None
+) -> bytes:
+    """Pack top-k class ids and probabilities into the binary layout.
+
+    Args:
+        class_ids: Class ids of shape (n, k)
+        probabilities: Probabilities of shape (n, k)
+        model_version: Version of the model that produced the results
+        inference_time: Seconds spent serving the request
+        errors: Optional per-item error messages
+
+    Returns:
+        Encoded response body
+    """
+    class_ids = np.ascontiguousarray(class_ids, dtype='<i4')
+    probabilities = np.ascontiguousarray(probabilities, dtype='<f4')
+    if class_ids.ndim != 2 or class_ids.shape != probabilities.shape:
+        raise ValueError(
+            f"Expected matching (n, k) arrays, got {class_ids.shape} and {probabilities.shape}"
+        )
+    n, k = class_ids.shape
+
+    model = model_version.encode('utf-8')
+    failed = {str(i): error for i, error in enumerate(errors or []) if error is not None}
+    error_bytes = json.dumps(failed).encode('utf-8') if failed else b''
+
+    return b''.join((
+        _HEADER.pack(MAGIC, VERSION, 0, k, n, inference_time),
+        _LENGTH16.pack(len(model)),
+        model,
+        class_ids.tobytes(),
+        probabilities.tobytes(),
+        _LENGTH32.pack(len(error_bytes)),
+        error_bytes
+    ))
+
+
+def decode_topk(data: bytes) -> Dict[str, Any]:
+    """Unpack a body written by ``encode_topk``.
+
+    Returns:
+        Dict with 'class_ids' and 'probabilities' arrays of shape (n, k),
+        'model_version', 'inference_time' and 'errors' ({index: message})
+
+    Raises:
+        ValueError: If the data is not a supported top-k encoding
+    """
+    view = memoryview(data)
+    magic, version, _, k, n, inference_time = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not an RXTK v{VERSION} body (magic {magic!r}, version {version})")
+    offset = _HEADER.size
+
+    (length,) = _LENGTH16.unpack_from(view, offset)
+    offset += _LENGTH16.size
+    model_version = bytes(view[offset:offset + length]).decode('utf-8')
+    offset += length
+
+    count = n * k
+    class_ids = np.frombuffer(view, dtype='<i4', count=count, offset=offset).reshape(n, k)
+    offset += 4 * count
+    probabilities = np.frombuffer(view, dtype='<f4', count=count, offset=offset).reshape(n, k)
+    offset += 4 * count
+
+    (length,) = _LENGTH32.unpack_from(view, offset)
+    offset += _LENGTH32.size
+    errors = json.loads(bytes(view[offset:offset + length])) if length else {}
+
+    return {
+        'class_ids': class_ids,
+        'probabilities': probabilities,
+        'model_version': model_version,
+        'inference_time': inference_time,
+        'errors': {int(i): message for i, message in errors.items()}
+    }
@@ -0,0 +1,119 @@
+"""
+Bounded executor for blocking inference work in RxVision25.
+
+Decoding, forward passes and Grad-CAM are CPU-bound and would freeze the
+asyncio event loop if called from request handlers. This executor runs them
+on a dedicated thread pool sized to the host's cores and admits only a
+bounded number of pending tasks; beyond that, requests are shed immediately
+so the service answers with 503 instead of piling up latency.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import LatencyTracker
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """Raised when a queue is full and the request is shed."""
+
+
+class InferenceExecutor:
+    """Thread pool with bounded admission for blocking inference calls."""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_queue: int = 64,
+        name: str = 'rxvision-inference'
+    ):
+        """Initialize the executor.
+
+        Args:
+            max_workers: Worker threads, defaults to the number of CPU cores
+            max_queue: Tasks allowed to wait beyond the running ones
+            name: Thread name prefix
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.shed = 0
+        self.completed = 0
+        self.queue_wait = LatencyTracker()
+        self.run_time = LatencyTracker()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run ``fn`` on the pool without blocking the event loop.
+
+        Raises:
+            OverloadedError: If the pool and its queue are full
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.shed += 1
+                raise OverloadedError(
+                    f"Inference queue full ({self._pending} pending requests)"
+                )
+            self._pending += 1
+
+        enqueued_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            self.queue_wait.observe(started_at - enqueued_at)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.run_time.observe(time.perf_counter() - started_at)
+
+        # The slot is released when the pool is done with the task, not when
+        # this coroutine returns: a cancelled request (e.g. a disconnected
+        # client) leaves its task queued or running and must keep counting
+        try:
+            future = self._pool.submit(task)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: Future) -> None:
+        """Free the admission slot of a finished or cancelled pool task."""
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled():
+                self.completed += 1
+
+    @property
+    def pending(self) -> int:
+        """Number of admitted tasks that have not finished."""
+        return self._pending
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pending tasks, shed count and queue wait time."""
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'pending': self._pending,
+            'completed': self.completed,
+            'shed': self.shed,
+            'queue_wait': self.queue_wait.snapshot(),
+            'run_time': self.run_time.snapshot()
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shut down the worker threads."""
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,215 @@
+"""
+Grad-CAM explanations for RxVision25 predictions.
+
+``GradCAMExplainer`` builds the gradient path of a Keras model once and
+traces it with ``tf.function``, so every later call is a single
+forward/backward pass over a whole batch of preprocessed images. The same
+pass yields the class probabilities, so explaining an image does not also
+need a separate prediction. The gradient path works on Sequential models
+loaded under Keras 3, whose layers' symbolic outputs belong to stale call
+nodes, and on classifiers whose last convolution sits inside a nested
+backbone.
+
+Heatmaps are returned as float arrays. ``encode_heatmap`` turns one into a
+downsampled uint8 image in base64 for JSON responses.
+"""
+
+import base64
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default longest side of encoded heatmaps
+HEATMAP_SIZE = 32
+
+
+def _conv_types():
+    import tensorflow as tf
+
+    # DepthwiseConv2D does not subclass Conv2D in Keras 3
+    return (tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D)
+
+
+def find_target_layer(model, layer_name: Optional[str] = None) -> List[Any]:
+    """Path of layers from ``model`` down to the layer to explain.
+
+    Without ``layer_name`` the last convolution is used, searching nested
+    models such as an application backbone.
+
+    Returns:
+        Layers from the outermost container to the target, empty if none
+    """
+    for layer in reversed(model.layers):
+        if layer_name is not None and layer.name == layer_name:
+            return [layer]
+        if getattr(layer, 'layers', None):
+            path = find_target_layer(layer, layer_name)
+            if path:
+                return [layer] + path
+        elif layer_name is None and isinstance(layer, _conv_types()):
+            return [layer]
+    return []
+
+
+def feature_forward(model, path: Sequence[Any]) -> Callable:
+    """Function mapping images to (target layer output, model output)."""
+    import tensorflow as tf
+
+    target, rest = path[0], path[1:]
+    # A Sequential model's layers can hold several call nodes (e.g. after
+    # loading under Keras 3), so ``layer.output`` may belong to another
+    # graph; such models run their layers in order instead
+    if not rest and not isinstance(model, tf.keras.Sequential):
+        grad_model = tf.keras.Model(model.inputs, [target.output, model.outputs[0]])
+        return lambda images: grad_model(images, training=False)
+
+    inner = feature_forward(target, rest) if rest else None
+    layers = [
+        layer for layer in model.layers
+        if not isinstance(layer, tf.keras.layers.InputLayer)
+    ]
+
+    def forward(images):
+        features, x = None, images
+        for layer in layers:
+            if layer is target and inner is not None:
+                features, x = inner(x)
+            else:
+                x = layer(x, training=False)
+                if layer is target:
+                    features = x
+        return features, x
+    return forward
+
+
+class GradCAMExplainer:
+    """Batched Grad-CAM over a Keras classifier, traced once per model."""
+
+    def __init__(
+        self,
+        model,
+        input_shape: Tuple[int, ...],
+        layer_name: Optional[str] = None
+    ):
+        """Initialize the explainer.
+
+        Args:
+            model: Keras classifier ending in softmax probabilities
+            input_shape: Per-image input shape (H, W, C)
+            layer_name: Layer whose activations are weighted, defaults to
+                the last convolution
+
+        Raises:
+            ValueError: If there is no layer to explain, or the gradient
+                path does not reproduce the model's output
+        """
+        import tensorflow as tf
+
+        path = find_target_layer(model, layer_name)
+        if not path:
+            raise ValueError(
+                f"No layer named '{layer_name}'" if layer_name
+                else f"Model {model.name} has no convolution to explain"
+            )
+        self.layer_name = path[-1].name
+        self.input_shape = tuple(input_shape)
+        forward = feature_forward(model, path)
+
+        @tf.function(input_signature=[
+            tf.TensorSpec((None,) + self.input_shape, tf.float32),
+            tf.TensorSpec((None,), tf.int32)
+        ])
+        def explain(images, class_idx):
+            with tf.GradientTape() as tape:
+                features, probabilities = forward(images)
+                probabilities = tf.cast(probabilities, tf.float32)
+                # Negative indices stand for the predicted class
+                predicted = tf.argmax(probabilities, axis=-1, output_type=tf.int32)
+                target = tf.where(class_idx < 0, predicted, class_idx)
+                scores = tf.gather(probabilities, target, batch_dims=1)
+            # Images are independent, so one gradient of the summed scores
+            # holds every image's own gradient
+            grads = tf.cast(tape.gradient(scores, features), tf.float32)
+            weights = tf.reduce_mean(grads, axis=(1, 2))
+            heatmaps = tf.nn.relu(
+                tf.einsum('nhwc,nc->nhw', tf.cast(features, tf.float32), weights)
+            )
+            peak = tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True)
+            return probabilities, tf.math.divide_no_nan(heatmaps, peak)
+
+        self._explain = explain
+
+        # Trace now and check the gradient path against the model itself
+        sample = np.random.default_rng(0).random((1,) + self.input_shape, dtype=np.float32)
+        try:
+            probabilities, _ = self._explain(sample, tf.constant([-1], tf.int32))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Cannot explain {model.name} at layer {self.layer_name}: {e}")
+        expected = np.asarray(model(sample, training=False), dtype=np.float32)
+        if not np.allclose(probabilities.numpy(), expected, atol=1e-4):
+            raise ValueError(
+                f"Cannot explain {model.name}: running its layers in order does not "
+                f"reproduce its output"
+            )
+        self.num_classes = int(expected.shape[-1])
+        logger.info(f"Built Grad-CAM explainer on layer {self.layer_name}")
+
+    def __call__(
+        self,
+        batch: np.ndarray,
+        class_idx: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Explain a preprocessed batch.
+
+        Args:
+            batch: Preprocessed images of shape (N, H, W, C)
+            class_idx: Class to explain for every image, defaults to each
+                image's predicted class
+
+        Returns:
+            Class probabilities (N, num_classes) and heatmaps (N, h, w)
+            scaled to [0, 1] at the explained layer's resolution
+
+        Raises:
+            ValueError: If ``class_idx`` is not a class of the model
+        """
+        if class_idx is not None and not 0 <= class_idx < self.num_classes:
+            raise ValueError(f"class_idx must be in [0, {self.num_classes}), got {class_idx}")
+        batch = np.asarray(batch, dtype=np.float32)
+        targets = np.full(len(batch), -1 if class_idx is None else class_idx, dtype=np.int32)
+        probabilities, heatmaps = self._explain(batch, targets)
+        return probabilities.numpy(), heatmaps.numpy()
+
+
+def encode_heatmap(heatmap: np.ndarray, max_size: int = HEATMAP_SIZE) -> Dict[str, Any]:
+    """Downsample a [0, 1] heatmap to uint8 and encode it in base64.
+
+    Args:
+        heatmap: Heatmap of shape (h, w)
+        max_size: Longest side of the encoded heatmap
+
+    Returns:
+        Dict with 'heatmap' (base64 of row-major uint8) and 'heatmap_shape'
+    """
+    image = Image.fromarray(np.asarray(heatmap, dtype=np.float32), mode='F')
+    scale = max_size / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.BOX)
+    pixels = np.clip(np.round(np.asarray(image) * 255.0), 0, 255).astype(np.uint8)
+    return {
+        'heatmap': base64.b64encode(pixels.tobytes()).decode('ascii'),
+        'heatmap_shape': list(pixels.shape)
+    }
+
+
+def decode_heatmap(heatmap: str, heatmap_shape: Sequence[int]) -> np.ndarray:
+    """Invert ``encode_heatmap`` into a float heatmap in [0, 1]."""
+    pixels = np.frombuffer(base64.b64decode(heatmap), dtype=np.uint8)
+    return pixels.reshape(tuple(heatmap_shape)).astype(np.float32) / 255.0
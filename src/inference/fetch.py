@@ -0,0 +1,198 @@
+"""
+Concurrent image fetching for RxVision25 batch requests.
+
+All downloads share one pooled ``httpx.AsyncClient`` so connections are
+reused across requests. Per-host semaphores keep a single batch from
+opening too many connections to one server. Each download has a total
+timeout and a size cap enforced while streaming.
+
+URLs come from API callers, so every host, including each redirect hop,
+is resolved and refused unless all of its addresses are public; the
+service cannot be used to reach loopback, private or link-local services.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+from typing import Dict, List, Optional, Union
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FetchError(Exception):
+    """Raised when an image URL cannot be downloaded."""
+
+
+class ImageFetcher:
+    """Downloads images concurrently through a shared connection pool."""
+
+    def __init__(
+        self,
+        max_connections: int = 64,
+        max_per_host: int = 8,
+        timeout: float = 10.0,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_redirects: int = 5,
+        allow_private: bool = False
+    ):
+        """Initialize the fetcher.
+
+        Args:
+            max_connections: Maximum open connections across all hosts
+            max_per_host: Maximum concurrent downloads from a single host
+            timeout: Total time allowed per download in seconds
+            max_bytes: Maximum size of a downloaded image
+            max_redirects: Maximum redirects followed per download
+            allow_private: Allow hosts that resolve to non-public addresses,
+                e.g. for a local object store during development
+        """
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_redirects = max_redirects
+        self.allow_private = allow_private
+
+        self._client: Optional[httpx.AsyncClient] = None
+        # Semaphores only exist for hosts with downloads in flight
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._host_users: Dict[str, int] = {}
+
+    async def start(self) -> None:
+        """Create the pooled HTTP client."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=httpx.Timeout(self.timeout),
+                # Redirects are followed by _download so each hop is checked
+                follow_redirects=False
+            )
+
+    async def close(self) -> None:
+        """Close the pooled HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, url: str) -> bytes:
+        """Download one image.
+
+        Args:
+            url: HTTP(S) URL of the image
+
+        Returns:
+            Downloaded bytes
+
+        Raises:
+            FetchError: If the URL is invalid or not public, the download
+                fails, times out or exceeds ``max_bytes``
+        """
+        if self._client is None:
+            raise RuntimeError("Fetcher is not started")
+
+        host = self._check_url(url)
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        self._host_users[host] = self._host_users.get(host, 0) + 1
+
+        try:
+            async with limit:
+                try:
+                    return await asyncio.wait_for(self._download(url), self.timeout)
+                except asyncio.TimeoutError:
+                    raise FetchError(f"Timed out after {self.timeout:g}s fetching {url}")
+                except httpx.HTTPStatusError as e:
+                    raise FetchError(f"HTTP {e.response.status_code} fetching {url}")
+                except httpx.HTTPError as e:
+                    raise FetchError(f"Error fetching {url}: {e}")
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host]
+                del self._host_limits[host]
+
+    async def fetch_many(self, urls: List[str]) -> List[Union[bytes, Exception]]:
+        """Download images concurrently.
+
+        Args:
+            urls: Image URLs
+
+        Returns:
+            Downloaded bytes or the exception for each URL, in input order
+        """
+        return await asyncio.gather(
+            *(self.fetch(url) for url in urls),
+            return_exceptions=True
+        )
+
+    @staticmethod
+    def _check_url(url: str) -> str:
+        """Return the lowercase host of an HTTP(S) URL, or raise FetchError."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError(f"Unsupported image URL: {url}")
+        return parts.hostname.lower()
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        """Resolve ``host`` to the addresses a connection could use."""
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )
+        return [info[4][0] for info in infos]
+
+    async def _check_public(self, url: str) -> None:
+        """Refuse URLs whose host resolves to any non-public address."""
+        host = self._check_url(url)
+        if self.allow_private:
+            return
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        try:
+            addresses = await self._resolve(host, port)
+        except OSError as e:
+            raise FetchError(f"Cannot resolve host of {url}: {e}")
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split('%', 1)[0])
+            if not ip.is_global or ip.is_multicast:
+                raise FetchError(f"Image URL {url} resolves to non-public address {ip}")
+
+    async def _download(self, url: str) -> bytes:
+        """Stream a response body, following checked redirects and enforcing the size cap."""
+        for _ in range(self.max_redirects + 1):
+            await self._check_public(url)
+            async with self._client.stream('GET', url) as response:
+                if response.is_redirect:
+                    url = urljoin(str(response.url), response.headers['location'])
+                    continue
+                return await self._read_body(url, response)
+        raise FetchError(f"Too many redirects fetching {url}")
+
+    async def _read_body(self, url: str, response: httpx.Response) -> bytes:
+        """Read a response body, enforcing the size cap."""
+        response.raise_for_status()
+
+        length = response.headers.get('content-length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            raise FetchError(
+                f"Image at {url} is {length} bytes, over the limit of {self.max_bytes}"
+            )
+
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > self.max_bytes:
+                raise FetchError(f"Image at {url} exceeds the limit of {self.max_bytes} bytes")
+            chunks.append(chunk)
+
+        return b''.join(chunks)
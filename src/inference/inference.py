@@ -0,0 +1,381 @@
+"""
+Offline bulk inference for RxVision25.
+
+Scores a directory or manifest of images with the same preprocessing and
+backends as the service. A decode thread prepares upcoming batches while
+the model runs the current one, and at most ``prefetch_batches`` decoded
+batches exist at any time, so memory stays flat however large the archive.
+Results are appended to JSONL or written as Parquet part files, and a
+checkpoint next to the output records how far the job got, so a killed job
+resumes where it stopped.
+
+Usage:
+    python -m src.inference.inference data/archive --output predictions.jsonl
+    python -m src.inference.inference --manifest archive.csv \\
+        --output predictions.parquet --model models/best_model.onnx
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.data.preprocessing import IMAGE_EXTENSIONS
+
+from .predictor import RxPredictor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def list_inputs(
+    source: Optional[str] = None,
+    manifest: Optional[str] = None
+) -> List[Path]:
+    """List the images of a bulk job in a stable order.
+
+    Args:
+        source: Directory searched recursively for images
+        manifest: Text file with one path per line, or CSV with a ``path``
+            column; relative paths are resolved against the manifest's
+            directory
+
+    Returns:
+        Image paths, sorted for directories and in file order for manifests
+    """
+    if manifest is not None:
+        manifest = Path(manifest)
+        with open(manifest, 'r', newline='') as f:
+            if manifest.suffix == '.csv':
+                entries = [row['path'] for row in csv.DictReader(f)]
+            else:
+                entries = [line.strip() for line in f if line.strip()]
+        return [
+            path if path.is_absolute() else manifest.parent / path
+            for path in map(Path, entries)
+        ]
+
+    if source is None:
+        raise ValueError("Either a source directory or a manifest is required")
+    source = Path(source)
+    if not source.is_dir():
+        raise FileNotFoundError(f"Input directory not found: {source}")
+    return sorted(p for p in source.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def _job_signature(paths: Sequence[Path], model_path: str, top_k: int) -> str:
+    """Hash of the job definition, used to refuse resuming a different job."""
+    digest = hashlib.sha256(f"{model_path}:{top_k}".encode())
+    for path in paths:
+        digest.update(str(path).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class JsonlWriter:
+    """Appends one JSON object per image to a file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def open(self, state: Optional[int] = None) -> None:
+        """Open for appending, dropping anything written after ``state``."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'ab' if state is not None else 'wb')
+        if state is not None:
+            self._file.truncate(state)
+            self._file.seek(state)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._file.write(b''.join(json.dumps(row).encode() + b'\n' for row in rows))
+
+    def commit(self) -> int:
+        """Make written rows durable and return the resume state."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetWriter:
+    """Writes rows as numbered Parquet part files in an output directory."""
+
+    def __init__(self, path: Path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self._rows: List[Dict[str, Any]] = []
+        self._parts = 0
+
+    def open(self, state: Optional[int] = None) -> None:
+        """Open the dataset directory, removing parts written after ``state``."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._parts = state or 0
+        for part in self.path.glob('part-*.parquet'):
+            if int(part.stem.split('-')[1]) >= self._parts:
+                part.unlink()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._rows.extend(rows)
+
+    def commit(self) -> int:
+        """Write buffered rows as a new part file and return the resume state."""
+        if self._rows:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # Fixed schema so parts without failures still match the others
+            schema = pa.schema([
+                ('path', pa.string()),
+                ('predictions', pa.list_(pa.struct([
+                    ('class', pa.string()),
+                    ('probability', pa.float64())
+                ]))),
+                ('error', pa.string())
+            ])
+            part = self.path / f"part-{self._parts:05d}.parquet"
+            tmp = part.with_suffix('.tmp')
+            pq.write_table(pa.Table.from_pylist(self._rows, schema=schema), tmp)
+            os.replace(tmp, part)
+            self._parts += 1
+            self._rows = []
+        return self._parts
+
+    def close(self) -> None:
+        self._rows = []
+
+
+def _put(out: 'queue.Queue', item: Any, stop: threading.Event) -> bool:
+    """Put ``item`` into ``out`` unless ``stop`` is set first.
+
+    Returns:
+        Whether the item was queued
+    """
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _decode_batches(
+    predictor: RxPredictor,
+    paths: Sequence[Path],
+    start: int,
+    batch_size: int,
+    out: 'queue.Queue',
+    stop: threading.Event
+) -> None:
+    """Producer thread: decode batches in order into ``out``.
+
+    Every put gives up once ``stop`` is set, so the thread can always be
+    joined even if the consumer stopped reading from a full queue.
+    """
+    height, width = predictor.target_size
+    try:
+        for offset in range(start, len(paths), batch_size):
+            batch_paths = paths[offset:offset + batch_size]
+            batch = np.empty((len(batch_paths), height, width, 3), dtype=np.float32)
+            errors: List[Optional[Exception]] = []
+            predictor.preprocessor(batch_paths, out=batch, errors=errors)
+            if not _put(out, (offset, batch, errors), stop):
+                return
+    except Exception as e:
+        if not _put(out, e, stop):
+            return
+    _put(out, _DONE, stop)
+
+
+def run_bulk_inference(
+    predictor: RxPredictor,
+    paths: Sequence[Path],
+    output_path: str,
+    return_top_k: int = 5,
+    batch_size: int = 64,
+    prefetch_batches: int = 2,
+    checkpoint_every: int = 1000,
+    resume: bool = True
+) -> Dict[str, Any]:
+    """Score ``paths`` and write one result per image to ``output_path``.
+
+    Args:
+        predictor: Loaded predictor
+        paths: Images in job order
+        output_path: ``.jsonl`` file or ``.parquet`` dataset directory
+        return_top_k: Number of top predictions per image
+        batch_size: Images per forward pass
+        prefetch_batches: Decoded batches allowed to wait for the model
+        checkpoint_every: Images between checkpoints
+        resume: Continue from an existing checkpoint for the same job
+
+    Returns:
+        Job summary with counts and images/sec
+
+    Raises:
+        ValueError: If a checkpoint exists for a different job
+    """
+    output_path = Path(output_path)
+    writer = ParquetWriter(output_path) if output_path.suffix == '.parquet' else JsonlWriter(output_path)
+    checkpoint_path = output_path.with_name(output_path.name + '.checkpoint.json')
+    signature = _job_signature(paths, str(predictor.model_path), return_top_k)
+
+    # Pick up where a previous run of the same job stopped
+    completed, state = 0, None
+    if resume and checkpoint_path.exists():
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint['signature'] != signature:
+            raise ValueError(
+                f"{checkpoint_path} belongs to a different job; "
+                f"remove it or pass --no-resume to start over"
+            )
+        completed, state = checkpoint['completed'], checkpoint['state']
+        logger.info(f"Resuming after {completed}/{len(paths)} images")
+
+    def save_checkpoint() -> None:
+        tmp = checkpoint_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({
+                'signature': signature,
+                'completed': completed,
+                'total': len(paths),
+                'state': writer.commit()
+            }, f)
+        os.replace(tmp, checkpoint_path)
+
+    writer.open(state)
+    batches: 'queue.Queue' = queue.Queue(maxsize=prefetch_batches)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_decode_batches,
+        args=(predictor, paths, completed, batch_size, batches, stop),
+        name='rxvision-bulk-decode',
+        daemon=True
+    )
+
+    start_time = time.perf_counter()
+    processed = failed = 0
+    last_checkpoint = completed
+    producer.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            offset, batch, errors = item
+
+            # Only decoded images go through the model
+            valid = [i for i, error in enumerate(errors) if error is None]
+            predictions = predictor.predict_tensor(batch[valid], return_top_k) if valid else []
+            results = dict(zip(valid, predictions))
+
+            writer.write([
+                {
+                    'path': str(paths[offset + i]),
+                    'predictions': results.get(i, []),
+                    'error': None if error is None else f"{type(error).__name__}: {error}"
+                }
+                for i, error in enumerate(errors)
+            ])
+            completed = offset + len(errors)
+            processed += len(errors)
+            failed += len(errors) - len(valid)
+
+            if completed - last_checkpoint >= checkpoint_every:
+                save_checkpoint()
+                last_checkpoint = completed
+                elapsed = time.perf_counter() - start_time
+                logger.info(
+                    f"{completed}/{len(paths)} images, "
+                    f"{processed / elapsed:.1f} images/s, {failed} failed"
+                )
+
+        save_checkpoint()
+    finally:
+        stop.set()
+        producer.join()
+        writer.close()
+
+    elapsed = time.perf_counter() - start_time
+    summary = {
+        'output': str(output_path),
+        'total': len(paths),
+        'processed': processed,
+        'skipped': len(paths) - processed,
+        'failed': failed,
+        'seconds': elapsed,
+        'images_per_second': processed / elapsed if elapsed > 0 else None
+    }
+    logger.info(
+        f"Scored {processed} images in {elapsed:.1f}s "
+        f"({summary['images_per_second'] or 0:.1f} images/s, {failed} failed)"
+    )
+    return summary
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 bulk inference")
+    parser.add_argument('source', nargs='?', default=None, help="Directory of images")
+    parser.add_argument('--manifest', default=None, help="Text or CSV list of image paths")
+    parser.add_argument('--output', required=True, help=".jsonl file or .parquet directory")
+    parser.add_argument('--model', default='models/best_model.h5')
+    parser.add_argument('--class-map', default='models/class_map.json')
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--decode-workers', type=int, default=None)
+    parser.add_argument('--prefetch-batches', type=int, default=2)
+    parser.add_argument('--checkpoint-every', type=int, default=1000)
+    parser.add_argument('--no-resume', action='store_true', help="Start over, ignoring checkpoints")
+
+    args = parser.parse_args()
+
+    paths = list_inputs(args.source, args.manifest)
+    predictor = RxPredictor(
+        args.model,
+        class_map_path=args.class_map if Path(args.class_map).exists() else None,
+        batch_size=args.batch_size,
+        backend=args.backend
+    )
+    if args.decode_workers:
+        predictor.preprocessor.num_workers = args.decode_workers
+
+    summary = run_bulk_inference(
+        predictor,
+        paths,
+        args.output,
+        return_top_k=args.top_k,
+        batch_size=args.batch_size,
+        prefetch_batches=args.prefetch_batches,
+        checkpoint_every=args.checkpoint_every,
+        resume=not args.no_resume
+    )
+    logger.info(f"Bulk inference summary: {summary}")
+
+
+if __name__ == "__main__":
+    main()
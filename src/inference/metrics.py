@@ -0,0 +1,350 @@
+"""
+Lightweight in-process metrics for the RxVision25 inference service.
+
+These helpers are cheap enough to call on the request hot path and are
+safe to update from the event loop and from worker threads. Histograms,
+counters and gauges registered with a ``MetricsRegistry`` render in the
+Prometheus text format for the service's ``/metrics`` endpoint.
+"""
+
+import bisect
+import collections
+import math
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Prometheus text exposition format (the response adds the utf-8 charset)
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# Latency buckets in seconds, from sub-millisecond decodes to slow batches
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Batch size buckets
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class LatencyTracker:
+    """Tracks latency observations with a bounded window for percentiles."""
+
+    def __init__(self, window: int = 2048):
+        """Initialize the tracker.
+
+        Args:
+            window: Number of most recent observations kept for percentiles
+        """
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=window)
+        self._exports: List[Tuple['Histogram', Tuple[str, ...]]] = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def export_to(self, histogram: 'Histogram', *labels: str) -> None:
+        """Also record every observation in a Prometheus histogram."""
+        self._exports.append((histogram, labels))
+
+    def observe(self, seconds: float) -> None:
+        """Record a single observation in seconds."""
+        with self._lock:
+            self._recent.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+        for histogram, labels in self._exports:
+            histogram.observe(seconds, *labels)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return count, mean and percentiles in milliseconds."""
+        with self._lock:
+            recent = np.fromiter(self._recent, dtype=np.float64)
+            count, total, maximum = self.count, self.total, self.max
+
+        if count == 0:
+            return {'count': 0}
+
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99]) * 1000.0
+        return {
+            'count': count,
+            'mean_ms': total / count * 1000.0,
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': maximum * 1000.0
+        }
+
+
+class SizeHistogram:
+    """Counts how often each discrete size (e.g. batch size) was observed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+
+    def observe(self, size: int) -> None:
+        """Record one observation of ``size``."""
+        with self._lock:
+            self._counts[size] += 1
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Return per-size counts and the mean size."""
+        with self._lock:
+            counts = dict(sorted(self._counts.items()))
+
+        total = sum(counts.values())
+        mean = (
+            sum(size * n for size, n in counts.items()) / total
+            if total else None
+        )
+        return {
+            'counts': {str(size): n for size, n in counts.items()},
+            'mean': mean
+        }
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets, optionally labeled."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per label set: [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record one observation for the given label values."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter, optionally labeled."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = collections.defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Add ``amount`` to the counter for the given label values."""
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge whose values are read from a function at render time.
+
+    The function returns a number, or a dict mapping label value tuples to
+    numbers for labeled gauges.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], Any],
+        labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.function()
+        except Exception:
+            values = None
+        if values is None:
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], Any],
+        labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, function, labelnames))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def process_memory_bytes() -> Dict[Tuple[str, ...], Optional[float]]:
+    """Resident and peak resident memory of this process in bytes."""
+    rss = None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    peak = float(peak if sys.platform == 'darwin' else peak * 1024)
+    return {('resident',): rss, ('peak_resident',): max(peak, rss or 0)}
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware counting requests and timing body reads and responses.
+
+    The body read runs from the first to the last chunk received from the
+    client, before any form parsing, so slow uploads show up as their own
+    stage. Paths outside ``known_paths`` are grouped under 'other' to keep
+    label cardinality bounded.
+    """
+
+    def __init__(
+        self,
+        app,
+        requests: Counter,
+        errors: Counter,
+        duration: Histogram,
+        body_read: Optional[Histogram] = None,
+        body_read_labels: Tuple[str, ...] = (),
+        known_paths: Iterable[str] = ()
+    ):
+        self.app = app
+        self.requests = requests
+        self.errors = errors
+        self.duration = duration
+        self.body_read = body_read
+        self.body_read_labels = body_read_labels
+        self.known_paths = frozenset(known_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        path = scope['path'] if scope['path'] in self.known_paths else 'other'
+        start = time.perf_counter()
+        read_started = None
+        status = 500
+
+        async def timed_receive():
+            nonlocal read_started
+            if read_started is None:
+                read_started = time.perf_counter()
+            message = await receive()
+            if (
+                self.body_read is not None
+                and message['type'] == 'http.request'
+                and not message.get('more_body', False)
+            ):
+                self.body_read.observe(time.perf_counter() - read_started, *self.body_read_labels)
+            return message
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, send_with_status)
+        finally:
+            status_label = str(status)
+            self.requests.inc(path, status_label)
+            if status >= 400:
+                self.errors.inc(path, status_label)
+            self.duration.observe(time.perf_counter() - start, path)
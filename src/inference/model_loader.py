@@ -0,0 +1,757 @@
+"""
+Model loading backends for RxVision25 inference.
+
+A backend owns a loaded model and runs forward passes on preprocessed
+batches. ``RxPredictor`` talks to models only through this interface, so the
+same preprocessing and postprocessing can run on TensorFlow or on ONNX
+Runtime. Heavy runtimes are imported only by the backend that needs them,
+so an ONNX Runtime worker never loads TensorFlow.
+
+A TensorFlow SavedModel exported with ``export --format savedmodel`` loads
+the already traced serving function, skipping Keras deserialization and
+retracing, which makes it the fastest TensorFlow artifact to start from.
+
+Usage:
+    python -m src.inference.model_loader export models/best_model.h5 \\
+        --output models/best_model.onnx
+    python -m src.inference.model_loader export models/best_model.h5 --format savedmodel
+"""
+
+import argparse
+import contextlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ONNX Runtime graph optimization levels by name
+ORT_GRAPH_OPTIMIZATION_LEVELS = ('disable', 'basic', 'extended', 'all')
+
+
+class InferenceBackend:
+    """Base class for model execution backends."""
+
+    name = 'base'
+
+    # Seconds spent importing the runtime and loading the model in total,
+    # set by ``load_backend``; the import is near zero once it is cached
+    import_seconds = 0.0
+    load_seconds = 0.0
+
+    def __init__(self, model_path: str, input_shape: Tuple[int, ...]):
+        """Initialize the backend.
+
+        Args:
+            model_path: Path to the model artifact
+            input_shape: Per-image input shape (H, W, C)
+        """
+        self.model_path = Path(model_path)
+        self.input_shape = tuple(input_shape)
+
+    @property
+    def keras_model(self):
+        """Underlying Keras model, or None if the backend has none."""
+        return None
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Run a forward pass on a preprocessed batch.
+
+        Args:
+            batch: Preprocessed images of shape (N, H, W, C)
+
+        Returns:
+            Class probabilities of shape (N, num_classes)
+        """
+        raise NotImplementedError
+
+    def warmup(self) -> None:
+        """Run a dummy batch so the first request does not pay setup costs."""
+        self.predict(np.zeros((1,) + self.input_shape, dtype=np.float32))
+
+    def close(self) -> None:
+        """Release resources held outside this process, if any."""
+
+
+class TensorFlowBackend(InferenceBackend):
+    """Runs a Keras model, by default through the compiled fixed-shape path."""
+
+    name = 'tensorflow'
+
+    def __init__(
+        self,
+        model_path: str,
+        input_shape: Tuple[int, ...] = (224, 224, 3),
+        use_compiled: bool = True,
+        batch_buckets: Optional[Sequence[int]] = None
+    ):
+        """Initialize the backend.
+
+        Args:
+            model_path: Path to a saved Keras model
+            input_shape: Per-image input shape (H, W, C)
+            use_compiled: Whether to run the traced fixed-shape fast path
+                instead of ``model.predict``
+            batch_buckets: Padded batch sizes traced by the fast path,
+                defaults to ``engine.DEFAULT_BATCH_BUCKETS``
+        """
+        super().__init__(model_path, input_shape)
+
+        start = time.perf_counter()
+        import tensorflow as tf
+        from .engine import CompiledModelRunner, DEFAULT_BATCH_BUCKETS
+        self.import_seconds = time.perf_counter() - start
+
+        self.model = tf.keras.models.load_model(self.model_path)
+        self.runner = None
+        if use_compiled:
+            self.runner = CompiledModelRunner(
+                self.model,
+                batch_buckets=batch_buckets or DEFAULT_BATCH_BUCKETS,
+                input_shape=self.input_shape
+            )
+
+    @property
+    def keras_model(self):
+        return self.model
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self.runner is not None:
+            return self.runner(batch)
+        return self.model.predict(batch, verbose=0)
+
+    def warmup(self) -> None:
+        if self.runner is not None:
+            self.runner.warmup()
+        else:
+            super().warmup()
+
+
+class ONNXRuntimeBackend(InferenceBackend):
+    """Runs an exported ONNX model on ONNX Runtime."""
+
+    name = 'onnxruntime'
+
+    def __init__(
+        self,
+        model_path: str,
+        input_shape: Tuple[int, ...] = (224, 224, 3),
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        graph_optimization_level: str = 'all',
+        providers: Optional[Sequence[str]] = None
+    ):
+        """Initialize the backend.
+
+        Args:
+            model_path: Path to an ``.onnx`` model
+            input_shape: Per-image input shape (H, W, C)
+            intra_op_threads: Threads used inside an operator (0 = ORT default)
+            inter_op_threads: Threads used across operators (0 = ORT default)
+            graph_optimization_level: One of 'disable', 'basic', 'extended', 'all'
+            providers: Execution providers, defaults to CPU
+        """
+        super().__init__(model_path, input_shape)
+
+        start = time.perf_counter()
+        import onnxruntime as ort
+        self.import_seconds = time.perf_counter() - start
+
+        if graph_optimization_level not in ORT_GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(
+                f"Unknown graph optimization level '{graph_optimization_level}', "
+                f"expected one of {ORT_GRAPH_OPTIMIZATION_LEVELS}"
+            )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = {
+            'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        }[graph_optimization_level]
+
+        self.session = ort.InferenceSession(
+            str(self.model_path),
+            sess_options=options,
+            providers=list(providers or ['CPUExecutionProvider'])
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class TFLiteBackend(InferenceBackend):
+    """Runs a (typically INT8-quantized) TFLite model."""
+
+    name = 'tflite'
+
+    def __init__(
+        self,
+        model_path: str,
+        input_shape: Tuple[int, ...] = (224, 224, 3),
+        num_threads: Optional[int] = None
+    ):
+        """Initialize the backend.
+
+        Args:
+            model_path: Path to a ``.tflite`` model
+            input_shape: Per-image input shape (H, W, C)
+            num_threads: Interpreter threads (None = TFLite default)
+        """
+        super().__init__(model_path, input_shape)
+
+        # Prefer the standalone runtime, which does not pull in TensorFlow
+        start = time.perf_counter()
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.import_seconds = time.perf_counter() - start
+
+        self.interpreter = Interpreter(model_path=str(self.model_path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+
+        # The interpreter is stateful and not thread-safe
+        self._lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.asarray(batch, dtype=np.float32)
+
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(
+                    self._input['index'], (len(batch),) + self.input_shape
+                )
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+
+            # Quantize inputs if the model has integer I/O
+            scale, zero_point = self._input['quantization']
+            if self._input['dtype'] != np.float32 and scale:
+                batch = np.round(batch / scale + zero_point).astype(self._input['dtype'])
+
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self._output['index'])
+
+        scale, zero_point = self._output['quantization']
+        if self._output['dtype'] != np.float32 and scale:
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+
+class SavedModelBackend(InferenceBackend):
+    """Runs the serving signature of a TensorFlow SavedModel."""
+
+    name = 'savedmodel'
+
+    def __init__(self, model_path: str, input_shape: Tuple[int, ...] = (224, 224, 3)):
+        """Initialize the backend.
+
+        Args:
+            model_path: SavedModel directory, e.g. from ``export_savedmodel``
+            input_shape: Per-image input shape (H, W, C)
+        """
+        super().__init__(model_path, input_shape)
+
+        start = time.perf_counter()
+        import tensorflow as tf
+        self.import_seconds = time.perf_counter() - start
+
+        self._tf = tf
+        self._loaded = tf.saved_model.load(str(self.model_path))
+        self._serve = self._loaded.signatures['serving_default']
+        # The signature returns a dict holding the single probabilities output
+        self._output = next(iter(self._serve.structured_outputs))
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = self._tf.constant(np.asarray(batch, dtype=np.float32))
+        return self._serve(batch)[self._output].numpy()
+
+
+def infer_backend(model_path: str) -> str:
+    """Infer the backend name from a model artifact's file extension."""
+    if (Path(model_path) / 'saved_model.pb').exists():
+        return 'savedmodel'
+    suffix = Path(model_path).suffix
+    if suffix == '.onnx':
+        return 'onnxruntime'
+    if suffix == '.tflite':
+        return 'tflite'
+    return 'tensorflow'
+
+
+def load_backend(
+    model_path: str,
+    backend: Optional[str] = None,
+    **options: Any
+) -> InferenceBackend:
+    """Load a model with the requested backend.
+
+    Args:
+        model_path: Path to the model artifact
+        backend: 'tensorflow', 'savedmodel', 'onnxruntime' or 'tflite';
+            inferred from the artifact when omitted
+        **options: Backend-specific keyword arguments
+
+    Returns:
+        Loaded inference backend
+    """
+    backend = backend or infer_backend(model_path)
+
+    backends = {
+        TensorFlowBackend.name: TensorFlowBackend,
+        SavedModelBackend.name: SavedModelBackend,
+        ONNXRuntimeBackend.name: ONNXRuntimeBackend,
+        TFLiteBackend.name: TFLiteBackend
+    }
+    if backend not in backends:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {list(backends)}")
+
+    start = time.perf_counter()
+    loaded = backends[backend](model_path, **options)
+    loaded.load_seconds = time.perf_counter() - start
+    logger.info(
+        f"Loaded {model_path} with {backend} backend in {loaded.load_seconds:.2f}s "
+        f"({loaded.import_seconds:.2f}s importing the runtime)"
+    )
+    return loaded
+
+
+class _ModelEntry:
+    """A model version held by ``ModelRegistry``."""
+
+    def __init__(self, version: str, model_path: str):
+        self.version = version
+        self.model_path = model_path
+        self.state = 'loading'
+        self.model: Any = None
+        self.error: Optional[str] = None
+        self.leases = 0
+        self.retired = False
+        self.requests = 0
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.last_used = time.monotonic()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'model_path': self.model_path,
+            'state': self.state,
+            'error': self.error,
+            'inflight': self.leases,
+            'requests': self.requests,
+            'load_seconds': self.load_seconds,
+            'loaded_at': self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """Keeps several model versions resident and swaps the active one atomically.
+
+    New versions are loaded and warmed on a background thread while the
+    active version keeps serving, then swapped in under a lock. Requests
+    take a lease on the version they use, so a version that is replaced or
+    evicted is only closed once its in-flight requests finish. At most
+    ``max_resident`` ready versions are kept; the least recently used one
+    that is neither active nor the shadow is unloaded first.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str, str], Any],
+        max_resident: int = 2,
+        on_unload: Optional[Callable[[str, Any], None]] = None
+    ):
+        """Initialize the registry.
+
+        Args:
+            loader: Called as ``loader(version, model_path)`` on a background
+                thread; returns a warmed model with an optional ``close()``
+            max_resident: Ready versions kept loaded at once
+            on_unload: Called with the version and model once an unloaded
+                or replaced version is closed, e.g. to drop its cached results
+        """
+        self.loader = loader
+        self.max_resident = max(1, max_resident)
+        self.on_unload = on_unload
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._loading: Dict[str, _ModelEntry] = {}
+        self._failed: Dict[str, _ModelEntry] = {}
+        self._active: Optional[str] = None
+        self._shadow: Optional[str] = None
+        self._shadow_fraction = 0.0
+        self._random = random.Random()
+
+    @property
+    def active_version(self) -> Optional[str]:
+        return self._active
+
+    def active(self) -> Any:
+        """The active model without taking a lease, for cheap metadata reads."""
+        entry = self._entries.get(self._active) if self._active else None
+        return entry.model if entry else None
+
+    def load(self, version: str, model_path: str, activate: bool = True) -> Future:
+        """Load and warm a version in the background.
+
+        Loading a version that is already resident replaces it once the new
+        artifact is ready.
+
+        Args:
+            version: Version name used for pinning and reporting
+            model_path: Artifact to load
+            activate: Whether to make the version active once it is ready
+
+        Returns:
+            Future resolved with the version when it is ready
+        """
+        with self._lock:
+            if version in self._loading:
+                raise ValueError(f"Model version {version} is already loading")
+            entry = self._loading[version] = _ModelEntry(version, str(model_path))
+            self._failed.pop(version, None)
+
+        future: Future = Future()
+        threading.Thread(
+            target=self._load, args=(entry, activate, future), name=f"model-load-{version}", daemon=True
+        ).start()
+        return future
+
+    def _load(self, entry: _ModelEntry, activate: bool, future: Future) -> None:
+        start = time.perf_counter()
+        try:
+            model = self.loader(entry.version, entry.model_path)
+        except Exception as e:
+            logger.error(f"Failed to load model version {entry.version}: {e}")
+            with self._lock:
+                entry.state, entry.error = 'failed', str(e)
+                self._loading.pop(entry.version, None)
+                self._failed[entry.version] = entry
+            future.set_exception(e)
+            return
+
+        entry.model = model
+        entry.load_seconds = time.perf_counter() - start
+        entry.loaded_at = time.time()
+        entry.state = 'ready'
+        with self._lock:
+            self._loading.pop(entry.version, None)
+            replaced = self._entries.get(entry.version)
+            self._entries[entry.version] = entry
+            if activate or self._active is None:
+                self._active = entry.version
+            retired = [replaced] if replaced else []
+            retired.extend(self._evict_locked(keep=entry.version))
+            for old in retired:
+                old.retired = True
+            closable = [old for old in retired if old.leases == 0]
+        logger.info(
+            f"Model version {entry.version} ready in {entry.load_seconds:.2f}s"
+            + (" and active" if self._active == entry.version else "")
+        )
+        for old in closable:
+            self._close(old)
+        future.set_result(entry.version)
+
+    def _evict_locked(self, keep: str) -> List[_ModelEntry]:
+        """Remove least recently used versions beyond ``max_resident``."""
+        evicted = []
+        candidates = sorted(
+            (e for v, e in self._entries.items() if v not in (keep, self._active, self._shadow)),
+            key=lambda e: e.last_used
+        )
+        while len(self._entries) > self.max_resident and candidates:
+            entry = candidates.pop(0)
+            del self._entries[entry.version]
+            evicted.append(entry)
+            logger.info(f"Unloading least recently used model version {entry.version}")
+        return evicted
+
+    def activate(self, version: str) -> None:
+        """Make a resident version serve unpinned requests."""
+        with self._lock:
+            if version not in self._entries:
+                raise KeyError(f"Model version {version} is not loaded")
+            self._active = version
+        logger.info(f"Model version {version} is now active")
+
+    def set_shadow(self, version: Optional[str], fraction: float = 1.0) -> None:
+        """Mirror a fraction of unpinned requests to ``version``, or stop with None."""
+        with self._lock:
+            if version is not None and version not in self._entries:
+                raise KeyError(f"Model version {version} is not loaded")
+            self._shadow = version
+            self._shadow_fraction = min(max(fraction, 0.0), 1.0) if version else 0.0
+
+    def shadow_version(self) -> Optional[str]:
+        """The shadow version if this request is sampled for shadow traffic."""
+        shadow, fraction = self._shadow, self._shadow_fraction
+        if shadow is None or shadow == self._active or self._random.random() >= fraction:
+            return None
+        return shadow
+
+    def unload(self, version: str) -> None:
+        """Unload a version that is neither active nor the shadow."""
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is None:
+                raise KeyError(f"Model version {version} is not loaded")
+            if version in (self._active, self._shadow):
+                raise ValueError(f"Model version {version} is active or the shadow")
+            del self._entries[version]
+            entry.retired = True
+            close_now = entry.leases == 0
+        if close_now:
+            self._close(entry)
+
+    @contextlib.contextmanager
+    def lease(self, version: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """Use a version (the active one by default) for the duration of a request.
+
+        Yields:
+            (version, model)
+
+        Raises:
+            KeyError: If the version is not loaded
+        """
+        with self._lock:
+            version = version or self._active
+            entry = self._entries.get(version) if version else None
+            if entry is None:
+                raise KeyError(f"Model version {version} is not loaded")
+            entry.leases += 1
+            entry.requests += 1
+            entry.last_used = time.monotonic()
+        try:
+            yield entry.version, entry.model
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                close_now = entry.retired and entry.leases == 0
+            if close_now:
+                self._close(entry)
+
+    def _close(self, entry: _ModelEntry, notify: bool = True) -> None:
+        entry.state = 'unloaded'
+        model = entry.model
+        close = getattr(model, 'close', None)
+        try:
+            if close is not None:
+                close()
+        except Exception as e:
+            logger.warning(f"Error closing model version {entry.version}: {e}")
+        entry.model = None
+        logger.info(f"Closed model version {entry.version}")
+        if notify and self.on_unload is not None:
+            self.on_unload(entry.version, model)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the active and shadow versions and every known version."""
+        with self._lock:
+            entries = list(self._entries.values()) + list(self._loading.values()) + \
+                list(self._failed.values())
+            return {
+                'active': self._active,
+                'shadow': self._shadow,
+                'shadow_fraction': self._shadow_fraction,
+                'max_resident': self.max_resident,
+                'versions': [entry.info() for entry in entries]
+            }
+
+    def close(self) -> None:
+        """Close every resident version, e.g. on shutdown."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._active = self._shadow = None
+        for entry in entries:
+            self._close(entry, notify=False)
+
+
+def export_onnx(
+    model_path: str,
+    output_path: str,
+    opset: int = 13,
+    atol: float = 1e-4,
+    num_samples: int = 8
+) -> Dict[str, Any]:
+    """Convert a Keras model to ONNX and verify the outputs match.
+
+    Args:
+        model_path: Path to the saved Keras model
+        output_path: Destination ``.onnx`` path
+        opset: ONNX opset version
+        atol: Maximum allowed absolute difference between the two runtimes
+        num_samples: Number of random inputs used for verification
+
+    Returns:
+        Export report with the measured output difference
+
+    Raises:
+        ValueError: If the exported model's outputs differ by more than ``atol``
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    model = tf.keras.models.load_model(model_path)
+    input_shape = tuple(model.input_shape[1:])
+    signature = (tf.TensorSpec((None,) + input_shape, tf.float32, name='input'),)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Convert the traced forward pass, which works across Keras versions
+    forward = tf.function(lambda images: model(images, training=False))
+    tf2onnx.convert.from_function(
+        forward,
+        input_signature=signature,
+        opset=opset,
+        output_path=str(output_path)
+    )
+    logger.info(f"Exported {model_path} to {output_path}")
+
+    # Verify against the Keras model on the same inputs
+    rng = np.random.default_rng(0)
+    samples = rng.standard_normal((num_samples,) + input_shape).astype(np.float32)
+    expected = model(samples, training=False).numpy()
+    actual = ONNXRuntimeBackend(str(output_path), input_shape=input_shape).predict(samples)
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+
+    report = {
+        'model_path': str(model_path),
+        'onnx_path': str(output_path),
+        'opset': opset,
+        'max_abs_diff': max_abs_diff,
+        'atol': atol,
+        'top1_agreement': float(np.mean(expected.argmax(1) == actual.argmax(1)))
+    }
+
+    if max_abs_diff > atol:
+        output_path.unlink()
+        raise ValueError(
+            f"ONNX outputs differ from Keras by {max_abs_diff:.2e} (atol={atol:.0e}); "
+            f"removed {output_path}"
+        )
+
+    logger.info(f"Verified ONNX export (max abs diff {max_abs_diff:.2e})")
+    return report
+
+
+def export_savedmodel(
+    model_path: str,
+    output_dir: str,
+    atol: float = 1e-5,
+    num_samples: int = 8
+) -> Dict[str, Any]:
+    """Save a Keras model's traced forward pass as a TensorFlow SavedModel.
+
+    Args:
+        model_path: Path to the saved Keras model
+        output_dir: Destination SavedModel directory
+        atol: Maximum allowed absolute difference from the Keras model
+        num_samples: Number of random inputs used for verification
+
+    Returns:
+        Export report with the measured output difference
+
+    Raises:
+        ValueError: If the exported model's outputs differ by more than ``atol``
+    """
+    import shutil
+
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    input_shape = tuple(model.input_shape[1:])
+    signature = tf.TensorSpec((None,) + input_shape, tf.float32, name='input')
+
+    # A plain module tracking the model's variables, which works across
+    # Keras versions
+    module = tf.Module()
+    module.model = model
+    module.serve = tf.function(
+        lambda images: {'probabilities': model(images, training=False)},
+        input_signature=[signature]
+    )
+
+    output_dir = Path(output_dir)
+    tf.saved_model.save(module, str(output_dir), signatures={'serving_default': module.serve})
+    logger.info(f"Exported {model_path} to {output_dir}")
+
+    # Verify against the Keras model on the same inputs
+    rng = np.random.default_rng(0)
+    samples = rng.standard_normal((num_samples,) + input_shape).astype(np.float32)
+    expected = model(samples, training=False).numpy()
+    actual = SavedModelBackend(str(output_dir), input_shape=input_shape).predict(samples)
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+
+    report = {
+        'model_path': str(model_path),
+        'savedmodel_path': str(output_dir),
+        'max_abs_diff': max_abs_diff,
+        'atol': atol,
+        'top1_agreement': float(np.mean(expected.argmax(1) == actual.argmax(1)))
+    }
+
+    if max_abs_diff > atol:
+        shutil.rmtree(output_dir)
+        raise ValueError(
+            f"SavedModel outputs differ from Keras by {max_abs_diff:.2e} (atol={atol:.0e}); "
+            f"removed {output_dir}"
+        )
+
+    logger.info(f"Verified SavedModel export (max abs diff {max_abs_diff:.2e})")
+    return report
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 model export")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser(
+        'export', help="Convert a Keras model to ONNX or a TensorFlow SavedModel"
+    )
+    export.add_argument('model_path', nargs='?', default='models/best_model.h5')
+    export.add_argument('--format', choices=('onnx', 'savedmodel'), default='onnx')
+    export.add_argument('--output', default=None,
+                        help="Defaults to <model>.onnx or the <model>_savedmodel directory")
+    export.add_argument('--opset', type=int, default=13)
+    export.add_argument('--atol', type=float, default=None,
+                        help="Defaults to 1e-4 for ONNX and 1e-5 for SavedModel")
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        model_path = Path(args.model_path)
+        atol = args.atol if args.atol is not None else (1e-5 if args.format == 'savedmodel' else 1e-4)
+        if args.format == 'savedmodel':
+            output = args.output or str(model_path.with_name(f"{model_path.stem}_savedmodel"))
+            report = export_savedmodel(args.model_path, output, atol=atol)
+        else:
+            output = args.output or str(model_path.with_suffix('.onnx'))
+            report = export_onnx(args.model_path, output, opset=args.opset, atol=atol)
+        logger.info(f"Export report: {report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,35 @@ This module handles model inference for medication image classification,
 providing both real-time and batch prediction capabilities.
 """
 
-import tensorflow as tf
 import numpy as np
 from PIL import Image
 from pathlib import Path
-from typing import Union, List, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Union, List, Dict, NamedTuple, Optional, Tuple, Sequence, Any
 import logging
 import json
+import threading
+import time
+
+from src.data.preprocessing import BatchPreprocessor
+
+from .embedding_index import EmbeddingExtractor
+from .explain import GradCAMExplainer
+from .model_loader import InferenceBackend, infer_backend, load_backend
+
+if TYPE_CHECKING:
+    # TensorFlow is imported by the backends and explanations that need it,
+    # so importing the predictor stays fast
+    import tensorflow as tf
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class TopK(NamedTuple):
+    """Unlabeled top-k result of one image, most probable first."""
+    class_ids: np.ndarray
+    probabilities: np.ndarray
+
 class RxPredictor:
     """Handles model inference for medication classification."""
     
@@ -25,7 +42,11 @@ class RxPredictor:
         model_path: str,
         class_map_path: Optional[str] = None,
         target_size: Tuple[int, int] = (224, 224),
-        batch_size: int = 32
+        batch_size: int = 32,
+        use_compiled: bool = True,
+        batch_buckets: Optional[Sequence[int]] = None,
+        backend: Optional[Union[str, InferenceBackend]] = None,
+        backend_options: Optional[Dict[str, Any]] = None
     ):
         """Initialize the predictor.
         
@@ -34,21 +55,57 @@ class RxPredictor:
             class_map_path: Path to class mapping JSON file
             target_size: Input image size (height, width)
             batch_size: Batch size for inference
+            use_compiled: Whether to run the traced fixed-shape fast path
+                instead of ``model.predict`` (TensorFlow backend only)
+            batch_buckets: Padded batch sizes traced by the fast path
+            backend: 'tensorflow', 'savedmodel', 'onnxruntime' or 'tflite'
+                (inferred from the model artifact when omitted), or an
+                already constructed backend such as a ``WorkerPool``
+            backend_options: Extra backend options, e.g. ONNX Runtime
+                ``intra_op_threads`` or ``graph_optimization_level``
         """
         self.model_path = Path(model_path)
-        self.target_size = target_size
+        self.target_size = tuple(target_size)
         self.batch_size = batch_size
+        self.preprocessor = BatchPreprocessor(target_size=self.target_size)
         
-        # Load model
+        # Load model through the execution backend and warm it
         try:
-            self.model = tf.keras.models.load_model(self.model_path)
-            logger.info(f"Loaded model from {model_path}")
+            if isinstance(backend, InferenceBackend):
+                self.backend = backend
+            else:
+                backend = backend or infer_backend(str(self.model_path))
+                options = dict(backend_options or {})
+                if backend == 'tensorflow':
+                    options.setdefault('use_compiled', use_compiled)
+                    options.setdefault('batch_buckets', batch_buckets)
+                self.backend = load_backend(
+                    str(self.model_path),
+                    backend=backend,
+                    input_shape=self.target_size + (3,),
+                    **options
+                )
+            start = time.perf_counter()
+            self.backend.warmup()
+            self.model = self.backend.keras_model
+            # Cold start breakdown; import and load happen in the backend
+            self.timings = {
+                'import_seconds': self.backend.import_seconds,
+                'load_seconds': self.backend.load_seconds - self.backend.import_seconds,
+                'warmup_seconds': time.perf_counter() - start
+            }
+            logger.info(
+                f"Loaded model from {model_path} (import {self.timings['import_seconds']:.2f}s, "
+                f"load {self.timings['load_seconds']:.2f}s, "
+                f"warmup {self.timings['warmup_seconds']:.2f}s)"
+            )
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             raise
         
         # Load class mapping if provided
         self.class_map = None
+        self.labels = None
         if class_map_path:
             try:
                 with open(class_map_path, 'r') as f:
@@ -57,6 +114,141 @@ class RxPredictor:
             except Exception as e:
                 logger.error(f"Error loading class mapping: {e}")
                 raise
+            self.labels = self._build_labels(self.class_map)
+        self.class_ids = (
+            {label: idx for idx, label in enumerate(self.labels.tolist())}
+            if self.labels is not None else {}
+        )
+        
+        # Grad-CAM explainer and embedding extractor, built on first use
+        self._explainer: Optional[GradCAMExplainer] = None
+        self._embedder: Optional[EmbeddingExtractor] = None
+        self._lazy_lock = threading.Lock()
+    
+    @staticmethod
+    def _build_labels(class_map: Dict[str, str]) -> np.ndarray:
+        """Index-to-label array for a class map keyed by class index strings."""
+        size = max(int(idx) for idx in class_map) + 1 if class_map else 0
+        labels = np.array([str(idx) for idx in range(size)], dtype=object)
+        for idx, label in class_map.items():
+            labels[int(idx)] = label
+        return labels
+    
+    def _labels_for(self, num_classes: int) -> np.ndarray:
+        """Labels for ``num_classes`` outputs; unmapped classes use their index."""
+        if self.labels is None or len(self.labels) < num_classes:
+            known = len(self.labels) if self.labels is not None else 0
+            labels = np.array([str(idx) for idx in range(num_classes)], dtype=object)
+            labels[:known] = self.labels
+            self.labels = labels
+            self.class_ids = {label: idx for idx, label in enumerate(labels.tolist())}
+        return self.labels
+    
+    def _forward(self, batch: np.ndarray) -> np.ndarray:
+        """Run the model on a preprocessed batch.
+        
+        Args:
+            batch: Preprocessed images of shape (N, H, W, 3)
+            
+        Returns:
+            Class probabilities of shape (N, num_classes)
+        """
+        return self.backend.predict(batch)
+    
+    @staticmethod
+    def top_k(predictions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Select the ``k`` most probable classes of every row at once.
+        
+        Uses ``argpartition`` over the whole batch and sorts only the
+        selected columns, so the cost grows with the class count rather
+        than with a full sort of it.
+        
+        Args:
+            predictions: Class probabilities of shape (N, num_classes)
+            k: Number of classes to keep per row
+            
+        Returns:
+            Class indices and probabilities of shape (N, k), most probable first
+        """
+        predictions = np.asarray(predictions)
+        k = max(0, min(k, predictions.shape[-1]))
+        if k < predictions.shape[-1]:
+            indices = np.argpartition(-predictions, k - 1, axis=-1)[:, :k]
+        else:
+            indices = np.broadcast_to(np.arange(k), predictions.shape)
+        probabilities = np.take_along_axis(predictions, indices, axis=-1)
+        order = np.argsort(-probabilities, axis=-1, kind='stable')
+        return (
+            np.take_along_axis(indices, order, axis=-1),
+            np.take_along_axis(probabilities, order, axis=-1)
+        )
+    
+    def format_predictions(
+        self,
+        predictions: np.ndarray,
+        return_top_k: int = 1
+    ) -> List[List[Dict[str, Union[str, float]]]]:
+        """Turn class probabilities into labeled top-k results.
+        
+        Args:
+            predictions: Class probabilities of shape (N, num_classes)
+            return_top_k: Number of top predictions to return per image
+            
+        Returns:
+            List of prediction results for each image
+        """
+        indices, probabilities = self.top_k(predictions, return_top_k)
+        labels = self._labels_for(np.shape(predictions)[-1])[indices].tolist()
+        return [
+            [
+                {'class': label, 'probability': probability}
+                for label, probability in zip(row_labels, row_probabilities)
+            ]
+            for row_labels, row_probabilities in zip(labels, probabilities.tolist())
+        ]
+    
+    def topk_results(self, predictions: np.ndarray, return_top_k: int = 1) -> List[TopK]:
+        """Select top-k classes without attaching labels.
+        
+        Each result holds row views of the batch ``top_k`` arrays, so binary
+        responses can be encoded from them with no per-prediction objects;
+        ``label_results`` turns them into labeled results for JSON.
+        
+        Args:
+            predictions: Class probabilities of shape (N, num_classes)
+            return_top_k: Number of top predictions to return per image
+            
+        Returns:
+            One ``TopK`` per image
+        """
+        indices, probabilities = self.top_k(predictions, return_top_k)
+        indices = indices.astype(np.int32, copy=False)
+        probabilities = probabilities.astype(np.float32, copy=False)
+        return [TopK(ids, probs) for ids, probs in zip(indices, probabilities)]
+    
+    def label_results(
+        self,
+        results: Sequence[Optional[TopK]]
+    ) -> List[Optional[List[Dict[str, Union[str, float]]]]]:
+        """Attach class labels to ``topk_results`` output; None stays None."""
+        num_classes = max(
+            (
+                int(np.max(result.class_ids)) + 1
+                for result in results if result is not None and len(result.class_ids)
+            ),
+            default=0
+        )
+        labels = self._labels_for(num_classes)
+        return [
+            None if result is None else [
+                {'class': label, 'probability': probability}
+                for label, probability in zip(
+                    labels[np.asarray(result.class_ids, dtype=np.intp)].tolist(),
+                    np.asarray(result.probabilities).tolist()
+                )
+            ]
+            for result in results
+        ]
     
     def preprocess_image(self, image: Union[str, np.ndarray, Image.Image]) -> np.ndarray:
         """Preprocess a single image for inference.
@@ -65,34 +257,34 @@ class RxPredictor:
             image: Image to preprocess (file path, numpy array, or PIL Image)
             
         Returns:
-            Preprocessed image array
+            Preprocessed float32 image array of shape (1, H, W, 3)
         """
         try:
-            # Load image if path provided
-            if isinstance(image, str):
-                image = Image.open(image)
-            elif isinstance(image, np.ndarray):
-                image = Image.fromarray(image)
+            out = np.empty((1,) + self.target_size + (3,), dtype=np.float32)
+            return self.preprocessor([image], out=out)
             
-            # Resize
-            image = image.resize(self.target_size)
-            
-            # Convert to array and add batch dimension
-            img_array = np.array(image)
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            # Normalize
-            img_array = img_array.astype(np.float32) / 255.0
-            
-            # Apply ImageNet normalization
-            mean = np.array([0.485, 0.456, 0.406])
-            std = np.array([0.229, 0.224, 0.225])
-            img_array = (img_array - mean) / std
+        except Exception as e:
+            logger.error(f"Error preprocessing image: {e}")
+            raise
+    
+    def preprocess_batch(
+        self,
+        images: Sequence[Union[str, np.ndarray, Image.Image]]
+    ) -> np.ndarray:
+        """Preprocess a batch of images into the calling thread's reusable buffer.
+        
+        Args:
+            images: Images to preprocess
             
-            return img_array
+        Returns:
+            Preprocessed float32 array of shape (N, H, W, 3), valid until the
+            same thread preprocesses another batch
+        """
+        try:
+            return self.preprocessor(images)
             
         except Exception as e:
-            logger.error(f"Error preprocessing image: {e}")
+            logger.error(f"Error preprocessing batch: {e}")
             raise
     
     def predict_single(
@@ -111,96 +303,157 @@ class RxPredictor:
         """
         try:
             # Preprocess image
-            processed_image = self.preprocess_image(image)
+            processed_image = self.preprocess_batch([image])
             
             # Make prediction
-            predictions = self.model.predict(processed_image)
+            predictions = self._forward(processed_image)
             
-            # Get top k predictions
-            top_k_indices = np.argsort(predictions[0])[-return_top_k:][::-1]
-            
-            # Format results
-            results = []
-            for idx in top_k_indices:
-                class_label = (
-                    self.class_map[str(idx)]
-                    if self.class_map is not None
-                    else str(idx)
-                )
-                results.append({
-                    'class': class_label,
-                    'probability': float(predictions[0][idx])
-                })
-            
-            return results
+            return self.format_predictions(predictions, return_top_k)[0]
             
         except Exception as e:
             logger.error(f"Error making prediction: {e}")
             raise
     
-    def predict_batch(
+    def predict_tensor(
         self,
-        images: List[Union[str, np.ndarray, Image.Image]],
+        batch: np.ndarray,
         return_top_k: int = 1
     ) -> List[List[Dict[str, Union[str, float]]]]:
-        """Make predictions on a batch of images.
+        """Make predictions on an already preprocessed batch.
         
         Args:
-            images: List of images to classify
+            batch: Preprocessed float32 images of shape (N, H, W, 3)
             return_top_k: Number of top predictions to return per image
             
         Returns:
             List of prediction results for each image
         """
         try:
-            # Preprocess images
-            processed_images = []
-            for image in images:
-                processed_images.append(self.preprocess_image(image))
-            
-            # Stack images into batch
-            batch = np.vstack(processed_images)
-            
             # Make predictions
-            predictions = self.model.predict(batch)
-            
-            # Format results for each image
-            batch_results = []
-            for pred in predictions:
-                # Get top k predictions
-                top_k_indices = np.argsort(pred)[-return_top_k:][::-1]
-                
-                # Format results
-                results = []
-                for idx in top_k_indices:
-                    class_label = (
-                        self.class_map[str(idx)]
-                        if self.class_map is not None
-                        else str(idx)
-                    )
-                    results.append({
-                        'class': class_label,
-                        'probability': float(pred[idx])
-                    })
-                batch_results.append(results)
+            predictions = self._forward(batch)
             
-            return batch_results
+            return self.format_predictions(predictions, return_top_k)
             
         except Exception as e:
             logger.error(f"Error making batch predictions: {e}")
             raise
     
+    def predict_batch(
+        self,
+        images: List[Union[str, np.ndarray, Image.Image]],
+        return_top_k: int = 1
+    ) -> List[List[Dict[str, Union[str, float]]]]:
+        """Make predictions on a batch of images.
+        
+        Args:
+            images: List of images to classify
+            return_top_k: Number of top predictions to return per image
+            
+        Returns:
+            List of prediction results for each image
+        """
+        # Preprocess images straight into one batch buffer
+        batch = self.preprocess_batch(images)
+        return self.predict_tensor(batch, return_top_k=return_top_k)
+    
+    def close(self) -> None:
+        """Release the backend, e.g. when the model version is unloaded."""
+        self.backend.close()
+    
+    def explain(
+        self,
+        images: Sequence[Union[str, np.ndarray, Image.Image]],
+        class_idx: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Union[str, float]]], np.ndarray]:
+        """Predict and explain images in one forward/backward pass.
+        
+        The Grad-CAM explainer is built and traced on first use, then
+        reused for every later call on this model.
+        
+        Args:
+            images: Images to explain
+            class_idx: Class to explain, defaults to each image's predicted class
+            
+        Returns:
+            Top-1 prediction per image and heatmaps of shape (N, h, w)
+        
+        Raises:
+            ValueError: If the backend has no Keras model or ``class_idx``
+                is out of range
+        """
+        explainer = self.explainer
+        batch = self.preprocess_batch(images)
+        probabilities, heatmaps = explainer(batch, class_idx)
+        predictions = [results[0] for results in self.format_predictions(probabilities, 1)]
+        return predictions, heatmaps
+    
+    @property
+    def explainer(self) -> GradCAMExplainer:
+        """Grad-CAM explainer of this model, built on first use.
+        
+        Raises:
+            ValueError: If the backend has no Keras model or it cannot be explained
+        """
+        if self._explainer is None:
+            if self.model is None:
+                raise ValueError(f"The {self.backend.name} backend has no Keras model to explain")
+            with self._lazy_lock:
+                if self._explainer is None:
+                    self._explainer = GradCAMExplainer(self.model, self.target_size + (3,))
+        return self._explainer
+    
+    def embed(
+        self,
+        images: Sequence[Union[str, np.ndarray, Image.Image]],
+        return_top_k: int = 1
+    ) -> Tuple[np.ndarray, List[List[Dict[str, Union[str, float]]]]]:
+        """Penultimate-layer embeddings and predictions in one forward pass.
+        
+        Args:
+            images: Images to embed
+            return_top_k: Number of top predictions to return per image
+            
+        Returns:
+            L2-normalized embeddings of shape (N, dim) and the top-k
+            predictions per image
+        
+        Raises:
+            ValueError: If the backend has no Keras model
+        """
+        embedder = self.embedder
+        batch = self.preprocess_batch(images)
+        embeddings, probabilities = embedder(batch)
+        return embeddings, self.format_predictions(probabilities, return_top_k)
+    
+    @property
+    def embedder(self) -> EmbeddingExtractor:
+        """Embedding extractor of this model, built on first use.
+        
+        Raises:
+            ValueError: If the backend has no Keras model or no embedding layer
+        """
+        if self._embedder is None:
+            if self.model is None:
+                raise ValueError(f"The {self.backend.name} backend has no Keras model to embed with")
+            with self._lazy_lock:
+                if self._embedder is None:
+                    self._embedder = EmbeddingExtractor(self.model, self.target_size + (3,))
+        return self._embedder
+    
     @staticmethod
     def explain_prediction(
         image: Union[str, np.ndarray, Image.Image],
-        model: tf.keras.Model,
+        model: 'tf.keras.Model',
         layer_name: Optional[str] = None,
         class_idx: Optional[int] = None
     ) -> np.ndarray:
         """Generate Grad-CAM visualization for model decision.
         
+        Builds a new explainer on every call; ``explain`` reuses one per
+        model and also returns the prediction.
+        
         Args:
-            image: Input image
+            image: Image path or PIL image, or an already preprocessed array
             model: Model to explain
             layer_name: Name of layer to use for Grad-CAM (defaults to last conv)
             class_idx: Index of class to explain (defaults to predicted class)
@@ -209,50 +462,15 @@ class RxPredictor:
             Heatmap array
         """
         try:
-            # Get last conv layer if not specified
-            if layer_name is None:
-                for layer in reversed(model.layers):
-                    if isinstance(layer, tf.keras.layers.Conv2D):
-                        layer_name = layer.name
-                        break
-            
-            # Get gradient model
-            grad_model = tf.keras.models.Model(
-                [model.inputs],
-                [
-                    model.get_layer(layer_name).output,
-                    model.output
-                ]
-            )
-            
-            # Process image
             if isinstance(image, (str, Image.Image)):
-                image = np.array(Image.open(image) if isinstance(image, str) else image)
-            image = tf.convert_to_tensor(image)
-            image = tf.expand_dims(image, 0)
-            
-            # Generate gradients
-            with tf.GradientTape() as tape:
-                conv_output, predictions = grad_model(image)
-                if class_idx is None:
-                    class_idx = tf.argmax(predictions[0])
-                class_channel = predictions[:, class_idx]
-            
-            # Calculate gradients
-            grads = tape.gradient(class_channel, conv_output)
-            pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-            
-            # Generate heatmap
-            conv_output = conv_output[0]
-            heatmap = tf.reduce_sum(
-                tf.multiply(pooled_grads, conv_output),
-                axis=-1
-            )
+                image = Image.open(image) if isinstance(image, str) else image
+                preprocessor = BatchPreprocessor(target_size=(image.height, image.width))
+                image = preprocessor([image])[0]
+            image = np.asarray(image, dtype=np.float32)
             
-            # Normalize heatmap
-            heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
-            return heatmap.numpy()
+            explainer = GradCAMExplainer(model, image.shape, layer_name=layer_name)
+            return explainer(image[np.newaxis], class_idx)[1][0]
             
         except Exception as e:
             logger.error(f"Error generating explanation: {e}")
-            raise 
\ No newline at end of file
+            raise 
@@ -0,0 +1,314 @@
+"""
+INT8 post-training quantization for RxVision25.
+
+Converts a trained float32 Keras model into a full-integer TFLite artifact,
+calibrated on a sample of ``data/val``, and compares it against the float
+model on a held-out part of the same split. The artifact is only published
+when the top-1 accuracy drop stays within the configured threshold.
+
+Usage:
+    python -m src.inference.quantization models/best_model.h5 \\
+        --val-dir data/val --max-accuracy-drop 0.01
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data.preprocessing import list_labeled_images
+
+from .model_loader import InferenceBackend
+from .predictor import RxPredictor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _iter_batches(
+    predictor: RxPredictor,
+    paths: Sequence[Path],
+    batch_size: int = 32
+) -> Iterator[np.ndarray]:
+    """Yield preprocessed float32 batches for ``paths``."""
+    for start in range(0, len(paths), batch_size):
+        yield predictor.preprocess_batch(paths[start:start + batch_size])
+
+
+def convert_to_int8_tflite(
+    predictor: RxPredictor,
+    calibration_paths: Sequence[Path],
+    output_path: Path
+) -> Path:
+    """Convert the predictor's Keras model to a full-integer TFLite model.
+
+    Weights and activations are quantized to INT8; the model keeps float32
+    inputs and outputs so it can be served with the existing preprocessing.
+
+    Args:
+        predictor: Float predictor wrapping the Keras model
+        calibration_paths: Images used to calibrate activation ranges
+        output_path: Destination ``.tflite`` path
+
+    Returns:
+        Path of the written artifact
+    """
+    import tensorflow as tf
+
+    def representative_dataset():
+        for path in calibration_paths:
+            yield [predictor.preprocess_image(path)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(predictor.model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(converter.convert())
+    logger.info(
+        f"Wrote INT8 TFLite model to {output_path} "
+        f"(calibrated on {len(calibration_paths)} images)"
+    )
+    return output_path
+
+
+def split_calibration(
+    num_images: int,
+    num_calibration: int,
+    num_eval: int,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick disjoint calibration and evaluation indices.
+
+    When the split holds fewer than ``num_calibration + num_eval`` images,
+    both samples shrink proportionally so evaluation stays held out.
+
+    Args:
+        num_images: Number of labeled images available
+        num_calibration: Requested calibration sample size
+        num_eval: Requested evaluation sample size
+        seed: Seed for the shuffle
+
+    Returns:
+        Calibration indices and evaluation indices
+
+    Raises:
+        ValueError: If either sample would be empty
+    """
+    if num_calibration < 1 or num_eval < 1:
+        raise ValueError("Calibration and evaluation samples need at least one image each")
+    requested = num_calibration + num_eval
+    if num_images < requested:
+        num_calibration = int(round(num_images * num_calibration / requested))
+        num_calibration = min(max(num_calibration, 1), num_images - 1)
+        num_eval = num_images - num_calibration
+    if num_calibration < 1 or num_eval < 1:
+        raise ValueError(
+            f"Need at least 2 labeled images for disjoint calibration and "
+            f"evaluation samples, found {num_images}"
+        )
+    order = np.random.default_rng(seed).permutation(num_images)
+    return order[:num_calibration], order[num_calibration:num_calibration + num_eval]
+
+
+def _measure_latency(backend: InferenceBackend, sample: np.ndarray, runs: int = 20) -> float:
+    """Return the median single-image latency of ``backend`` in milliseconds."""
+    backend.predict(sample)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.predict(sample)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000.0)
+
+
+def compare_models(
+    float_predictor: RxPredictor,
+    quant_predictor: RxPredictor,
+    paths: Sequence[Path],
+    labels: Sequence[int],
+    top_k: int = 5
+) -> Dict[str, float]:
+    """Compare quantized predictions with the float model.
+
+    Args:
+        float_predictor: Reference float32 predictor
+        quant_predictor: Predictor serving the quantized artifact
+        paths: Evaluation images
+        labels: Ground-truth class indices for ``paths``
+        top_k: Size of the top-k agreement window
+
+    Returns:
+        Agreement, accuracy and latency metrics
+
+    Raises:
+        ValueError: If ``paths`` is empty
+    """
+    if not paths:
+        raise ValueError("No evaluation images to compare the models on")
+    labels = np.asarray(labels)
+    top1_agree = topk_agree = float_correct = quant_correct = 0
+
+    offset = 0
+    for batch in _iter_batches(float_predictor, paths):
+        float_probs = float_predictor.backend.predict(batch)
+        quant_probs = quant_predictor.backend.predict(batch)
+        batch_labels = labels[offset:offset + len(batch)]
+        offset += len(batch)
+
+        float_top1 = float_probs.argmax(axis=1)
+        quant_top1 = quant_probs.argmax(axis=1)
+        quant_topk = np.argsort(quant_probs, axis=1)[:, -top_k:]
+
+        top1_agree += int(np.sum(float_top1 == quant_top1))
+        topk_agree += int(np.sum(np.any(quant_topk == float_top1[:, None], axis=1)))
+        float_correct += int(np.sum(float_top1 == batch_labels))
+        quant_correct += int(np.sum(quant_top1 == batch_labels))
+
+    n = len(paths)
+    sample = next(_iter_batches(float_predictor, paths[:1]))
+    float_latency = _measure_latency(float_predictor.backend, sample)
+    quant_latency = _measure_latency(quant_predictor.backend, sample)
+
+    return {
+        'num_images': n,
+        'top1_agreement': top1_agree / n,
+        f'top{top_k}_agreement': topk_agree / n,
+        'float_accuracy': float_correct / n,
+        'quantized_accuracy': quant_correct / n,
+        'accuracy_drop': (float_correct - quant_correct) / n,
+        'float_latency_ms': float_latency,
+        'quantized_latency_ms': quant_latency,
+        'latency_speedup': float_latency / quant_latency if quant_latency else None
+    }
+
+
+def quantize_model(
+    model_path: str,
+    val_dir: str = 'data/val',
+    output_path: Optional[str] = None,
+    num_calibration: int = 200,
+    num_eval: int = 500,
+    max_accuracy_drop: float = 0.01,
+    target_size: tuple = (224, 224),
+    seed: int = 0
+) -> Dict[str, Any]:
+    """Quantize a trained model and publish it if it passes the accuracy gate.
+
+    Args:
+        model_path: Path to the trained float32 Keras model
+        val_dir: Labeled split used for calibration and evaluation
+        output_path: Destination ``.tflite`` path, defaults to
+            ``<model>_int8.tflite`` next to the model
+        num_calibration: Number of images used for calibration
+        num_eval: Number of held-out images used for the comparison
+        max_accuracy_drop: Largest allowed top-1 accuracy drop (absolute)
+        target_size: Model input size (height, width)
+        seed: Seed for sampling calibration and evaluation images
+
+    Returns:
+        Quantization report, also written next to the artifact as JSON
+
+    Raises:
+        ValueError: If ``val_dir`` cannot provide disjoint calibration and
+            evaluation samples, or the accuracy drop exceeds
+            ``max_accuracy_drop``
+    """
+    model_path = Path(model_path)
+    output_path = Path(output_path or model_path.with_name(f"{model_path.stem}_int8.tflite"))
+    report_path = output_path.with_suffix('.json')
+    staging_path = output_path.with_name(output_path.name + '.tmp')
+
+    # Disjoint calibration / evaluation samples from the validation split
+    paths, labels, _ = list_labeled_images(val_dir)
+    calibration_idx, eval_idx = split_calibration(len(paths), num_calibration, num_eval, seed)
+    if len(calibration_idx) + len(eval_idx) < num_calibration + num_eval:
+        logger.warning(
+            f"{val_dir} has {len(paths)} images; calibrating on {len(calibration_idx)} "
+            f"and evaluating on {len(eval_idx)}"
+        )
+    calibration_paths: List[Path] = [paths[i] for i in calibration_idx]
+    eval_paths: List[Path] = [paths[i] for i in eval_idx]
+    eval_labels = [labels[i] for i in eval_idx]
+
+    float_predictor = RxPredictor(str(model_path), target_size=target_size)
+    convert_to_int8_tflite(float_predictor, calibration_paths, staging_path)
+
+    try:
+        quant_predictor = RxPredictor(str(staging_path), target_size=target_size, backend='tflite')
+        metrics = compare_models(float_predictor, quant_predictor, eval_paths, eval_labels)
+    except Exception:
+        staging_path.unlink()
+        raise
+
+    float_size = model_path.stat().st_size
+    quant_size = staging_path.stat().st_size
+    passed = metrics['accuracy_drop'] <= max_accuracy_drop
+
+    report = {
+        'model_path': str(model_path),
+        'artifact_path': str(output_path),
+        'num_calibration': len(calibration_paths),
+        'max_accuracy_drop': max_accuracy_drop,
+        'float_size_bytes': float_size,
+        'quantized_size_bytes': quant_size,
+        'size_reduction': float_size / quant_size,
+        'published': passed,
+        **metrics
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    logger.info(
+        f"Top-1 agreement {metrics['top1_agreement']:.3f}, "
+        f"accuracy drop {metrics['accuracy_drop']:.4f}, "
+        f"latency {metrics['float_latency_ms']:.1f} -> {metrics['quantized_latency_ms']:.1f} ms, "
+        f"size {float_size / 1e6:.1f} -> {quant_size / 1e6:.1f} MB"
+    )
+
+    if not passed:
+        staging_path.unlink()
+        raise ValueError(
+            f"Accuracy drop {metrics['accuracy_drop']:.4f} exceeds the allowed "
+            f"{max_accuracy_drop:.4f}; quantized model not published (see {report_path})"
+        )
+
+    os.replace(staging_path, output_path)
+    logger.info(f"Published quantized model to {output_path}")
+    return report
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 INT8 post-training quantization")
+    parser.add_argument('model_path', nargs='?', default='models/best_model.h5')
+    parser.add_argument('--val-dir', default='data/val')
+    parser.add_argument('--output', default=None, help="Defaults to <model>_int8.tflite")
+    parser.add_argument('--num-calibration', type=int, default=200)
+    parser.add_argument('--num-eval', type=int, default=500)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01)
+    parser.add_argument('--img-size', type=int, default=224)
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    quantize_model(
+        args.model_path,
+        val_dir=args.val_dir,
+        output_path=args.output,
+        num_calibration=args.num_calibration,
+        num_eval=args.num_eval,
+        max_accuracy_drop=args.max_accuracy_drop,
+        target_size=(args.img_size, args.img_size),
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    main()
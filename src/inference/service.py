@@ -3,21 +3,61 @@ FastAPI service for RxVision25 model serving.
 
 This module provides a REST API for medication image classification,
 supporting both single image and batch inference requests.
+
+Startup is split so replicas come up quickly: TensorFlow is imported only
+by the backend that needs it, and the model loads and warms in the
+background while ``/health`` already answers. ``/ready`` turns 200 once
+the model can serve, and the import, load and warmup times are logged and
+exported as ``rxvision_startup_seconds``.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import time
+
+# Cold start begins with importing the service and its dependencies
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from starlette.requests import ClientDisconnect
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Dict, Optional, Any, Tuple, Union
 import numpy as np
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+import asyncio
+import contextlib
 import io
 import logging
+import os
 from pathlib import Path
 import json
-import time
+import threading
 
-from .predictor import RxPredictor
+from src.data.preprocessing import ImageTooLargeError, decode_image
+
+from .batching import MicroBatcher
+from .cache import PredictionCache, file_fingerprint
+from .cascade import CascadeBackend
+from .encoding import MEDIA_TYPE as TOPK_MEDIA_TYPE, accepts_binary, encode_topk, stack_topk
+from .executor import InferenceExecutor, OverloadedError
+from .embedding_index import EmbeddingIndex
+from .explain import encode_heatmap
+from .worker_pool import WorkerPool
+from .fetch import ImageFetcher
+from .streaming import MultipartSpool, UploadError, UploadTooLargeError, UploadedFile
+from .metrics import (
+    CONTENT_TYPE,
+    SIZE_BUCKETS,
+    LatencyTracker,
+    MetricsRegistry,
+    RequestMetricsMiddleware,
+    process_memory_bytes
+)
+from .model_loader import ModelRegistry, infer_backend, load_backend
+from .predictor import RxPredictor, TopK
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -45,178 +85,1536 @@ class PredictionResponse(BaseModel):
     predictions: List[Dict[str, Any]]
     inference_time: float
     model_version: str
+    error: Optional[str] = None
+
+class StreamedPrediction(PredictionResponse):
+    """One NDJSON line of a streamed prediction job."""
+    index: int
+    source: str
 
 class BatchPredictionRequest(BaseModel):
     """Model for batch prediction request."""
     image_urls: List[str]
-    return_top_k: Optional[int] = 1
+    return_top_k: int = Field(1, ge=1)
+    model_version: Optional[str] = None
+
+class ModelLoadRequest(BaseModel):
+    """Model for loading a model version."""
+    version: str
+    model_path: str
+    activate: bool = True
+    wait: bool = False
+
+class ShadowRequest(BaseModel):
+    """Model for configuring shadow traffic; no version stops it."""
+    version: Optional[str] = None
+    fraction: float = 1.0
 
 class ExplanationResponse(BaseModel):
-    """Model for explanation response."""
-    heatmap: List[List[float]]
+    """Model for explanation response.
+    
+    The heatmap is row-major uint8 in base64 with shape ``heatmap_shape``;
+    ``src.inference.explain.decode_heatmap`` turns it back into floats.
+    """
+    heatmap: str
+    heatmap_shape: List[int]
     class_predicted: str
     confidence: float
+    error: Optional[str] = None
+
+class RetrievalResponse(BaseModel):
+    """Model for retrieval response.
+    
+    ``neighbors`` are the most similar reference labels with their cosine
+    score and index row; ``predictions`` come from the same forward pass.
+    """
+    neighbors: List[Dict[str, Any]]
+    predictions: List[Dict[str, Any]]
+    inference_time: float
+    model_version: str
+    index_size: int
+
+# Micro-batching configuration
+MAX_BATCH_SIZE = int(os.getenv("RXVISION_MAX_BATCH_SIZE", "32"))
+MAX_BATCH_WAIT_MS = float(os.getenv("RXVISION_MAX_BATCH_WAIT_MS", "5"))
+
+# Model artifact and execution backend ('tensorflow', 'savedmodel', 'onnxruntime'
+# or 'tflite'); a SavedModel directory or ONNX/TFLite file starts fastest
+MODEL_PATH = Path(os.getenv("RXVISION_MODEL_PATH", "models/best_model.h5"))
+MODEL_VERSION = os.getenv("RXVISION_MODEL_VERSION", "1.0.0")
+CLASS_MAP_PATH = Path(os.getenv("RXVISION_CLASS_MAP_PATH", "models/class_map.json"))
+BACKEND = os.getenv("RXVISION_BACKEND") or None
+
+# Set to 0 to fall back to model.predict for comparison
+USE_COMPILED_INFERENCE = os.getenv("RXVISION_COMPILED_INFERENCE", "1") != "0"
+
+# ONNX Runtime session options
+ORT_OPTIONS = {
+    "intra_op_threads": int(os.getenv("RXVISION_ORT_INTRA_OP_THREADS", "0")),
+    "inter_op_threads": int(os.getenv("RXVISION_ORT_INTER_OP_THREADS", "0")),
+    "graph_optimization_level": os.getenv("RXVISION_ORT_GRAPH_OPT_LEVEL", "all")
+}
+
+# Upload limits (encoded bytes and decoded source pixels)
+MAX_UPLOAD_BYTES = int(os.getenv("RXVISION_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("RXVISION_MAX_IMAGE_PIXELS", "50000000"))
+
+# Keep PIL's decompression bomb guard in line with the configured pixel limit
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Every Nth upload is also decoded at full resolution to measure decode savings
+DECODE_BASELINE_EVERY = int(os.getenv("RXVISION_DECODE_BASELINE_EVERY", "100"))
+
+# Prediction cache (0 entries disables it; set a directory to keep results across restarts)
+CACHE_MAX_ENTRIES = int(os.getenv("RXVISION_CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("RXVISION_CACHE_TTL_SECONDS", "3600"))
+CACHE_DIR = os.getenv("RXVISION_CACHE_DIR") or None
+
+# Batch URL fetching
+MAX_BATCH_URLS = int(os.getenv("RXVISION_MAX_BATCH_URLS", "256"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("RXVISION_FETCH_MAX_CONNECTIONS", "64"))
+FETCH_MAX_PER_HOST = int(os.getenv("RXVISION_FETCH_MAX_PER_HOST", "8"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("RXVISION_FETCH_TIMEOUT_SECONDS", "10"))
+# Only for development: lets image URLs point at loopback/private hosts
+FETCH_ALLOW_PRIVATE = os.getenv("RXVISION_FETCH_ALLOW_PRIVATE", "0") == "1"
+
+# Blocking work runs off the event loop on a bounded pool; excess requests get 503
+INFERENCE_WORKERS = int(os.getenv("RXVISION_INFERENCE_WORKERS", "0")) or os.cpu_count() or 1
+INFERENCE_MAX_QUEUE = int(os.getenv("RXVISION_INFERENCE_MAX_QUEUE", "64"))
+MAX_BATCH_QUEUE = int(os.getenv("RXVISION_MAX_BATCH_QUEUE", str(4 * MAX_BATCH_SIZE)))
+
+# Streamed jobs are processed and written out one chunk at a time
+STREAM_CHUNK_SIZE = int(os.getenv("RXVISION_STREAM_CHUNK_SIZE", str(MAX_BATCH_SIZE)))
+MAX_STREAM_ITEMS = int(os.getenv("RXVISION_MAX_STREAM_ITEMS", "10000"))
+STREAM_SPOOL_DIR = os.getenv("RXVISION_STREAM_SPOOL_DIR") or None
+MAX_STREAM_BYTES = int(os.getenv("RXVISION_MAX_STREAM_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Explanations: images per /explain/batch request and longest heatmap side
+MAX_EXPLAIN_BATCH = int(os.getenv("RXVISION_MAX_EXPLAIN_BATCH", "16"))
+HEATMAP_SIZE = int(os.getenv("RXVISION_HEATMAP_SIZE", "32"))
+
+# Optional multi-process serving: forward passes run in pinned worker processes
+INFERENCE_PROCESSES = int(os.getenv("RXVISION_INFERENCE_PROCESSES", "0"))
+WORKER_CORES = int(os.getenv("RXVISION_WORKER_CORES", "0")) or None
+WORKER_INTRA_OP_THREADS = int(os.getenv("RXVISION_WORKER_INTRA_OP_THREADS", "0")) or None
+
+# Optional cascade: a fast screening model answers confident images and the
+# model at RXVISION_MODEL_PATH only sees the ones it escalates
+CASCADE_FAST_MODEL_PATH = os.getenv("RXVISION_CASCADE_FAST_MODEL_PATH") or None
+CASCADE_MIN_CONFIDENCE = float(os.getenv("RXVISION_CASCADE_MIN_CONFIDENCE", "0.9"))
+CASCADE_MIN_MARGIN = float(os.getenv("RXVISION_CASCADE_MIN_MARGIN", "0.0"))
+
+# Per-image input of the models, matching RxPredictor's default target size
+MODEL_INPUT_SHAPE = (224, 224, 3)
+
+# Reference embedding index for /retrieve; retrieval is disabled when unset.
+# Without a trained IVF, or with RXVISION_RETRIEVAL_NPROBE=0, search is exact
+EMBEDDING_INDEX_DIR = os.getenv("RXVISION_EMBEDDING_INDEX_DIR") or None
+RETRIEVAL_NPROBE = int(os.getenv("RXVISION_RETRIEVAL_NPROBE", "8"))
+MAX_REFERENCE_BATCH = int(os.getenv("RXVISION_MAX_REFERENCE_BATCH", str(MAX_BATCH_SIZE)))
+
+# Model versions resident at once; versions loaded at runtime must live under MODEL_ROOT
+MAX_RESIDENT_MODELS = int(os.getenv("RXVISION_MAX_RESIDENT_MODELS", "2"))
+MODEL_ROOT = Path(os.getenv("RXVISION_MODEL_ROOT") or MODEL_PATH.parent)
+
+# Set to 1 to finish loading the model before the server accepts requests
+# instead of reporting readiness on /ready
+WAIT_FOR_MODEL = os.getenv("RXVISION_WAIT_FOR_MODEL", "0") == "1"
 
 # Global variables
-predictor: Optional[RxPredictor] = None
-model_version: str = "1.0.0"
+registry: Optional[ModelRegistry] = None
+batcher: Optional[MicroBatcher] = None
+cache: Optional[PredictionCache] = None
+fetcher: Optional[ImageFetcher] = None
+executor: Optional[InferenceExecutor] = None
+embedding_index: Optional[EmbeddingIndex] = None
+_embedding_index_lock = threading.Lock()
+
+# Cache namespace and model fingerprint of each loaded predictor, and shadow
+# comparisons per version
+_cache_namespaces: Dict[RxPredictor, str] = {}
+_model_fingerprints: Dict[RxPredictor, str] = {}
+_shadow_stats: Dict[str, Dict[str, int]] = {}
+_shadow_tasks = set()
+
+# Cold start breakdown in seconds, completed when the initial model is ready
+startup_timings: Dict[str, Optional[float]] = {"import_seconds": IMPORT_SECONDS}
+startup_error: Optional[str] = None
+
+# Decode metrics (updated from executor threads)
+_decode_stats_lock = threading.Lock()
+decode_latency = LatencyTracker()
+decode_time_saved = LatencyTracker()
+decode_count: int = 0
+rejected_uploads: int = 0
+full_decode_seconds_per_pixel: Optional[float] = None
+
+# Prometheus metrics served at /metrics
+metrics = MetricsRegistry()
+stage_latency = metrics.histogram(
+    "rxvision_stage_duration_seconds",
+    "Time spent in each stage of handling a request",
+    ["stage"]
+)
+request_count = metrics.counter(
+    "rxvision_requests_total", "HTTP requests by path and status", ["path", "status"]
+)
+request_errors = metrics.counter(
+    "rxvision_request_errors_total", "HTTP requests answered with 4xx or 5xx", ["path", "status"]
+)
+request_latency = metrics.histogram(
+    "rxvision_request_duration_seconds", "Total time to answer a request", ["path"]
+)
+batch_sizes = metrics.histogram(
+    "rxvision_batch_size", "Images per forward pass", buckets=SIZE_BUCKETS
+)
+images_processed = metrics.counter(
+    "rxvision_images_total", "Images run through the model"
+)
+model_forward = metrics.histogram(
+    "rxvision_model_forward_seconds_per_image",
+    "Forward pass time per image by model version",
+    ["version"]
+)
+metrics.gauge(
+    "rxvision_model_info",
+    "Active model version and backend (always 1)",
+    lambda: {(registry.active_version, _active().backend.name): 1} if _active() else None,
+    ["version", "backend"]
+)
+metrics.gauge(
+    "rxvision_process_memory_bytes",
+    "Resident memory of the serving process",
+    process_memory_bytes,
+    ["kind"]
+)
+metrics.gauge(
+    "rxvision_queue_depth",
+    "Requests waiting for the executor or the micro-batcher",
+    lambda: {
+        ("executor",): executor.pending if executor else None,
+        ("batcher",): batcher.queue_depth if batcher else None
+    },
+    ["queue"]
+)
+metrics.gauge(
+    "rxvision_cascade_escalation_ratio",
+    "Fraction of images the screening model escalated to the heavy model",
+    lambda: _cascade().escalation_rate() if _cascade() else None
+)
+metrics.gauge(
+    "rxvision_cascade_seconds_saved",
+    "Estimated forward-pass seconds saved compared with the heavy model alone",
+    lambda: _cascade().seconds_saved if _cascade() else None
+)
+metrics.gauge(
+    "rxvision_startup_seconds",
+    "Cold start time by phase; 'ready' is from the service import to the model serving",
+    lambda: {
+        (phase[:-len("_seconds")],): seconds for phase, seconds in startup_timings.items()
+    },
+    ["phase"]
+)
+decode_latency.export_to(stage_latency, "decode")
+
+# Per-image forward latency of each model version, for /models
+_version_latency_lock = threading.Lock()
+version_latency: Dict[str, LatencyTracker] = {}
+
+def _active() -> Optional[RxPredictor]:
+    """The predictor of the active model version, if one is loaded."""
+    return registry.active() if registry else None
+
+def _cascade() -> Optional[CascadeBackend]:
+    """The active version's cascade, if one is configured and loaded."""
+    predictor = _active()
+    if predictor is not None and isinstance(predictor.backend, CascadeBackend):
+        return predictor.backend
+    return None
+
+def _version_latency(version: str) -> LatencyTracker:
+    tracker = version_latency.get(version)
+    if tracker is None:
+        with _version_latency_lock:
+            tracker = version_latency.get(version)
+            if tracker is None:
+                tracker = LatencyTracker()
+                tracker.export_to(model_forward, version)
+                version_latency[version] = tracker
+    return tracker
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """Read an uploaded file, rejecting bodies over MAX_UPLOAD_BYTES."""
+    global rejected_uploads
+    
+    contents = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(contents) > MAX_UPLOAD_BYTES:
+        with _decode_stats_lock:
+            rejected_uploads += 1
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload exceeds the limit of {MAX_UPLOAD_BYTES} bytes"
+        )
+    return contents
+
+def _decode_upload(contents: bytes, target_size: Tuple[int, int]) -> Image.Image:
+    """Decode an upload near the model resolution and record decode metrics."""
+    global rejected_uploads, decode_count, full_decode_seconds_per_pixel
+    
+    with _decode_stats_lock:
+        measure_full_decode = DECODE_BASELINE_EVERY > 0 and decode_count % DECODE_BASELINE_EVERY == 0
+        decode_count += 1
+    
+    try:
+        image, info = decode_image(
+            contents,
+            target_size=target_size,
+            max_pixels=MAX_IMAGE_PIXELS,
+            measure_full_decode=measure_full_decode
+        )
+    except ImageTooLargeError as e:
+        with _decode_stats_lock:
+            rejected_uploads += 1
+        raise HTTPException(status_code=413, detail=str(e))
+    except (UnidentifiedImageError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    
+    decode_latency.observe(info['decode_seconds'])
+    
+    # Estimate the full-resolution decode cost from the sampled baselines
+    source_pixels = info['source_size'][0] * info['source_size'][1]
+    with _decode_stats_lock:
+        if 'full_decode_seconds' in info:
+            per_pixel = info['full_decode_seconds'] / source_pixels
+            full_decode_seconds_per_pixel = (
+                per_pixel if full_decode_seconds_per_pixel is None
+                else 0.9 * full_decode_seconds_per_pixel + 0.1 * per_pixel
+            )
+        per_pixel = full_decode_seconds_per_pixel
+    if per_pixel is not None:
+        decode_time_saved.observe(
+            max(0.0, per_pixel * source_pixels - info['decode_seconds'])
+        )
+    return image
+
+def _run_model(
+    version: str,
+    predictor: RxPredictor,
+    images: List[Any],
+    top_k: int
+) -> List[TopK]:
+    """Preprocess, forward and select top-k of a batch, timing each stage.
+    
+    Results stay unlabeled arrays; labels are only attached for JSON responses.
+    """
+    start = time.perf_counter()
+    batch = predictor.preprocess_batch(images)
+    preprocessed = time.perf_counter()
+    probabilities = predictor.backend.predict(batch)
+    forwarded = time.perf_counter()
+    results = predictor.topk_results(probabilities, top_k)
+    done = time.perf_counter()
+    
+    stage_latency.observe(preprocessed - start, "preprocess")
+    stage_latency.observe(forwarded - preprocessed, "forward")
+    _version_latency(version).observe((forwarded - preprocessed) / len(images))
+    stage_latency.observe(done - forwarded, "postprocess")
+    batch_sizes.observe(len(images))
+    images_processed.inc(amount=len(images))
+    return results
+
+def _json_response(content: Union[BaseModel, List[BaseModel]]) -> Response:
+    """Serialize response models to a JSON response, timing serialization."""
+    start = time.perf_counter()
+    if isinstance(content, list):
+        body = "[" + ",".join(item.json() for item in content) + "]"
+    else:
+        body = content.json()
+    stage_latency.observe(time.perf_counter() - start, "serialize")
+    return Response(content=body, media_type="application/json")
+
+def _as_topk(value: Any) -> Optional[TopK]:
+    """A ``TopK`` from a cached value; the disk tier returns plain lists."""
+    if value is None or isinstance(value, TopK):
+        return value
+    class_ids, probabilities = value
+    return TopK(np.asarray(class_ids, dtype=np.int32), np.asarray(probabilities, dtype=np.float32))
+
+def _binary_response(
+    version: str,
+    results: List[Optional[TopK]],
+    errors: List[Optional[str]],
+    top_k: int,
+    inference_time: float
+) -> Response:
+    """Encode results as packed class ids and probabilities, timing serialization."""
+    start = time.perf_counter()
+    class_ids, probabilities = stack_topk(results, top_k)
+    body = encode_topk(class_ids, probabilities, version, inference_time, errors)
+    stage_latency.observe(time.perf_counter() - start, "serialize")
+    return Response(content=body, media_type=TOPK_MEDIA_TYPE)
+
+def _overloaded(e: OverloadedError) -> HTTPException:
+    """Map a shed request to a fast 503 with a retry hint."""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _decode_and_predict(
+    version: str,
+    predictor: RxPredictor,
+    contents: List[bytes],
+    top_k: int
+) -> Tuple[List[Optional[TopK]], List[Optional[str]]]:
+    """Decode uploads and classify the valid ones in one forward pass.
+    
+    Returns:
+        Per-item top-k results and per-item error messages
+    """
+    predictions: List[Optional[TopK]] = [None] * len(contents)
+    errors: List[Optional[str]] = [None] * len(contents)
+    
+    decoded, images = [], []
+    for i, data in enumerate(contents):
+        try:
+            images.append(_decode_upload(data, predictor.target_size))
+            decoded.append(i)
+        except HTTPException as e:
+            errors[i] = e.detail
+    
+    if images:
+        for i, results in zip(decoded, _run_model(version, predictor, images, top_k)):
+            predictions[i] = results
+    return predictions, errors
+
+def _explain_contents(
+    predictor: RxPredictor,
+    contents: List[bytes],
+    class_idx: Optional[int]
+) -> List[ExplanationResponse]:
+    """Decode uploads and explain the valid ones in one forward/backward pass."""
+    try:
+        explainer = predictor.explainer
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    if class_idx is not None and not 0 <= class_idx < explainer.num_classes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"class_idx must be in [0, {explainer.num_classes}), got {class_idx}"
+        )
+    
+    responses = [
+        ExplanationResponse(heatmap="", heatmap_shape=[0, 0], class_predicted="", confidence=0.0)
+        for _ in contents
+    ]
+    decoded, images = [], []
+    for i, data in enumerate(contents):
+        try:
+            images.append(_decode_upload(data, predictor.target_size))
+            decoded.append(i)
+        except HTTPException as e:
+            responses[i].error = e.detail
+    
+    if images:
+        start = time.perf_counter()
+        predictions, heatmaps = predictor.explain(images, class_idx)
+        stage_latency.observe(time.perf_counter() - start, "explain")
+        for i, prediction, heatmap in zip(decoded, predictions, heatmaps):
+            responses[i] = ExplanationResponse(
+                class_predicted=prediction['class'],
+                confidence=prediction['probability'],
+                **encode_heatmap(heatmap, HEATMAP_SIZE)
+            )
+    return responses
+
+def _model_fingerprint(predictor: RxPredictor) -> str:
+    """Content hash of a predictor's model file, computed once per predictor."""
+    if predictor not in _model_fingerprints:
+        _model_fingerprints[predictor] = file_fingerprint(str(predictor.model_path))
+    return _model_fingerprints[predictor]
+
+def _embed_contents(
+    predictor: RxPredictor,
+    contents: List[bytes],
+    return_top_k: int = 1
+) -> Tuple[Optional[np.ndarray], List[List[Dict[str, Any]]], Dict[int, str]]:
+    """Decode uploads and embed the valid ones in one forward pass.
+    
+    Returns:
+        Embeddings of the decoded uploads (None if none decoded), their
+        predictions, and errors by upload index
+    """
+    try:
+        predictor.embedder
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    images, errors = [], {}
+    for i, data in enumerate(contents):
+        try:
+            images.append(_decode_upload(data, predictor.target_size))
+        except HTTPException as e:
+            errors[i] = e.detail
+    if not images:
+        return None, [], errors
+    
+    start = time.perf_counter()
+    embeddings, predictions = predictor.embed(images, return_top_k)
+    stage_latency.observe(time.perf_counter() - start, "embed")
+    return embeddings, predictions, errors
+
+def _retrieve_contents(
+    predictor: RxPredictor,
+    data: bytes,
+    k: int,
+    return_top_k: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """Embed one upload and look up its nearest reference labels."""
+    index = embedding_index
+    if index is None or len(index) == 0:
+        raise HTTPException(status_code=503, detail="Embedding index is empty; add references first")
+    if index.model_fingerprint != _model_fingerprint(predictor):
+        raise HTTPException(
+            status_code=409,
+            detail="Embedding index was built with a different model; rebuild it for this version"
+        )
+    
+    embeddings, predictions, errors = _embed_contents(predictor, [data], return_top_k)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors[0])
+    
+    start = time.perf_counter()
+    neighbors = index.nearest_labels(embeddings, k, nprobe=RETRIEVAL_NPROBE or None)[0]
+    stage_latency.observe(time.perf_counter() - start, "retrieve")
+    return neighbors, predictions[0], len(index)
+
+def _add_references(
+    predictor: RxPredictor,
+    contents: List[bytes],
+    label: str
+) -> Dict[str, Any]:
+    """Embed uploaded reference images of one label and append them to the index."""
+    global embedding_index
+    
+    embeddings, _, errors = _embed_contents(predictor, contents)
+    fingerprint = _model_fingerprint(predictor)
+    with _embedding_index_lock:
+        if embedding_index is None:
+            embedding_index = EmbeddingIndex.create(
+                EMBEDDING_INDEX_DIR,
+                predictor.embedder.dim,
+                model_fingerprint=fingerprint
+            )
+        elif embedding_index.model_fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=409,
+                detail="Embedding index was built with a different model; rebuild it for this version"
+            )
+    size = len(embedding_index)
+    if embeddings is not None:
+        size = embedding_index.add(embeddings, [label] * len(embeddings))
+    return {
+        "label": label,
+        "added": 0 if embeddings is None else len(embeddings),
+        "index_size": size,
+        "errors": errors
+    }
+
+async def _predict_contents(
+    version: str,
+    predictor: RxPredictor,
+    contents: List[Union[bytes, Exception]],
+    top_k: int
+) -> Tuple[List[Optional[TopK]], List[Optional[str]]]:
+    """Classify downloaded or uploaded images, serving cached results first.
+    
+    Args:
+        version: Model version serving the request
+        predictor: Predictor of that version
+        contents: Encoded images, or the exception that prevented reading one
+        top_k: Number of top predictions per image
+        
+    Returns:
+        Per-item top-k results and per-item error messages
+    """
+    predictions: List[Optional[TopK]] = [None] * len(contents)
+    errors: List[Optional[str]] = [None] * len(contents)
+    keys: List[Optional[str]] = [None] * len(contents)
+    for i, data in enumerate(contents):
+        if isinstance(data, Exception):
+            errors[i] = str(data)
+        elif cache:
+            keys[i] = cache.make_key(data, top_k, _cache_namespaces.get(predictor))
+    
+    # Cache lookups run concurrently; disk-tier reads happen on worker threads
+    valid = [i for i in range(len(contents)) if errors[i] is None]
+    if cache:
+        cached = await asyncio.gather(*(cache.aget(keys[i]) for i in valid))
+        for i, value in zip(valid, cached):
+            predictions[i] = _as_topk(value)
+    pending = [i for i in valid if predictions[i] is None]
+    
+    # Decode the rest and run one batched forward pass off the event loop
+    if pending:
+        batch_predictions, batch_errors = await executor.run(
+            _decode_and_predict, version, predictor, [contents[i] for i in pending], top_k
+        )
+        for i, results, error in zip(pending, batch_predictions, batch_errors):
+            predictions[i], errors[i] = results, error
+        if cache:
+            await asyncio.gather(*(
+                cache.aput(keys[i], predictions[i]) for i in pending if predictions[i] is not None
+            ))
+    return predictions, errors
+
+async def _load_ahead(
+    sources: List[str],
+    load_chunk: Callable[[List[int]], Awaitable[List[Union[bytes, Exception]]]]
+) -> AsyncIterator[Tuple[List[str], List[Union[bytes, Exception]]]]:
+    """Split a job of known size into chunks of ``STREAM_CHUNK_SIZE`` images.
+    
+    Args:
+        sources: Filename or URL of each image, in job order
+        load_chunk: Coroutine function returning the encoded images (or
+            errors) for a list of job indices
+    """
+    for start in range(0, len(sources), STREAM_CHUNK_SIZE):
+        indices = list(range(start, min(start + STREAM_CHUNK_SIZE, len(sources))))
+        yield [sources[i] for i in indices], await load_chunk(indices)
+
+class _UploadStreamingResponse(StreamingResponse):
+    """Streaming response sent while the request body is still being read.
+    
+    ``StreamingResponse`` reads ``receive`` to notice disconnects, which would
+    swallow the body messages of an upload in progress, so this one only
+    starts listening once the upload has been read.
+    """
+    
+    def __init__(self, *args: Any, upload_done: asyncio.Event, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.upload_done = upload_done
+    
+    async def listen_for_disconnect(self, receive: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+        await self.upload_done.wait()
+        await super().listen_for_disconnect(receive)
+
+def _upload_status(e: UploadError) -> int:
+    """HTTP status code of a rejected streamed upload."""
+    return 413 if isinstance(e, UploadTooLargeError) else 400
+
+async def _upload_chunks(
+    spool: MultipartSpool,
+    parts: AsyncIterator[UploadedFile],
+    upload_done: asyncio.Event
+) -> AsyncIterator[Tuple[List[str], List[Union[bytes, Exception]]]]:
+    """Group files of a streamed upload into chunks as they finish uploading.
+    
+    A reader task keeps parsing the body in the background and sets
+    ``upload_done`` when it stops. Each chunk holds whatever files are
+    ready, up to ``STREAM_CHUNK_SIZE``, so early images are classified
+    while later ones are still arriving. At most two chunks of files wait
+    for the model; beyond that the reader stops pulling the body, so a
+    fast client is held back by the connection instead of filling the spool.
+    """
+    ready: asyncio.Queue = asyncio.Queue(maxsize=2 * STREAM_CHUNK_SIZE)
+    
+    async def read() -> None:
+        try:
+            async for upload in parts:
+                await ready.put(upload)
+            await ready.put(None)
+        except ClientDisconnect:
+            await ready.put(None)
+        except Exception as e:
+            await ready.put(e)
+        finally:
+            upload_done.set()
+    
+    reader = asyncio.ensure_future(read())
+    try:
+        done = False
+        while not done:
+            uploads: List[UploadedFile] = []
+            error = None
+            item = await ready.get()
+            while True:
+                if item is None:
+                    done = True
+                    break
+                if isinstance(item, Exception):
+                    error = item
+                    break
+                uploads.append(item)
+                if len(uploads) >= STREAM_CHUNK_SIZE or ready.empty():
+                    break
+                item = ready.get_nowait()
+            if uploads:
+                contents = await asyncio.to_thread(lambda: [spool.read(upload) for upload in uploads])
+                yield [upload.filename for upload in uploads], contents
+            if error is not None:
+                raise error
+    finally:
+        reader.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await reader
+        await parts.aclose()
+
+async def _stream_predictions(
+    chunks: AsyncIterator[Tuple[List[str], List[Union[bytes, Exception]]]],
+    top_k: int,
+    version: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Yield one NDJSON line per image, processing the job chunk by chunk.
+    
+    The next chunk is loaded while the current one runs through the model.
+    Each line is sent before more work starts, so a slow client slows the
+    job down instead of making the server buffer results. The whole job
+    runs on one model version even if another is activated meanwhile.
+    
+    If the job's input fails after the response has started (for example an
+    upload that grows past its size limit), a last line with ``error`` and
+    ``status_code`` ends the stream.
+    
+    Args:
+        chunks: Sources and encoded images (or errors) of each chunk, in job order
+        top_k: Number of top predictions per image
+        version: Model version to pin, the active one by default
+    """
+    next_load = asyncio.ensure_future(chunks.__anext__())
+    index = 0
+    try:
+        with registry.lease(version) as (version, predictor):
+            while True:
+                try:
+                    sources, contents = await next_load
+                except StopAsyncIteration:
+                    next_load = None
+                    break
+                except UploadError as e:
+                    next_load = None
+                    yield json.dumps({"error": str(e), "status_code": _upload_status(e)}) + "\n"
+                    break
+                next_load = asyncio.ensure_future(chunks.__anext__())
+                
+                start_time = time.perf_counter()
+                delay = 0.05
+                while True:
+                    try:
+                        predictions, errors = await _predict_contents(
+                            version, predictor, contents, top_k
+                        )
+                        break
+                    except OverloadedError:
+                        # Bulk jobs back off and yield to interactive traffic
+                        await asyncio.sleep(delay)
+                        delay = min(2 * delay, 1.0)
+                inference_time = time.perf_counter() - start_time
+                labeled = predictor.label_results(predictions)
+                
+                for i, source in enumerate(sources):
+                    yield StreamedPrediction(
+                        index=index,
+                        source=source,
+                        predictions=labeled[i] or [],
+                        inference_time=inference_time,
+                        model_version=version,
+                        error=errors[i]
+                    ).json() + "\n"
+                    index += 1
+    finally:
+        if next_load is not None:
+            next_load.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await next_load
+        await chunks.aclose()
+
+@contextlib.contextmanager
+def _use_model(version: Optional[str] = None) -> Iterator[Tuple[str, RxPredictor]]:
+    """Lease a model version for a request; unknown versions are a 404."""
+    if registry is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    if registry.active_version is None:
+        raise HTTPException(status_code=503, detail=startup_error or "Model is loading")
+    with contextlib.ExitStack() as stack:
+        try:
+            leased = stack.enter_context(registry.lease(version))
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        yield leased
+
+def _resolve_version(version: Optional[str] = None) -> str:
+    """Name of a loaded version, or of the active one; unknown versions are a 404."""
+    with _use_model(version) as (version, _):
+        return version
+
+def _start_shadow(
+    contents: List[Union[bytes, Exception]],
+    top_k: int,
+    primary: List[Optional[TopK]]
+) -> None:
+    """Mirror an unpinned request to the shadow version, off the response path."""
+    version = registry.shadow_version()
+    if version is None:
+        return
+    task = asyncio.ensure_future(_run_shadow(version, contents, top_k, primary))
+    _shadow_tasks.add(task)
+    task.add_done_callback(_shadow_tasks.discard)
+
+async def _run_shadow(
+    version: str,
+    contents: List[Union[bytes, Exception]],
+    top_k: int,
+    primary: List[Optional[TopK]]
+) -> None:
+    """Classify a request with the shadow version and compare top-1 with the primary."""
+    stats = _shadow_stats.setdefault(
+        version, {"requests": 0, "images": 0, "agreements": 0, "skipped": 0, "errors": 0}
+    )
+    stats["requests"] += 1
+    valid = [
+        i for i, data in enumerate(contents)
+        if isinstance(data, bytes) and primary[i] is not None and len(primary[i].class_ids)
+    ]
+    if not valid:
+        return
+    try:
+        with registry.lease(version) as (version, predictor):
+            predictions, _ = await executor.run(
+                _decode_and_predict, version, predictor, [contents[i] for i in valid], top_k
+            )
+    except OverloadedError:
+        # Shadow traffic never competes with live requests for a full queue
+        stats["skipped"] += 1
+        return
+    except Exception as e:
+        stats["errors"] += 1
+        logger.warning(f"Shadow request to model version {version} failed: {e}")
+        return
+    for i, results in zip(valid, predictions):
+        if results is not None and len(results.class_ids):
+            stats["images"] += 1
+            stats["agreements"] += int(results.class_ids[0] == primary[i].class_ids[0])
+
+def _backend_options(model_path: str, backend: Optional[str]) -> Dict[str, Any]:
+    """Service backend settings for a model loaded outside ``RxPredictor``."""
+    backend = backend or infer_backend(model_path)
+    if backend == "onnxruntime":
+        return dict(ORT_OPTIONS)
+    if backend == "tensorflow":
+        return {"use_compiled": USE_COMPILED_INFERENCE}
+    return {}
+
+def _predict_batched(
+    items: List[Tuple[Any, int, str, RxPredictor]]
+) -> List[TopK]:
+    """Run queued (image, return_top_k, version, predictor) requests.
+    
+    Requests for the same model version share one forward pass; during a
+    rollout a batch can hold requests for two versions.
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, (_, _, version, _) in enumerate(items):
+        groups.setdefault(version, []).append(index)
+    
+    results: List[Optional[TopK]] = [None] * len(items)
+    for version, indices in groups.items():
+        predictor = items[indices[0]][3]
+        max_top_k = max(items[i][1] for i in indices)
+        batch_results = _run_model(version, predictor, [items[i][0] for i in indices], max_top_k)
+        for i, item_results in zip(indices, batch_results):
+            k = items[i][1]
+            results[i] = TopK(item_results.class_ids[:k], item_results.probabilities[:k])
+    return results
+
+def _cache_namespace(version: str, model_path: str) -> str:
+    """Cache namespace of a model version; other versions' results are never served."""
+    namespace = f"{version}-{file_fingerprint(model_path)}"
+    if CASCADE_FAST_MODEL_PATH:
+        namespace += (
+            f"-{file_fingerprint(CASCADE_FAST_MODEL_PATH)}"
+            f"-{CASCADE_MIN_CONFIDENCE}-{CASCADE_MIN_MARGIN}"
+        )
+    return namespace
+
+def _load_predictor(version: str, model_path: str) -> RxPredictor:
+    """Load and warm one model version (run on the registry's loader thread)."""
+    use_ort = (BACKEND or infer_backend(model_path)) == "onnxruntime"
+    backend = BACKEND
+    if INFERENCE_PROCESSES > 0:
+        # Worker threads and cores come from the pool's pinning instead
+        options = {"graph_optimization_level": ORT_OPTIONS["graph_optimization_level"]}
+        backend = WorkerPool(
+            model_path,
+            num_workers=INFERENCE_PROCESSES,
+            backend=BACKEND,
+            backend_options=options if use_ort else None,
+            max_batch_size=MAX_BATCH_SIZE,
+            cores_per_worker=WORKER_CORES,
+            intra_op_threads=WORKER_INTRA_OP_THREADS
+        )
+        backend.start()
+    if CASCADE_FAST_MODEL_PATH:
+        heavy = backend if isinstance(backend, WorkerPool) else load_backend(
+            model_path,
+            backend=BACKEND,
+            input_shape=MODEL_INPUT_SHAPE,
+            **_backend_options(model_path, BACKEND)
+        )
+        fast = load_backend(
+            CASCADE_FAST_MODEL_PATH,
+            input_shape=MODEL_INPUT_SHAPE,
+            **_backend_options(CASCADE_FAST_MODEL_PATH, None)
+        )
+        backend = CascadeBackend(
+            fast,
+            heavy,
+            min_confidence=CASCADE_MIN_CONFIDENCE,
+            min_margin=CASCADE_MIN_MARGIN
+        )
+        logger.info(
+            f"Cascade: {CASCADE_FAST_MODEL_PATH} screens, {model_path} handles images "
+            f"below confidence {CASCADE_MIN_CONFIDENCE} or margin {CASCADE_MIN_MARGIN}"
+        )
+    predictor = RxPredictor(
+        model_path=model_path,
+        class_map_path=str(CLASS_MAP_PATH) if CLASS_MAP_PATH.exists() else None,
+        use_compiled=USE_COMPILED_INFERENCE,
+        backend=backend,
+        backend_options=ORT_OPTIONS if use_ort else None
+    )
+    if cache:
+        _cache_namespaces[predictor] = _cache_namespace(version, model_path)
+    return predictor
+
+def _on_model_unloaded(version: str, predictor: RxPredictor) -> None:
+    """Drop the cached results of an unloaded model version."""
+    namespace = _cache_namespaces.pop(predictor, None)
+    _model_fingerprints.pop(predictor, None)
+    if cache and namespace and namespace not in _cache_namespaces.values():
+        # Unloads can run on the event loop when a request releases its
+        # lease; deleting the disk tier must not block it
+        threading.Thread(
+            target=cache.invalidate, args=(namespace,), name="rxvision-cache-invalidate", daemon=True
+        ).start()
+
+def _on_initial_model_loaded(future) -> None:
+    """Record and log the cold start breakdown once the initial model is ready."""
+    global startup_error
+    
+    error = future.exception()
+    if error is not None:
+        startup_error = f"Loading model version {MODEL_VERSION} failed: {error}"
+        logger.error(startup_error)
+        return
+    
+    with registry.lease(future.result()) as (_, predictor):
+        timings = predictor.timings
+    startup_timings.update(
+        model_import_seconds=timings["import_seconds"],
+        model_load_seconds=timings["load_seconds"],
+        warmup_seconds=timings["warmup_seconds"],
+        ready_seconds=time.perf_counter() - _import_started
+    )
+    logger.info(
+        f"Ready after {startup_timings['ready_seconds']:.2f}s: service import "
+        f"{IMPORT_SECONDS:.2f}s, runtime import {timings['import_seconds']:.2f}s, "
+        f"model load {timings['load_seconds']:.2f}s, warmup {timings['warmup_seconds']:.2f}s"
+    )
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize model on startup."""
-    global predictor
+    """Start loading the initial model version and set up request handling."""
+    global registry, batcher, cache, fetcher, executor, embedding_index
     
     try:
-        model_path = Path("models/best_model.h5")
-        class_map_path = Path("models/class_map.json")
+        model_path = MODEL_PATH
         
         if not model_path.exists():
             raise FileNotFoundError(f"Model file not found at {model_path}")
         
-        predictor = RxPredictor(
-            model_path=str(model_path),
-            class_map_path=str(class_map_path) if class_map_path.exists() else None
+        if CACHE_MAX_ENTRIES > 0 or CACHE_DIR:
+            cache = PredictionCache(
+                max_entries=CACHE_MAX_ENTRIES,
+                ttl_seconds=CACHE_TTL_SECONDS,
+                disk_dir=CACHE_DIR
+            )
+            # Results of other model versions, artifacts or cascades are never
+            # served; results left by earlier deployments are dropped
+            await asyncio.to_thread(
+                cache.set_namespace, _cache_namespace(MODEL_VERSION, str(model_path))
+            )
+        
+        registry = ModelRegistry(
+            _load_predictor,
+            max_resident=MAX_RESIDENT_MODELS,
+            on_unload=_on_model_unloaded
+        )
+        # Load and warm in the background; /ready reports when it is done
+        loading = registry.load(MODEL_VERSION, str(model_path))
+        loading.add_done_callback(_on_initial_model_loaded)
+        if WAIT_FOR_MODEL:
+            await asyncio.wrap_future(loading)
+        
+        batcher = MicroBatcher(
+            _predict_batched,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+            max_queue_size=MAX_BATCH_QUEUE
+        )
+        batcher.start()
+        batcher.queue_latency.export_to(stage_latency, "batch_queue")
+        
+        executor = InferenceExecutor(
+            max_workers=INFERENCE_WORKERS,
+            max_queue=INFERENCE_MAX_QUEUE
+        )
+        executor.queue_wait.export_to(stage_latency, "executor_queue")
+        
+        if EMBEDDING_INDEX_DIR:
+            if (Path(EMBEDDING_INDEX_DIR) / "index.json").exists():
+                embedding_index = EmbeddingIndex(EMBEDDING_INDEX_DIR, writable=True)
+                logger.info(f"Opened embedding index: {embedding_index.stats()}")
+            else:
+                logger.warning(
+                    f"No embedding index at {EMBEDDING_INDEX_DIR}; it is created by the "
+                    f"first POST /references"
+                )
+        
+        fetcher = ImageFetcher(
+            max_connections=FETCH_MAX_CONNECTIONS,
+            max_per_host=FETCH_MAX_PER_HOST,
+            timeout=FETCH_TIMEOUT_SECONDS,
+            max_bytes=MAX_UPLOAD_BYTES,
+            allow_private=FETCH_ALLOW_PRIVATE
         )
-        logger.info("Model loaded successfully")
+        await fetcher.start()
         
     except Exception as e:
         logger.error(f"Error loading model: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain the batching queue and close pooled connections on shutdown."""
+    if batcher:
+        batcher.stop(timeout=5.0)
+    if fetcher:
+        await fetcher.close()
+    if executor:
+        executor.shutdown(wait=False)
+    if registry:
+        registry.close()
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness check; answers while the model is still loading."""
     return {
         "status": "healthy",
-        "model_version": model_version
+        "model_version": registry.active_version if registry else None
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check; 503 until the initial model is loaded and warm."""
+    if registry is None or registry.active_version is None:
+        raise HTTPException(status_code=503, detail=startup_error or "Model is loading")
+    return {
+        "status": "ready",
+        "model_version": registry.active_version,
+        "startup": startup_timings
+    }
+
+@app.get("/stats")
+async def stats():
+    """Micro-batching, executor, cache and decode statistics for tuning the service."""
+    if not batcher:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    
+    predictor = _active()
+    return {
+        "batching": batcher.stats(),
+        "executor": executor.stats(),
+        "workers": (
+            predictor.backend.stats()
+            if predictor is not None and isinstance(predictor.backend, WorkerPool) else None
+        ),
+        "cascade": _cascade().stats() if _cascade() else None,
+        "cache": cache.stats() if cache else None,
+        "decode": {
+            "latency": decode_latency.snapshot(),
+            "estimated_time_saved": decode_time_saved.snapshot(),
+            "rejected_uploads": rejected_uploads
+        },
+        "retrieval": (
+            {**embedding_index.stats(), "nprobe": RETRIEVAL_NPROBE} if embedding_index else None
+        ),
+        "startup": startup_timings
     }
 
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(
+    request: Request,
     file: UploadFile = File(...),
-    return_top_k: int = 1
+    return_top_k: int = Query(1, ge=1),
+    model_version: Optional[str] = None
 ):
     """Make prediction on a single image.
     
     Args:
+        request: HTTP request; ``Accept: application/x-rxvision-topk``
+            selects the compact binary encoding
         file: Uploaded image file
         return_top_k: Number of top predictions to return
+        model_version: Loaded version to use instead of the active one
         
     Returns:
         Prediction results and metadata
     """
-    if not predictor:
+    if not batcher or not executor:
         raise HTTPException(status_code=500, detail="Model not loaded")
     
     try:
-        # Read and validate image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Make prediction
-        start_time = time.time()
-        predictions = predictor.predict_single(image, return_top_k=return_top_k)
-        inference_time = time.time() - start_time
+        contents = await _read_upload(file)
         
-        return PredictionResponse(
-            predictions=predictions,
-            inference_time=inference_time,
-            model_version=model_version
-        )
+        with _use_model(model_version) as (version, predictor):
+            async def compute():
+                # Decode near the model resolution off the event loop, then
+                # batch with concurrent requests
+                image = await executor.run(_decode_upload, contents, predictor.target_size)
+                return await asyncio.wrap_future(
+                    batcher.submit((image, return_top_k, version, predictor))
+                )
+            
+            # Identical images share a cached or in-flight result
+            start_time = time.perf_counter()
+            if cache:
+                predictions = _as_topk(await cache.get_or_compute(
+                    cache.make_key(contents, return_top_k, _cache_namespaces.get(predictor)),
+                    compute
+                ))
+            else:
+                predictions = await compute()
+            inference_time = time.perf_counter() - start_time
+            
+            if model_version is None:
+                _start_shadow([contents], return_top_k, [predictions])
+            if accepts_binary(request.headers.get("accept")):
+                return _binary_response(
+                    version, [predictions], [None], return_top_k, inference_time
+                )
+            return _json_response(PredictionResponse(
+                predictions=predictor.label_results([predictions])[0],
+                inference_time=inference_time,
+                model_version=version
+            ))
         
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/predict/batch", response_model=List[PredictionResponse])
-async def predict_batch(request: BatchPredictionRequest):
+async def predict_batch(request: BatchPredictionRequest, http_request: Request):
     """Make predictions on multiple images.
     
     Args:
         request: Batch prediction request
+        http_request: HTTP request; ``Accept: application/x-rxvision-topk``
+            selects the compact binary encoding
         
     Returns:
         List of prediction results
     """
-    if not predictor:
+    if not fetcher or not executor:
         raise HTTPException(status_code=500, detail="Model not loaded")
+    if len(request.image_urls) > MAX_BATCH_URLS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(request.image_urls)} URLs exceeds the limit of {MAX_BATCH_URLS}"
+        )
     
     try:
-        # Process each image
-        results = []
-        for url in request.image_urls:
-            # Download and process image
-            # Note: In production, use async download
-            start_time = time.time()
-            predictions = predictor.predict_single(url, return_top_k=request.return_top_k)
-            inference_time = time.time() - start_time
+        with _use_model(request.model_version) as (version, predictor):
+            start_time = time.perf_counter()
+            top_k = request.return_top_k
+            
+            # Download all images concurrently through the shared pool
+            downloads = await fetcher.fetch_many(request.image_urls)
+            
+            # Failures are reported per item
+            predictions, errors = await _predict_contents(version, predictor, downloads, top_k)
             
-            results.append(
+            inference_time = time.perf_counter() - start_time
+            if request.model_version is None:
+                _start_shadow(downloads, top_k, predictions)
+            if accepts_binary(http_request.headers.get("accept")):
+                return _binary_response(version, predictions, errors, top_k, inference_time)
+            labeled = predictor.label_results(predictions)
+            return _json_response([
                 PredictionResponse(
-                    predictions=predictions,
+                    predictions=labeled[i] or [],
                     inference_time=inference_time,
-                    model_version=model_version
+                    model_version=version,
+                    error=errors[i]
                 )
-            )
-        
-        return results
+                for i in range(len(downloads))
+            ])
         
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error processing batch request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/predict/stream")
+async def predict_stream(
+    request: Request,
+    return_top_k: int = Query(1, ge=1),
+    model_version: Optional[str] = None
+):
+    """Stream predictions for a multipart upload of many images.
+    
+    Images are sent in the ``files`` form field. Each file is spooled to
+    disk as it arrives, and results start streaming while the rest of the
+    upload is still being received. Limit violations found before the
+    response starts are a 400 or 413; later ones end the stream with an
+    ``error`` line carrying the ``status_code``.
+    
+    Args:
+        request: Multipart request with one or more ``files`` parts
+        return_top_k: Number of top predictions per image
+        model_version: Loaded version to use instead of the active one
+        
+    Returns:
+        NDJSON stream with one ``StreamedPrediction`` per image, in upload order
+    """
+    if not executor:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    version = _resolve_version(model_version)
+    
+    spool = MultipartSpool(
+        max_files=MAX_STREAM_ITEMS,
+        max_bytes=MAX_UPLOAD_BYTES,
+        max_total_bytes=MAX_STREAM_BYTES,
+        spool_dir=STREAM_SPOOL_DIR
+    )
+    try:
+        spool.check_request(
+            request.headers.get("content-type"), request.headers.get("content-length")
+        )
+    except UploadError as e:
+        spool.close()
+        raise HTTPException(status_code=_upload_status(e), detail=str(e))
+    
+    upload_done = asyncio.Event()
+    chunks = _upload_chunks(spool, spool.parts(request.stream()), upload_done)
+    return _UploadStreamingResponse(
+        _stream_predictions(chunks, return_top_k, version),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(spool.close),
+        upload_done=upload_done
+    )
+
+@app.post("/predict/batch/stream")
+async def predict_batch_stream(request: BatchPredictionRequest):
+    """Stream predictions for a large list of image URLs.
+    
+    URLs are downloaded one chunk ahead of the chunk being classified.
+    
+    Args:
+        request: Batch prediction request
+        
+    Returns:
+        NDJSON stream with one ``StreamedPrediction`` per URL, in request order
+    """
+    if not fetcher or not executor:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    version = _resolve_version(request.model_version)
+    if len(request.image_urls) > MAX_STREAM_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Job of {len(request.image_urls)} URLs exceeds the limit of {MAX_STREAM_ITEMS}"
+        )
+    
+    urls = request.image_urls
+    
+    async def load_chunk(indices: List[int]) -> List[Union[bytes, Exception]]:
+        return await fetcher.fetch_many([urls[i] for i in indices])
+    
+    return StreamingResponse(
+        _stream_predictions(_load_ahead(urls, load_chunk), request.return_top_k, version),
+        media_type="application/x-ndjson"
+    )
+
 @app.post("/explain", response_model=ExplanationResponse)
 async def explain(
     file: UploadFile = File(...),
-    class_idx: Optional[int] = None
+    class_idx: Optional[int] = None,
+    model_version: Optional[str] = None
 ):
     """Generate explanation for model prediction.
     
     Args:
         file: Uploaded image file
         class_idx: Optional class index to explain
+        model_version: Loaded version to use instead of the active one
         
     Returns:
         Grad-CAM heatmap and prediction details
     """
-    if not predictor:
+    responses = await _explain_uploads([file], class_idx, model_version)
+    if responses[0].error:
+        raise HTTPException(status_code=400, detail=responses[0].error)
+    return responses[0]
+
+@app.post("/explain/batch", response_model=List[ExplanationResponse])
+async def explain_batch(
+    files: List[UploadFile] = File(...),
+    class_idx: Optional[int] = None,
+    model_version: Optional[str] = None
+):
+    """Explain up to ``RXVISION_MAX_EXPLAIN_BATCH`` uploaded images in one pass.
+    
+    Args:
+        files: Uploaded image files
+        class_idx: Optional class index to explain for every image
+        model_version: Loaded version to use instead of the active one
+        
+    Returns:
+        One explanation per file, in upload order; failures are reported per item
+    """
+    if len(files) > MAX_EXPLAIN_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(files)} images exceeds the limit of {MAX_EXPLAIN_BATCH}"
+        )
+    return await _explain_uploads(files, class_idx, model_version)
+
+async def _explain_uploads(
+    files: List[UploadFile],
+    class_idx: Optional[int],
+    model_version: Optional[str]
+) -> List[ExplanationResponse]:
+    if not executor:
         raise HTTPException(status_code=500, detail="Model not loaded")
     
     try:
-        # Read and validate image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        contents = [await _read_upload(file) for file in files]
+        with _use_model(model_version) as (_, predictor):
+            return await executor.run(_explain_contents, predictor, contents, class_idx)
         
-        # Make prediction first
-        prediction = predictor.predict_single(image)[0]
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error generating explanation: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/retrieve", response_model=RetrievalResponse)
+async def retrieve(
+    file: UploadFile = File(...),
+    k: int = Query(5, ge=1),
+    return_top_k: int = Query(1, ge=1),
+    model_version: Optional[str] = None
+):
+    """Find the reference labels whose images are most similar to an upload.
+    
+    Unlike /predict, this covers NDCs added with /references after the
+    model was trained.
+    
+    Args:
+        file: Uploaded image file
+        k: Number of distinct reference labels to return
+        return_top_k: Number of classifier predictions to return
+        model_version: Loaded version to use instead of the active one
         
-        # Generate explanation
-        heatmap = predictor.explain_prediction(
-            image,
-            predictor.model,
-            class_idx=class_idx
+    Returns:
+        Nearest reference labels and the classifier's predictions
+    """
+    if not executor:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    if not EMBEDDING_INDEX_DIR:
+        raise HTTPException(
+            status_code=501, detail="Retrieval is disabled; set RXVISION_EMBEDDING_INDEX_DIR"
         )
+    
+    try:
+        start_time = time.perf_counter()
+        contents = await _read_upload(file)
+        with _use_model(model_version) as (version, predictor):
+            neighbors, predictions, size = await executor.run(
+                _retrieve_contents, predictor, contents, k, return_top_k
+            )
+        return RetrievalResponse(
+            neighbors=neighbors,
+            predictions=predictions,
+            inference_time=time.perf_counter() - start_time,
+            model_version=version,
+            index_size=size
+        )
+        
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error during retrieval: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/references")
+async def add_references(
+    label: str,
+    files: List[UploadFile] = File(...),
+    model_version: Optional[str] = None
+):
+    """Add reference images of one label (NDC) to the embedding index.
+    
+    The label becomes retrievable immediately, without retraining.
+    
+    Args:
+        label: Label of every uploaded image
+        files: Up to ``RXVISION_MAX_REFERENCE_BATCH`` reference images
+        model_version: Loaded version to embed with instead of the active one
         
-        return ExplanationResponse(
-            heatmap=heatmap.tolist(),
-            class_predicted=prediction['class'],
-            confidence=prediction['probability']
+    Returns:
+        Number of references added, the index size and per-file errors
+    """
+    if not executor:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    if not EMBEDDING_INDEX_DIR:
+        raise HTTPException(
+            status_code=501, detail="Retrieval is disabled; set RXVISION_EMBEDDING_INDEX_DIR"
         )
+    if len(files) > MAX_REFERENCE_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(files)} images exceeds the limit of {MAX_REFERENCE_BATCH}"
+        )
+    
+    try:
+        contents = [await _read_upload(file) for file in files]
+        with _use_model(model_version) as (_, predictor):
+            return await executor.run(_add_references, predictor, contents, label)
         
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
-        logger.error(f"Error generating explanation: {e}")
+        logger.error(f"Error adding references: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage latency histograms, request counters and gauges for Prometheus."""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
 @app.get("/model/info")
-async def model_info():
-    """Get model information."""
-    if not predictor:
+async def model_info(model_version: Optional[str] = None):
+    """Get information about the active (or a pinned) model version."""
+    with _use_model(model_version) as (version, predictor):
+        return {
+            "version": version,
+            "framework": predictor.backend.name,
+            "input_shape": predictor.target_size,
+            "num_classes": len(predictor.class_map) if predictor.class_map else None,
+            # In class id order, as referenced by binary top-k responses
+            "class_labels": predictor.labels.tolist() if predictor.class_map else None
+        }
+
+@app.get("/models")
+async def list_models():
+    """Resident model versions, their per-image latency and shadow comparisons."""
+    if not registry:
         raise HTTPException(status_code=500, detail="Model not loaded")
     
-    return {
-        "version": model_version,
-        "framework": "tensorflow",
-        "input_shape": predictor.target_size,
-        "num_classes": len(predictor.class_map) if predictor.class_map else None,
-        "class_labels": list(predictor.class_map.values()) if predictor.class_map else None
-    } 
\ No newline at end of file
+    info = registry.stats()
+    for entry in info["versions"]:
+        tracker = version_latency.get(entry["version"])
+        entry["forward_latency_per_image"] = tracker.snapshot() if tracker else None
+        shadow = _shadow_stats.get(entry["version"])
+        if shadow:
+            entry["shadow"] = dict(
+                shadow,
+                top1_agreement=shadow["agreements"] / shadow["images"] if shadow["images"] else None
+            )
+    return info
+
+@app.post("/models", status_code=202)
+async def load_model(request: ModelLoadRequest):
+    """Load and warm a model version in the background, then optionally activate it.
+    
+    The current version keeps serving until the new one is ready. With
+    ``wait`` the response is sent once loading finished.
+    """
+    if not registry:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    
+    model_path = Path(request.model_path)
+    if not model_path.resolve().is_relative_to(MODEL_ROOT.resolve()):
+        raise HTTPException(status_code=400, detail=f"Models must be under {MODEL_ROOT}")
+    if not model_path.exists():
+        raise HTTPException(status_code=404, detail=f"Model file not found at {model_path}")
+    
+    try:
+        future = registry.load(request.version, str(model_path), activate=request.activate)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if request.wait:
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Loading {request.version} failed: {e}")
+        return {"version": request.version, "state": "ready", "active": registry.active_version}
+    return {"version": request.version, "state": "loading", "active": registry.active_version}
+
+@app.post("/models/shadow")
+async def set_shadow(request: ShadowRequest):
+    """Mirror a fraction of unpinned traffic to a loaded version, or stop."""
+    if not registry:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    try:
+        registry.set_shadow(request.version, request.fraction)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"shadow": request.version, "fraction": request.fraction if request.version else 0.0}
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str):
+    """Switch unpinned traffic to a loaded version."""
+    if not registry:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    try:
+        registry.activate(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"active": version}
+
+@app.delete("/models/{version}")
+async def unload_model(version: str):
+    """Unload a version once its in-flight requests finish."""
+    if not registry:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    try:
+        registry.unload(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"unloaded": version}
+
+# Added after the routes so their paths are known; other paths share one label
+app.add_middleware(
+    RequestMetricsMiddleware,
+    requests=request_count,
+    errors=request_errors,
+    duration=request_latency,
+    body_read=stage_latency,
+    body_read_labels=("body_read",),
+    known_paths=[route.path for route in app.routes]
+)
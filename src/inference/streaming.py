@@ -0,0 +1,231 @@
+"""
+Multipart spooling for streamed RxVision25 prediction jobs.
+
+Starlette's form parser keeps up to 1 MB of every uploaded file in memory,
+so a multipart job with thousands of pill photos would sit almost entirely
+in RAM. ``MultipartSpool`` parses the request body incrementally and writes
+each file straight to a temporary directory, enforcing the per-file size,
+total size and file-count limits while reading. Parsing and file writes run
+on a worker thread, and each file is handed out as soon as its part ends,
+so the streaming endpoint classifies early images while later ones are
+still uploading.
+"""
+
+import asyncio
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class UploadError(ValueError):
+    """Raised when a streamed upload is malformed."""
+
+
+class UploadTooLargeError(UploadError):
+    """Raised when a streamed upload exceeds its size or file-count limits."""
+
+
+class UploadedFile:
+    """A spooled file from a multipart upload."""
+
+    __slots__ = ('filename', 'path', 'size', 'error')
+
+    def __init__(self, filename: str, path: Path):
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self.error: Optional[str] = None
+
+
+class MultipartSpool:
+    """Spools the files of a multipart upload to a temporary directory."""
+
+    def __init__(
+        self,
+        field_name: str = 'files',
+        max_files: int = 10000,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_total_bytes: int = 2 * 1024 * 1024 * 1024,
+        spool_dir: Optional[str] = None
+    ):
+        """Initialize the spool.
+
+        Args:
+            field_name: Form field holding the images
+            max_files: Maximum number of files accepted in one upload
+            max_bytes: Maximum size of a single file; larger files are
+                recorded with an error instead of being kept
+            max_total_bytes: Maximum size of the whole request body
+            spool_dir: Parent directory for the temporary files, defaults to
+                the system temporary directory
+        """
+        self.field_name = field_name
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+        self.files: List[UploadedFile] = []
+        self._dir = Path(tempfile.mkdtemp(prefix='rxvision-upload-', dir=spool_dir))
+
+        # Parser state for the part being read
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._current: Optional[UploadedFile] = None
+        self._handle = None
+        self._boundary: Optional[bytes] = None
+
+    def check_request(self, content_type: Optional[str], content_length: Optional[str] = None) -> None:
+        """Validate the request headers before any of the body is read.
+
+        Args:
+            content_type: The request's Content-Type header
+            content_length: The request's Content-Length header, if sent
+
+        Raises:
+            UploadError: If the body is not multipart
+            UploadTooLargeError: If the declared length exceeds ``max_total_bytes``
+        """
+        media_type, params = parse_options_header(content_type or '')
+        boundary = params.get(b'boundary')
+        if media_type != b'multipart/form-data' or not boundary:
+            raise UploadError("Expected a multipart/form-data upload with a boundary")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_total_bytes:
+            raise UploadTooLargeError(f"Upload exceeds the limit of {self.max_total_bytes} bytes")
+        self._boundary = boundary
+
+    async def parts(self, stream: AsyncIterator[bytes]) -> AsyncIterator[UploadedFile]:
+        """Parse a multipart request body, yielding each file once it is spooled.
+
+        ``check_request`` must have accepted the request first.
+
+        Args:
+            stream: Request body chunks
+
+        Raises:
+            UploadError: If the body is not valid multipart
+            UploadTooLargeError: If the body exceeds ``max_total_bytes`` or
+                holds more than ``max_files`` files
+        """
+        if self._boundary is None:
+            raise UploadError("Request headers were not checked")
+
+        parser = MultipartParser(self._boundary, callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end
+        })
+        yielded = 0
+        try:
+            async for chunk in stream:
+                self.total_bytes += len(chunk)
+                if self.total_bytes > self.max_total_bytes:
+                    raise UploadTooLargeError(
+                        f"Upload exceeds the limit of {self.max_total_bytes} bytes"
+                    )
+                # Parser callbacks write to disk, so keep them off the event loop
+                await asyncio.to_thread(self._write, parser, chunk)
+                while yielded < len(self.files):
+                    yield self.files[yielded]
+                    yielded += 1
+            await asyncio.to_thread(parser.finalize)
+            while yielded < len(self.files):
+                yield self.files[yielded]
+                yielded += 1
+        finally:
+            self._close_handle()
+
+        logger.info(f"Spooled {len(self.files)} uploaded files to {self._dir}")
+
+    @staticmethod
+    def _write(parser: MultipartParser, chunk: bytes) -> None:
+        try:
+            parser.write(chunk)
+        except MultipartParseError as e:
+            raise UploadError(f"Malformed multipart body: {e}")
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[UploadedFile]:
+        return iter(self.files)
+
+    def read(self, upload: UploadedFile) -> Union[bytes, Exception]:
+        """Return a spooled file's bytes, or the error recorded for it.
+
+        The file is deleted once read, so the spool only holds files that
+        have not been handed to the model yet.
+        """
+        if upload.error is not None:
+            return ValueError(upload.error)
+        data = upload.path.read_bytes()
+        upload.path.unlink(missing_ok=True)
+        return data
+
+    def close(self) -> None:
+        """Delete the spooled files."""
+        self._close_handle()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _close_handle(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._current = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if options.get(b'name', b'').decode('latin-1') != self.field_name or b'filename' not in options:
+            return
+        if len(self.files) >= self.max_files:
+            raise UploadTooLargeError(f"Upload exceeds the limit of {self.max_files} files")
+
+        filename = options[b'filename'].decode('utf-8', errors='replace')
+        self._current = UploadedFile(filename, self._dir / f"{len(self.files):06d}")
+        self._handle = open(self._current.path, 'wb')
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        upload = self._current
+        if upload is None or upload.error is not None:
+            return
+        upload.size += end - start
+        if upload.size > self.max_bytes:
+            # Keep the entry so the client gets a per-file error line
+            upload.error = f"Upload exceeds the limit of {self.max_bytes} bytes"
+            self._close_handle()
+            upload.path.unlink(missing_ok=True)
+            return
+        self._handle.write(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._current is not None:
+            self._close_handle()
+            self.files.append(self._current)
+            self._current = None
@@ -0,0 +1,603 @@
+"""
+Multi-process inference worker pool for RxVision25.
+
+One Python process cannot keep a large CPU host busy: the GIL serializes
+request handling and each runtime sizes its thread pools for the whole
+machine. ``WorkerPool`` runs N inference worker processes instead, each
+pinned to its own subset of cores with its own intra-op thread count. The
+front-end copies preprocessed batches into a per-worker shared-memory ring
+buffer and sends only the slot index over a queue, so image tensors are
+never pickled; only the small probability arrays travel back.
+
+The pool implements the ``InferenceBackend`` interface and can be handed to
+``RxPredictor`` in place of an in-process backend.
+
+Usage:
+    python -m src.inference.worker_pool benchmark models/best_model.onnx \\
+        --workers 1 2 4 --batch-size 32 --duration 20
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .executor import OverloadedError
+from .model_loader import InferenceBackend, infer_backend, load_backend
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _configure_threads(backend: str, threads: int, options: Dict[str, Any]) -> None:
+    """Limit a worker's runtime to ``threads`` intra-op threads."""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    if backend == 'tensorflow':
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    elif backend == 'onnxruntime':
+        options.setdefault('intra_op_threads', threads)
+        options.setdefault('inter_op_threads', 1)
+    elif backend == 'tflite':
+        options.setdefault('num_threads', threads)
+
+
+def _worker_main(
+    worker_id: int,
+    model_path: str,
+    backend: str,
+    backend_options: Dict[str, Any],
+    input_shape: Tuple[int, ...],
+    shm_name: str,
+    num_slots: int,
+    max_batch_size: int,
+    cores: Optional[Sequence[int]],
+    intra_op_threads: int,
+    requests: 'mp.Queue',
+    results: 'mp.Queue'
+) -> None:
+    """Entry point of an inference worker process."""
+    shm = None
+    try:
+        if cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+
+        options = dict(backend_options)
+        _configure_threads(backend, intra_op_threads, options)
+        model = load_backend(model_path, backend=backend, input_shape=input_shape, **options)
+        model.warmup()
+
+        shm = shared_memory.SharedMemory(name=shm_name)
+        ring = np.ndarray(
+            (num_slots, max_batch_size) + tuple(input_shape),
+            dtype=np.float32,
+            buffer=shm.buf
+        )
+    except Exception as e:
+        results.put(('ready', worker_id, f"{type(e).__name__}: {e}"))
+        return
+
+    results.put(('ready', worker_id, None))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, slot, n = message
+        try:
+            outputs = np.asarray(model.predict(ring[slot, :n]), dtype=np.float32)
+            results.put(('result', request_id, worker_id, slot, outputs, None))
+        except Exception as e:
+            results.put(('result', request_id, worker_id, slot, None, f"{type(e).__name__}: {e}"))
+
+    # Drop the ndarray view before closing the mapping
+    del ring
+    shm.close()
+
+
+class _Worker:
+    """Parent-side handle of one worker process and its ring buffer."""
+
+    def __init__(self, worker_id: int, shm: shared_memory.SharedMemory, ring: np.ndarray):
+        self.worker_id = worker_id
+        self.shm = shm
+        self.ring = ring
+        self.requests: Optional['mp.Queue'] = None
+        self.process: Optional[mp.process.BaseProcess] = None
+        self.ready = False
+        self.failed = False
+        self.restarts = 0
+        # Bumped on every respawn so stale submitters and results are ignored
+        self.generation = 0
+        self.inflight = 0
+        self.completed = 0
+        self.reset_slots()
+
+    def reset_slots(self) -> None:
+        """Mark every ring slot free again."""
+        self.free_slots: 'queue.Queue[Optional[int]]' = queue.Queue()
+        for slot in range(len(self.ring)):
+            self.free_slots.put(slot)
+
+    @property
+    def available(self) -> bool:
+        """Whether the worker is loaded, alive and can take batches."""
+        return self.ready and self.process is not None and self.process.is_alive()
+
+
+class WorkerPool(InferenceBackend):
+    """Runs forward passes in worker processes fed through shared memory."""
+
+    name = 'worker_pool'
+
+    def __init__(
+        self,
+        model_path: str,
+        input_shape: Tuple[int, ...] = (224, 224, 3),
+        num_workers: Optional[int] = None,
+        backend: Optional[str] = None,
+        backend_options: Optional[Dict[str, Any]] = None,
+        max_batch_size: int = 32,
+        slots_per_worker: int = 2,
+        cores_per_worker: Optional[int] = None,
+        intra_op_threads: Optional[int] = None,
+        start_timeout: float = 300.0,
+        slot_timeout: float = 30.0,
+        max_restarts: int = 3
+    ):
+        """Initialize the pool.
+
+        Args:
+            model_path: Path to the model artifact
+            input_shape: Per-image input shape (H, W, C)
+            num_workers: Worker processes, defaults to one per 4 available cores
+            backend: Backend run inside each worker; inferred from the file
+                extension when omitted
+            backend_options: Extra backend options passed to every worker
+            max_batch_size: Largest batch a ring slot holds; bigger batches
+                are split across workers
+            slots_per_worker: Ring slots per worker, i.e. batches that can be
+                queued for a worker while it runs one
+            cores_per_worker: Cores each worker is pinned to, defaults to an
+                even split of the available cores
+            intra_op_threads: Intra-op threads per worker, defaults to
+                ``cores_per_worker``
+            start_timeout: Seconds to wait for the workers to load the model
+            slot_timeout: Seconds ``submit`` waits for a free ring slot before
+                shedding the batch with ``OverloadedError``
+            max_restarts: Times a worker that died is respawned before it is
+                taken out of rotation
+        """
+        super().__init__(model_path, input_shape)
+
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else \
+            list(range(os.cpu_count() or 1))
+        self.num_workers = num_workers or max(1, len(available) // 4)
+        self.backend = backend or infer_backend(str(model_path))
+        self.backend_options = dict(backend_options or {})
+        self.max_batch_size = max_batch_size
+        self.slots_per_worker = slots_per_worker
+        self.cores_per_worker = cores_per_worker or max(1, len(available) // self.num_workers)
+        self.intra_op_threads = intra_op_threads or self.cores_per_worker
+        self.start_timeout = start_timeout
+        self.slot_timeout = slot_timeout
+        self.max_restarts = max_restarts
+
+        # Contiguous core blocks per worker, wrapping if oversubscribed
+        self.worker_cores = [
+            [available[(i * self.cores_per_worker + j) % len(available)]
+             for j in range(self.cores_per_worker)]
+            for i in range(self.num_workers)
+        ]
+
+        self._context = mp.get_context('spawn')
+        self._workers: List[_Worker] = []
+        self._results: Optional['mp.Queue'] = None
+        self._pending: Dict[int, Tuple[Future, _Worker]] = {}
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._collector: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self) -> None:
+        """Start the workers and wait until each has loaded the model."""
+        if self._running:
+            return
+
+        start = time.perf_counter()
+        slot_shape = (self.slots_per_worker, self.max_batch_size) + self.input_shape
+        slot_bytes = int(np.prod(slot_shape)) * np.dtype(np.float32).itemsize
+        self._results = self._context.Queue()
+
+        for worker_id in range(self.num_workers):
+            shm = shared_memory.SharedMemory(create=True, size=slot_bytes)
+            ring = np.ndarray(slot_shape, dtype=np.float32, buffer=shm.buf)
+            worker = _Worker(worker_id, shm, ring)
+            self._spawn(worker)
+            self._workers.append(worker)
+
+        # Wait for every worker to report that its model is loaded
+        deadline = time.monotonic() + self.start_timeout
+        ready = 0
+        try:
+            while ready < self.num_workers:
+                try:
+                    message = self._results.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise RuntimeError(
+                        f"Only {ready}/{self.num_workers} workers started "
+                        f"within {self.start_timeout:g}s"
+                    )
+                _, worker_id, error = message
+                if error is not None:
+                    raise RuntimeError(f"Worker {worker_id} failed to load model: {error}")
+                self._workers[worker_id].ready = True
+                ready += 1
+        except Exception as e:
+            logger.error(f"Error starting worker pool: {e}")
+            self._running = True
+            self.close()
+            raise
+
+        self._running = True
+        # Workers import their runtime and load in parallel, all within this
+        self.load_seconds = time.perf_counter() - start
+        self._collector = threading.Thread(
+            target=self._collect, name='rxvision-worker-results', daemon=True
+        )
+        self._collector.start()
+        logger.info(
+            f"Started {self.num_workers} {self.backend} workers in {self.load_seconds:.2f}s "
+            f"({self.cores_per_worker} cores, {self.intra_op_threads} intra-op threads each)"
+        )
+
+    def _spawn(self, worker: _Worker) -> None:
+        """Start (or restart) the process of ``worker`` on its ring buffer."""
+        worker.ready = False
+        worker.requests = self._context.Queue()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(
+                worker.worker_id, str(self.model_path), self.backend, self.backend_options,
+                self.input_shape, worker.shm.name, self.slots_per_worker, self.max_batch_size,
+                self.worker_cores[worker.worker_id], self.intra_op_threads,
+                worker.requests, self._results
+            ),
+            name=f'rxvision-worker-{worker.worker_id}',
+            daemon=True
+        )
+        worker.process.start()
+
+    def submit(self, batch: np.ndarray) -> Future:
+        """Send one batch of at most ``max_batch_size`` images to a worker.
+
+        Blocks for up to ``slot_timeout`` seconds while the least loaded live
+        worker has no free ring slot. If that worker dies meanwhile, the batch
+        goes to another live worker within the same deadline.
+
+        Returns:
+            Future resolved with the class probabilities
+
+        Raises:
+            OverloadedError: If no worker is alive or no slot frees up in time
+        """
+        if not self._running:
+            raise RuntimeError("Worker pool is not running")
+        n = len(batch)
+        if n > self.max_batch_size:
+            raise ValueError(f"Batch of {n} exceeds max_batch_size={self.max_batch_size}")
+
+        deadline = time.monotonic() + self.slot_timeout
+        while True:
+            with self._lock:
+                workers = [w for w in self._workers if w.available]
+                if not workers:
+                    raise OverloadedError("No inference workers are available")
+                worker = min(workers, key=lambda w: w.inflight)
+                worker.inflight += 1
+                generation = worker.generation
+                free_slots = worker.free_slots
+
+            try:
+                slot = free_slots.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                with self._lock:
+                    if worker.generation == generation:
+                        worker.inflight -= 1
+                raise OverloadedError(
+                    f"No free slot on inference worker {worker.worker_id} "
+                    f"within {self.slot_timeout:g}s"
+                )
+            if slot is None:
+                # The worker died; pass the wake-up on to the next waiter
+                free_slots.put(None)
+
+            future = Future()
+            request_id = next(self._request_ids)
+            with self._lock:
+                if slot is not None and worker.generation == generation:
+                    # The only copy of the image data: into the worker's shared ring
+                    worker.ring[slot, :n] = batch
+                    self._pending[request_id] = (future, worker)
+                    break
+            # Its slots were reclaimed and inflight reset; try another worker
+        worker.requests.put((request_id, slot, n))
+        return future
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        n = len(batch)
+        if n == 0:
+            raise ValueError("Cannot run inference on an empty batch")
+
+        # Spread the batch over the workers so they run it in parallel
+        chunk = min(self.max_batch_size, math.ceil(n / self.num_workers))
+        futures = [self.submit(batch[i:i + chunk]) for i in range(0, n, chunk)]
+        return np.concatenate([future.result() for future in futures])
+
+    def warmup(self) -> None:
+        # Workers warm their own backends before reporting ready
+        self.predict(np.zeros((self.num_workers,) + self.input_shape, dtype=np.float32))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-worker core assignment and request counts."""
+        return {
+            'num_workers': self.num_workers,
+            'backend': self.backend,
+            'intra_op_threads': self.intra_op_threads,
+            'workers': [
+                {
+                    'pid': worker.process.pid if worker.process else None,
+                    'alive': bool(worker.process and worker.process.is_alive()),
+                    'ready': worker.ready,
+                    'failed': worker.failed,
+                    'restarts': worker.restarts,
+                    'cores': self.worker_cores[worker.worker_id],
+                    'inflight': worker.inflight,
+                    'completed': worker.completed
+                }
+                for worker in self._workers
+            ]
+        }
+
+    def close(self) -> None:
+        """Stop the workers and release the shared memory."""
+        if not self._running:
+            return
+        self._running = False
+
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        if self._collector is not None:
+            self._collector.join(timeout=2)
+            self._collector = None
+
+        self._fail_pending(RuntimeError("Worker pool was closed"))
+        for worker in self._workers:
+            worker.ring = None
+            worker.shm.close()
+            worker.shm.unlink()
+        self._workers = []
+
+    def _collect(self) -> None:
+        """Resolve futures from worker results and watch for dead workers."""
+        next_check = time.monotonic() + 1.0
+        while self._running:
+            # Check liveness on a clock, not only when the queue runs dry,
+            # so a dead worker is noticed under steady load too
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + 1.0
+                for worker in self._workers:
+                    if not worker.failed and not worker.process.is_alive() and self._running:
+                        self._handle_dead(worker)
+
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if message[0] == 'ready':
+                self._handle_ready(*message[1:])
+                continue
+
+            _, request_id, worker_id, slot, outputs, error = message
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+                if entry is None:
+                    # Already failed when its worker died; the slot was reclaimed
+                    continue
+                future, worker = entry
+                worker.inflight -= 1
+                worker.completed += 1
+            worker.free_slots.put(slot)
+
+            if error is not None:
+                future.set_exception(RuntimeError(f"Worker {worker_id}: {error}"))
+            else:
+                future.set_result(outputs)
+
+    def _handle_dead(self, worker: _Worker) -> None:
+        """Fail a dead worker's requests, reclaim its slots and respawn it."""
+        logger.error(
+            f"Inference worker {worker.worker_id} exited unexpectedly "
+            f"(exit code {worker.process.exitcode})"
+        )
+        with self._lock:
+            worker.ready = False
+            worker.generation += 1
+            worker.inflight = 0
+            # Wake submitters blocked on the old slots instead of letting them time out
+            worker.free_slots.put(None)
+            worker.reset_slots()
+            failed = [
+                request_id for request_id, (_, owner) in self._pending.items()
+                if owner is worker
+            ]
+            futures = [self._pending.pop(request_id)[0] for request_id in failed]
+        for future in futures:
+            future.set_exception(RuntimeError(f"Inference worker {worker.worker_id} died"))
+
+        if worker.restarts >= self.max_restarts:
+            worker.failed = True
+            logger.error(
+                f"Inference worker {worker.worker_id} died {worker.restarts + 1} times, "
+                f"taking it out of rotation"
+            )
+            return
+        worker.restarts += 1
+        self._spawn(worker)
+
+    def _handle_ready(self, worker_id: int, error: Optional[str]) -> None:
+        """Put a respawned worker back into rotation once its model loaded."""
+        worker = self._workers[worker_id]
+        if error is not None:
+            worker.failed = True
+            logger.error(f"Respawned inference worker {worker_id} failed to load model: {error}")
+            return
+        worker.ready = True
+        logger.info(f"Inference worker {worker_id} restarted (restart {worker.restarts})")
+
+    def _fail_pending(self, error: Exception, workers: Optional[List[_Worker]] = None) -> None:
+        """Fail outstanding requests, optionally only those of ``workers``."""
+        with self._lock:
+            failed = [
+                request_id for request_id, (_, worker) in self._pending.items()
+                if workers is None or worker in workers
+            ]
+            futures = [self._pending.pop(request_id)[0] for request_id in failed]
+        for future in futures:
+            future.set_exception(error)
+
+
+def benchmark(
+    model_path: str,
+    worker_counts: Sequence[int],
+    batch_size: int = 32,
+    duration: float = 20.0,
+    concurrency: Optional[int] = None,
+    input_shape: Tuple[int, ...] = (224, 224, 3),
+    backend: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Measure pool throughput for each worker count.
+
+    Client threads submit random preprocessed batches back to back for
+    ``duration`` seconds; by default there are two clients per worker so
+    every worker always has a batch queued.
+
+    Returns:
+        One result per worker count with images/sec and the speedup over
+        the first configuration
+    """
+    rng = np.random.default_rng(0)
+    batch = rng.standard_normal((batch_size,) + tuple(input_shape)).astype(np.float32)
+
+    results = []
+    for num_workers in worker_counts:
+        pool = WorkerPool(
+            model_path,
+            input_shape=input_shape,
+            num_workers=num_workers,
+            backend=backend,
+            max_batch_size=batch_size
+        )
+        pool.start()
+        try:
+            pool.warmup()
+            clients = concurrency or 2 * num_workers
+            images = [0] * clients
+            stop_at = time.perf_counter() + duration
+
+            def client(index: int) -> None:
+                while time.perf_counter() < stop_at:
+                    pool.submit(batch).result()
+                    images[index] += batch_size
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+
+        result = {
+            'num_workers': num_workers,
+            'cores_per_worker': pool.cores_per_worker,
+            'intra_op_threads': pool.intra_op_threads,
+            'batch_size': batch_size,
+            'clients': clients,
+            'images': sum(images),
+            'seconds': elapsed,
+            'images_per_second': sum(images) / elapsed
+        }
+        result['speedup'] = result['images_per_second'] / (
+            results[0]['images_per_second'] if results else result['images_per_second']
+        )
+        logger.info(
+            f"{num_workers} workers: {result['images_per_second']:.1f} images/s "
+            f"({result['speedup']:.2f}x)"
+        )
+        results.append(result)
+
+    return results
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="RxVision25 inference worker pool")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bench = subparsers.add_parser('benchmark', help="Measure throughput scaling with workers")
+    bench.add_argument('model_path', nargs='?', default='models/best_model.h5')
+    bench.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    bench.add_argument('--batch-size', type=int, default=32)
+    bench.add_argument('--duration', type=float, default=20.0)
+    bench.add_argument('--concurrency', type=int, default=None,
+                       help="Client threads (default: 2 per worker)")
+    bench.add_argument('--image-size', type=int, nargs=2, default=[224, 224])
+    bench.add_argument('--backend', default=None)
+    bench.add_argument('--output', default=None, help="Write results as JSON")
+
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        results = benchmark(
+            args.model_path,
+            args.workers,
+            batch_size=args.batch_size,
+            duration=args.duration,
+            concurrency=args.concurrency,
+            input_shape=tuple(args.image_size) + (3,),
+            backend=args.backend
+        )
+        if args.output:
+            Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            logger.info(f"Wrote benchmark results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,276 @@
- 
\ No newline at end of file
+"""
+Model architectures for RxVision25.
+
+Backbones are registered by name so the trainers can select them with
+``--architecture``. Every model takes images scaled to [0, 1], as produced
+by ``src.data.pipeline``, and ends in a float32 softmax so it trains under
+mixed precision. ``profile_model`` reports parameters, FLOPs and measured
+CPU latency, which lets architectures be compared against a latency budget.
+
+Usage:
+    python -m src.models.architectures
+    python -m src.models.architectures --budget-ms 30 --batch-size 1 8
+"""
+
+import argparse
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHITECTURE = 'rxvision-v1'
+
+# name -> {'builder': fn(input_shape, num_classes, weights, dropout),
+#          'description': str, 'hdf5': whether the model reloads from .h5}
+ARCHITECTURES: Dict[str, Dict[str, Any]] = {}
+
+
+def register(name: str, description: str, hdf5: bool = True) -> Callable:
+    """Decorator adding a model builder to ``ARCHITECTURES`` under ``name``.
+
+    ``hdf5=False`` marks models that only reload from the native ``.keras``
+    format, e.g. MobileNetV3, whose hard-swish ops do not survive the
+    legacy HDF5 config.
+    """
+    def decorator(builder: Callable) -> Callable:
+        ARCHITECTURES[name] = {'builder': builder, 'description': description, 'hdf5': hdf5}
+        return builder
+    return decorator
+
+
+def checkpoint_suffix(name: str) -> str:
+    """File extension to save a registered architecture with."""
+    return '.h5' if ARCHITECTURES[name]['hdf5'] else '.keras'
+
+
+def _classifier(backbone_fn: Callable, name: str) -> Callable:
+    """Builder for a Keras application backbone with a pooled softmax head.
+
+    The applications rescale [0, 255] inputs themselves, so [0, 1] images
+    are scaled back up first.
+    """
+    def build(
+        input_shape: Tuple[int, int, int],
+        num_classes: int,
+        weights: Optional[str] = None,
+        dropout: float = 0.2
+    ) -> tf.keras.Model:
+        inputs = tf.keras.Input(shape=input_shape)
+        x = tf.keras.layers.Rescaling(255.0)(inputs)
+        backbone = backbone_fn(
+            input_shape=input_shape,
+            include_top=False,
+            weights=weights,
+            pooling='avg',
+            include_preprocessing=True
+        )
+        x = backbone(x)
+        x = tf.keras.layers.Dropout(dropout)(x)
+        x = tf.keras.layers.Dense(num_classes)(x)
+        outputs = tf.keras.layers.Activation('softmax', dtype='float32')(x)
+        return tf.keras.Model(inputs, outputs, name=name)
+    return build
+
+
+register('efficientnetv2-b0', "EfficientNetV2-B0, a much cheaper backbone than v1")(
+    _classifier(tf.keras.applications.EfficientNetV2B0, 'efficientnetv2_b0')
+)
+register('efficientnetv2-s', "EfficientNetV2-S, larger and slower than B0")(
+    _classifier(tf.keras.applications.EfficientNetV2S, 'efficientnetv2_s')
+)
+register('mobilenetv3-small', "MobileNetV3-Small for tight CPU budgets", hdf5=False)(
+    _classifier(tf.keras.applications.MobileNetV3Small, 'mobilenetv3_small')
+)
+register('mobilenetv3-large', "MobileNetV3-Large", hdf5=False)(
+    _classifier(tf.keras.applications.MobileNetV3Large, 'mobilenetv3_large')
+)
+
+
+@register('rxvision-v1', "v1 model, the default: full-resolution 768-filter conv stack")
+def build_v1(
+    input_shape: Tuple[int, int, int],
+    num_classes: int,
+    weights: Optional[str] = None,
+    dropout: float = 0.25
+) -> tf.keras.Model:
+    """Best performing model from v1, the trainers' default."""
+    if weights is not None:
+        raise ValueError("rxvision-v1 has no pretrained weights")
+    return tf.keras.Sequential([
+        tf.keras.Input(shape=input_shape),
+        # First conv block
+        tf.keras.layers.Conv2D(768, (3, 3), activation='relu', padding='same'),
+        tf.keras.layers.MaxPooling2D((3, 3)),
+
+        # Second conv block
+        tf.keras.layers.Conv2D(1024, (3, 3), activation='relu', padding='same'),
+        tf.keras.layers.MaxPooling2D((3, 3)),
+        tf.keras.layers.SpatialDropout2D(0.1),
+
+        # Third conv block
+        tf.keras.layers.Conv2D(512, (3, 3), activation='relu', padding='same'),
+        tf.keras.layers.Dropout(dropout),
+
+        # Fourth conv block
+        tf.keras.layers.Conv2D(256, (3, 3), activation='relu', padding='same'),
+        tf.keras.layers.GaussianNoise(1.0),
+
+        # Dense layers
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(num_classes),
+        tf.keras.layers.Activation('softmax', dtype='float32')
+    ], name='rxvision_v1')
+
+
+def build_model(
+    name: str,
+    input_shape: Tuple[int, int, int] = (224, 224, 3),
+    num_classes: int = 15,
+    weights: Optional[str] = None,
+    **options: Any
+) -> tf.keras.Model:
+    """Build a registered architecture.
+
+    Args:
+        name: Key of ``ARCHITECTURES``
+        input_shape: (height, width, channels) of the [0, 1] input images
+        num_classes: Number of output classes
+        weights: None for random initialization or 'imagenet' for a
+            pretrained backbone
+        **options: Builder options such as ``dropout``
+
+    Returns:
+        Uncompiled Keras model
+    """
+    if name not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture '{name}', expected one of {list(ARCHITECTURES)}")
+    return ARCHITECTURES[name]['builder'](tuple(input_shape), num_classes, weights=weights, **options)
+
+
+def _leaf_layers(model: tf.keras.Model) -> List[tf.keras.layers.Layer]:
+    layers = []
+    for layer in model.layers:
+        if hasattr(layer, 'layers') and layer.layers:
+            layers.extend(_leaf_layers(layer))
+        else:
+            layers.append(layer)
+    return layers
+
+
+def count_flops(model: tf.keras.Model) -> int:
+    """Floating point operations of one forward pass on a single image.
+
+    Counts convolutions and dense layers as two operations per
+    multiply-add; activations, pooling and normalization are not counted,
+    as they are a small fraction of the total for these architectures.
+    """
+    flops = 0
+    for layer in _leaf_layers(model):
+        if not isinstance(layer, (
+            tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D, tf.keras.layers.Dense
+        )):
+            continue
+        output_positions = int(np.prod(layer.output.shape[1:-1]))
+        input_channels = int(layer.input.shape[-1])
+        if isinstance(layer, tf.keras.layers.DepthwiseConv2D):
+            kernel = int(np.prod(layer.kernel_size))
+            flops += 2 * output_positions * kernel * int(layer.output.shape[-1])
+        elif isinstance(layer, tf.keras.layers.Conv2D):
+            kernel = int(np.prod(layer.kernel_size))
+            flops += 2 * output_positions * kernel * input_channels // layer.groups * layer.filters
+        else:
+            flops += 2 * output_positions * input_channels * layer.units
+    return flops
+
+
+def measure_latency(
+    model: tf.keras.Model,
+    batch_size: int = 1,
+    repeats: int = 20,
+    warmup: int = 3
+) -> Dict[str, float]:
+    """Time a traced inference-mode forward pass on the CPU.
+
+    Returns:
+        p50 and p95 milliseconds per batch and images per second
+    """
+    forward = tf.function(lambda x: model(x, training=False))
+    batch = tf.random.uniform((batch_size,) + tuple(model.input_shape[1:]))
+    with tf.device('/CPU:0'):
+        for _ in range(warmup):
+            forward(batch).numpy()
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            forward(batch).numpy()
+            durations.append(time.perf_counter() - start)
+    ms = np.asarray(durations) * 1000
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'images_per_second': float(batch_size * 1000 / np.median(ms))
+    }
+
+
+def profile_model(
+    model: tf.keras.Model,
+    batch_sizes: Sequence[int] = (1,),
+    repeats: int = 20
+) -> Dict[str, Any]:
+    """Report parameters, FLOPs per image and CPU latency per batch size."""
+    profile = {
+        'name': model.name,
+        'params': int(model.count_params()),
+        'flops': count_flops(model),
+        'latency': {
+            str(batch_size): measure_latency(model, batch_size, repeats=repeats)
+            for batch_size in batch_sizes
+        }
+    }
+    latency = ', '.join(
+        f"batch {size} {stats['p50_ms']:.1f} ms" for size, stats in profile['latency'].items()
+    )
+    logger.info(
+        f"{model.name}: {profile['params'] / 1e6:.2f}M params, "
+        f"{profile['flops'] / 1e9:.2f} GFLOPs/image, CPU p50 {latency}"
+    )
+    return profile
+
+
+def main():
+    """List registered architectures with their cost, optionally against a budget."""
+    parser = argparse.ArgumentParser(description="Profile RxVision25 architectures")
+    parser.add_argument('--architectures', nargs='+', default=list(ARCHITECTURES),
+                        choices=list(ARCHITECTURES))
+    parser.add_argument('--img-size', type=int, default=224)
+    parser.add_argument('--num-classes', type=int, default=15)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Flag architectures whose batch latency p50 exceeds this")
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.architectures:
+        model = build_model(name, (args.img_size, args.img_size, 3), args.num_classes)
+        rows.append((name, profile_model(model, args.batch_size, repeats=args.repeats)))
+        tf.keras.backend.clear_session()
+
+    print(f"{'architecture':20s} {'params (M)':>10s} {'GFLOPs':>8s} "
+          + ' '.join(f"{f'p50 b{size} (ms)':>14s}" for size in args.batch_size))
+    for name, profile in rows:
+        latencies = [profile['latency'][str(size)]['p50_ms'] for size in args.batch_size]
+        over = args.budget_ms is not None and max(latencies) > args.budget_ms
+        print(f"{name:20s} {profile['params'] / 1e6:10.2f} {profile['flops'] / 1e9:8.2f} "
+              + ' '.join(f"{ms:14.1f}" for ms in latencies)
+              + ('  over budget' if over else ''))
+
+
+if __name__ == "__main__":
+    main()
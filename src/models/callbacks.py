@@ -0,0 +1,272 @@
+"""
+Training instrumentation callbacks for RxVision25.
+
+``StepTimingCallback`` splits every training step into time spent waiting
+for the input pipeline and time spent in the forward/backward pass, and
+measures the callback and loop overhead between steps. Per-epoch images/sec,
+p50/p95 step time and the input stall fraction go to the log, TensorBoard
+and (when a run is active) MLflow, which tells apart an input-bound run from
+a compute-bound one.
+
+Keras fetches each batch inside the compiled train step, so a callback
+alone cannot see the data wait. ``wrap_dataset`` appends a cheap map to
+the training dataset that records when each batch leaves the pipeline;
+the wait is the time from the step starting to its batch arriving.
+
+That only holds when every step fetches exactly one batch as it starts:
+the model must be compiled with ``steps_per_execution=1`` and no
+prefetching may follow the wrapped stage (``wrap_dataset`` must be the
+last transformation). The first is checked when training starts and the
+second over its first ``log_every`` steps.
+"""
+
+import collections
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class StepTimingCallback(tf.keras.callbacks.Callback):
+    """Records per-step wall time, input wait and callback overhead."""
+
+    def __init__(
+        self,
+        log_dir: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        log_every: int = 50,
+        warmup_steps: int = 1,
+        stall_warning: float = 0.2,
+        profile_steps: Optional[Tuple[int, int]] = None,
+        profile_trigger: Optional[str] = None,
+        profile_window: int = 20
+    ):
+        """Initialize the callback.
+
+        Args:
+            log_dir: TensorBoard directory; scalars go to ``log_dir/step_timing``
+                and profiler traces to ``log_dir``
+            batch_size: Images per step, used when the dataset is not wrapped
+            log_every: Steps between TensorBoard step-level scalars
+            warmup_steps: Initial steps (graph tracing) left out of the stats
+            stall_warning: Input stall fraction above which an epoch logs a
+                warning
+            profile_steps: Optional (start, stop) global steps to trace with
+                ``tf.profiler``
+            profile_trigger: Optional file path; creating it while training
+                runs traces the next ``profile_window`` steps
+            profile_window: Steps traced per trigger
+        """
+        super().__init__()
+        self.log_dir = Path(log_dir) if log_dir else None
+        self.batch_size = batch_size
+        self.log_every = log_every
+        self.warmup_steps = warmup_steps
+        self.stall_warning = stall_warning
+        self.profile_steps = profile_steps
+        self.profile_trigger = Path(profile_trigger) if profile_trigger else None
+        self.profile_window = profile_window
+        if (profile_steps or profile_trigger) and self.log_dir is None:
+            raise ValueError("Profiling requires a log_dir")
+
+        # (time, batch size) of batches that left the input pipeline
+        self._ready = collections.deque()
+        self._writer = None
+        self._global_step = 0
+        self._step_begin = None
+        self._last_end = None
+        self._profile_stop = None
+        self._wrapped = False
+        self._reset_epoch()
+
+    def wrap_dataset(self, dataset: tf.data.Dataset) -> tf.data.Dataset:
+        """Return ``dataset`` with batch arrival timestamps for this callback.
+
+        The stamp runs in the consumer's ``GetNext``, after any prefetching,
+        so it marks when the train step actually received the batch. Pass
+        the result to ``fit`` as is; a ``prefetch`` or other buffering stage
+        after it would stamp batches before their step asks for them.
+        """
+        def record(size):
+            self._ready.append((time.perf_counter(), int(size)))
+            return np.int64(size)
+
+        def stamp(*batch):
+            size = tf.shape(tf.nest.flatten(batch)[0], out_type=tf.int64)[0]
+            recorded = tf.py_function(record, [size], tf.int64)
+            with tf.control_dependencies([recorded]):
+                batch = tf.nest.map_structure(tf.identity, batch)
+            return batch
+
+        # tf.data would otherwise add a prefetch after the stamp, so batches
+        # would be stamped before their step asks for them
+        options = tf.data.Options()
+        options.experimental_optimization.inject_prefetch = False
+        wrapped = dataset.map(stamp).with_options(options)
+        for name in ('class_names', 'batch_size'):
+            if hasattr(dataset, name):
+                setattr(wrapped, name, getattr(dataset, name))
+        self._wrapped = True
+        return wrapped
+
+    def _reset_epoch(self) -> None:
+        self._step_times: List[float] = []
+        self._wait_times: List[float] = []
+        self._overheads: List[float] = []
+        self._images = 0
+
+    def on_train_begin(self, logs=None):
+        steps_per_execution = int(getattr(self.model, 'steps_per_execution', 1) or 1)
+        if steps_per_execution != 1:
+            raise ValueError(
+                f"StepTimingCallback needs steps_per_execution=1, "
+                f"the model was compiled with {steps_per_execution}"
+            )
+        if not self._wrapped:
+            logger.warning("Training dataset is not wrapped; input wait will not be measured")
+        self._ready.clear()
+        if self.log_dir is not None:
+            self._writer = tf.summary.create_file_writer(str(self.log_dir / 'step_timing'))
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._last_end = None
+        self._reset_epoch()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        now = time.perf_counter()
+        if self._last_end is not None:
+            self._overheads.append(now - self._last_end)
+        if self._ready and self._global_step < self.log_every:
+            # This step's batch left the pipeline before the step started
+            raise ValueError(
+                "A batch was stamped before its step began; the wrapped dataset "
+                "must be passed to fit without prefetching after it"
+            )
+        self._maybe_start_profiler()
+        self._step_begin = now
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Keras has already turned ``logs`` into Python floats here, so the
+        # step's device work is finished
+        now = time.perf_counter()
+        step_time = now - self._step_begin
+        wait, size = 0.0, self.batch_size or 0
+        if self._ready:
+            ready, size = self._ready.popleft()
+            wait = min(max(ready - self._step_begin, 0.0), step_time)
+
+        self._global_step += 1
+        if self._global_step > self.warmup_steps:
+            self._step_times.append(step_time)
+            self._wait_times.append(wait)
+            self._images += size
+
+        if self._profile_stop is not None and self._global_step >= self._profile_stop:
+            self._stop_profiler()
+
+        if self._writer is not None and self._global_step % self.log_every == 0 and self._step_times:
+            window = slice(-self.log_every, None)
+            with self._writer.as_default(step=self._global_step):
+                tf.summary.scalar('step/time_ms', np.mean(self._step_times[window]) * 1000)
+                tf.summary.scalar('step/data_wait_ms', np.mean(self._wait_times[window]) * 1000)
+                if self._overheads:
+                    tf.summary.scalar(
+                        'step/callback_overhead_ms', np.mean(self._overheads[window]) * 1000
+                    )
+        self._last_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        stats = self.epoch_stats()
+        if not stats:
+            return
+        logger.info(
+            f"Epoch {epoch + 1} timing: {stats['images_per_second'] or 0:.1f} images/s, "
+            f"step p50 {stats['step_time_p50'] * 1000:.1f} ms / "
+            f"p95 {stats['step_time_p95'] * 1000:.1f} ms, "
+            f"input stall {stats['input_stall_fraction']:.1%}, "
+            f"callback overhead {stats['callback_overhead_ms']:.1f} ms/step"
+        )
+        if stats['input_stall_fraction'] > self.stall_warning:
+            logger.warning(
+                f"Training waited on input for {stats['input_stall_fraction']:.0%} of step time; "
+                f"check the pipeline with --benchmark-input, caching or a compiled dataset"
+            )
+
+        metrics = {f"timing/{name}": value for name, value in stats.items() if value is not None}
+        if self._writer is not None:
+            with self._writer.as_default(step=epoch):
+                for name, value in metrics.items():
+                    tf.summary.scalar(name, value)
+            self._writer.flush()
+        try:
+            import mlflow
+            if mlflow.active_run() is not None:
+                mlflow.log_metrics(
+                    {name.replace('/', '_'): value for name, value in metrics.items()}, step=epoch
+                )
+        except ImportError:
+            pass
+
+    def on_train_end(self, logs=None):
+        self._stop_profiler()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def epoch_stats(self) -> Dict[str, Any]:
+        """Timing summary of the current epoch's steps so far."""
+        if not self._step_times:
+            return {}
+        step_times = np.array(self._step_times)
+        busy = step_times.sum()
+        overhead = float(np.mean(self._overheads)) if self._overheads else 0.0
+        return {
+            'steps': len(step_times),
+            'images_per_second': float(self._images / (busy + overhead * len(step_times)))
+            if self._images else None,
+            'step_time_p50': float(np.percentile(step_times, 50)),
+            'step_time_p95': float(np.percentile(step_times, 95)),
+            'data_wait_ms': float(np.mean(self._wait_times)) * 1000,
+            'input_stall_fraction': float(np.sum(self._wait_times) / busy) if busy > 0 else 0.0,
+            'callback_overhead_ms': overhead * 1000
+        }
+
+    def _maybe_start_profiler(self) -> None:
+        if self._profile_stop is not None:
+            return
+        step = self._global_step
+        if self.profile_steps and step == self.profile_steps[0]:
+            self._start_profiler(self.profile_steps[1])
+        elif (
+            self.profile_trigger is not None
+            and step % self.log_every == 0
+            and self.profile_trigger.exists()
+        ):
+            self.profile_trigger.unlink(missing_ok=True)
+            self._start_profiler(step + self.profile_window)
+
+    def _start_profiler(self, stop_step: int) -> None:
+        try:
+            tf.profiler.experimental.start(str(self.log_dir))
+        except Exception as e:
+            logger.error(f"Could not start profiler: {e}")
+            return
+        self._profile_stop = stop_step
+        logger.info(f"Profiling steps {self._global_step}-{stop_step} into {self.log_dir}")
+
+    def _stop_profiler(self) -> None:
+        if self._profile_stop is None:
+            return
+        self._profile_stop = None
+        try:
+            tf.profiler.experimental.stop()
+            logger.info(f"Saved profiler trace to {self.log_dir}")
+        except Exception as e:
+            logger.error(f"Could not stop profiler: {e}")
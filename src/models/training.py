@@ -9,11 +9,13 @@ import tensorflow as tf
 from tensorflow.keras import callbacks
 import mlflow
 import numpy as np
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Union
 import logging
 from pathlib import Path
 import json
 
+from .callbacks import StepTimingCallback
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,6 +42,10 @@ class ModelTrainer:
         self.experiment_name = experiment_name
         self.model_dir = Path(model_dir)
         self.model_dir.mkdir(parents=True, exist_ok=True)
+        self.step_timing = StepTimingCallback(
+            log_dir=str(self.model_dir / 'logs'),
+            profile_trigger=str(self.model_dir / 'PROFILE')
+        )
         
         # Setup mixed precision if requested
         if use_mixed_precision:
@@ -50,18 +56,26 @@ class ModelTrainer:
     def _create_callbacks(
         self,
         patience: int = 10,
-        min_delta: float = 1e-4
+        min_delta: float = 1e-4,
+        histogram_freq: int = 0,
+        profile_steps: Optional[Tuple[int, int]] = None
     ) -> List[tf.keras.callbacks.Callback]:
         """Create training callbacks.
         
         Args:
             patience: Number of epochs to wait for improvement
             min_delta: Minimum change to qualify as an improvement
+            histogram_freq: Epochs between weight histograms (0 disables
+                them; they are slow to compute)
+            profile_steps: Optional (start, stop) steps to trace with the profiler
             
         Returns:
             List of Keras callbacks
         """
         callbacks_list = [
+            # Step timing first, so its overhead measurement covers the rest
+            self.step_timing,
+
             # Model checkpoint
             callbacks.ModelCheckpoint(
                 filepath=str(self.model_dir / 'best_model.h5'),
@@ -91,11 +105,12 @@ class ModelTrainer:
             # TensorBoard logging
             callbacks.TensorBoard(
                 log_dir=str(self.model_dir / 'logs'),
-                histogram_freq=1,
+                histogram_freq=histogram_freq,
                 update_freq='epoch'
             )
         ]
         
+        self.step_timing.profile_steps = profile_steps
         return callbacks_list
     
     def compile_model(
@@ -126,20 +141,27 @@ class ModelTrainer:
     
     def train(
         self,
-        train_data: tf.keras.preprocessing.image.DataFrameIterator,
-        val_data: tf.keras.preprocessing.image.DataFrameIterator,
+        train_data: Union[tf.data.Dataset, tf.keras.preprocessing.image.DataFrameIterator],
+        val_data: Union[tf.data.Dataset, tf.keras.preprocessing.image.DataFrameIterator],
         epochs: int = 100,
         initial_epoch: int = 0,
-        class_weights: Optional[Dict[int, float]] = None
+        class_weights: Optional[Dict[int, float]] = None,
+        histogram_freq: int = 0,
+        profile_steps: Optional[Tuple[int, int]] = None
     ) -> tf.keras.callbacks.History:
         """Train the model.
         
         Args:
-            train_data: Training data generator
-            val_data: Validation data generator
+            train_data: Training dataset, e.g. from ``src.data.pipeline.create_dataset``
+                (which also reads compiled datasets), or a data generator
+            val_data: Validation dataset or data generator
             epochs: Number of epochs to train
             initial_epoch: Epoch to start from
             class_weights: Optional class weights for imbalanced data
+            histogram_freq: Epochs between TensorBoard weight histograms
+            profile_steps: Optional (start, stop) steps to trace with the
+                profiler; creating ``<model_dir>/PROFILE`` during training
+                also traces the next 20 steps
             
         Returns:
             Training history
@@ -152,13 +174,19 @@ class ModelTrainer:
             mlflow.log_params({
                 'epochs': epochs,
                 'initial_epoch': initial_epoch,
-                'batch_size': train_data.batch_size,
+                'batch_size': getattr(train_data, 'batch_size', None),
                 'optimizer': self.model.optimizer.__class__.__name__,
                 'learning_rate': float(self.model.optimizer.learning_rate.numpy())
             })
             
             # Create callbacks
-            callbacks_list = self._create_callbacks()
+            callbacks_list = self._create_callbacks(
+                histogram_freq=histogram_freq,
+                profile_steps=profile_steps
+            )
+            self.step_timing.batch_size = getattr(train_data, 'batch_size', None)
+            if isinstance(train_data, tf.data.Dataset):
+                train_data = self.step_timing.wrap_dataset(train_data)
             
             # Train model
             history = self.model.fit(
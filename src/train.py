@@ -1,13 +1,32 @@
 """
 RxVision25 Training Script
+
+Usage:
+    python -m src.training.train --epochs 100
+    python -m src.training.train --architecture mobilenetv3-large --weights imagenet
+    python -m src.training.train --benchmark-input
+    python -m src.training.train --epochs 5 --profile-steps 50 70
 """
 
 import tensorflow as tf
 import numpy as np
 from pathlib import Path
+from typing import Optional, Tuple, Union
+import argparse
+import json
 import logging
 from datetime import datetime
 
+from src.data.pipeline import benchmark, create_dataset
+from src.models.architectures import (
+    ARCHITECTURES,
+    DEFAULT_ARCHITECTURE,
+    build_model,
+    checkpoint_suffix,
+    profile_model
+)
+from src.models.callbacks import StepTimingCallback
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,15 +44,31 @@ class RxVisionTrainer:
         img_size: int = 224,
         batch_size: int = 32,
         num_classes: int = 15,
-        learning_rate: float = 1e-4
+        learning_rate: float = 1e-4,
+        seed: int = 1337,
+        cache: Union[bool, str] = False,
+        architecture: str = DEFAULT_ARCHITECTURE,
+        weights: Optional[str] = None
     ):
-        """Initialize trainer with configuration."""
+        """Initialize trainer with configuration.
+        
+        ``seed`` fixes shuffling and augmentation order. ``cache`` keeps
+        decoded images in a file at the given path, in memory (True; only for
+        datasets that fit in RAM), or decodes every epoch (False, default).
+        ``architecture`` names an entry of
+        ``src.models.architectures.ARCHITECTURES``; ``weights='imagenet'``
+        starts from a pretrained backbone.
+        """
         self.train_dir = Path(train_dir)
         self.val_dir = Path(val_dir)
         self.img_size = img_size
         self.batch_size = batch_size
         self.num_classes = num_classes
         self.learning_rate = learning_rate
+        self.seed = seed
+        self.cache = cache
+        self.architecture = architecture
+        self.weights = weights
         
         # Validate directories
         if not self.train_dir.exists():
@@ -44,80 +79,66 @@ class RxVisionTrainer:
             self.val_dir = None
     
     def create_model(self):
-        """Create model architecture based on best performing model from v1."""
-        model = tf.keras.Sequential([
-            # First conv block
-            tf.keras.layers.Conv2D(768, (3,3), activation='relu', padding='same',
-                                 input_shape=(self.img_size, self.img_size, 3)),
-            tf.keras.layers.MaxPooling2D((3, 3)),
-            
-            # Second conv block
-            tf.keras.layers.Conv2D(1024, (3,3), activation='relu', padding='same'),
-            tf.keras.layers.MaxPooling2D((3, 3)),
-            tf.keras.layers.SpatialDropout2D(0.1),
-            
-            # Third conv block
-            tf.keras.layers.Conv2D(512, (3,3), activation='relu', padding='same'),
-            tf.keras.layers.Dropout(0.25),
-            
-            # Fourth conv block
-            tf.keras.layers.Conv2D(256, (3,3), activation='relu', padding='same'),
-            tf.keras.layers.GaussianNoise(1.0),
-            
-            # Dense layers
-            tf.keras.layers.Flatten(),
-            tf.keras.layers.Dense(self.num_classes, activation='softmax')
-        ])
-        
-        return model
-    
-    def create_data_generators(self):
-        """Create data generators with augmentation."""
-        train_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
-            rescale=1./255,
-            rotation_range=45,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            shear_range=0.2,
-            zoom_range=0.5,
-            horizontal_flip=True,
-            vertical_flip=True,
-            fill_mode='nearest',
-            validation_split=0.2 if self.val_dir is None else None
+        """Create the configured architecture."""
+        return build_model(
+            self.architecture,
+            input_shape=(self.img_size, self.img_size, 3),
+            num_classes=self.num_classes,
+            weights=self.weights
         )
+    
+    def create_datasets(self):
+        """Create tf.data training and validation pipelines.
         
-        val_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
-            rescale=1./255
-        )
+        Without a validation directory, 20% of each training class is held
+        out, as ``flow_from_directory(validation_split=0.2)`` did.
+        """
+        split = 0.2 if self.val_dir is None else None
         
-        train_generator = train_datagen.flow_from_directory(
+        train_dataset = create_dataset(
             self.train_dir,
-            target_size=(self.img_size, self.img_size),
+            img_size=self.img_size,
             batch_size=self.batch_size,
-            class_mode='categorical',
-            subset='training' if self.val_dir is None else None
+            validation_split=split,
+            subset='training' if split else None,
+            augment=True,
+            shuffle=True,
+            seed=self.seed,
+            cache=self._cache_for('train')
         )
         
-        if self.val_dir is not None:
-            val_generator = val_datagen.flow_from_directory(
-                self.val_dir,
-                target_size=(self.img_size, self.img_size),
-                batch_size=self.batch_size,
-                class_mode='categorical'
-            )
-        else:
-            val_generator = train_datagen.flow_from_directory(
-                self.train_dir,
-                target_size=(self.img_size, self.img_size),
-                batch_size=self.batch_size,
-                class_mode='categorical',
-                subset='validation'
-            )
+        val_dataset = create_dataset(
+            self.val_dir if self.val_dir is not None else self.train_dir,
+            img_size=self.img_size,
+            batch_size=self.batch_size,
+            validation_split=split,
+            subset='validation' if split else None,
+            seed=self.seed,
+            cache=self._cache_for('val')
+        )
         
-        return train_generator, val_generator
+        return train_dataset, val_dataset
+    
+    def _cache_for(self, name: str) -> Union[bool, str]:
+        """Cache setting for one split; file caches get a per-split name."""
+        if isinstance(self.cache, str):
+            Path(self.cache).mkdir(parents=True, exist_ok=True)
+            return str(Path(self.cache) / name)
+        return self.cache
+    
+    def benchmark_input(self, num_batches: int = 100):
+        """Measure training input images/sec without running the model."""
+        train_dataset, _ = self.create_datasets()
+        return benchmark(train_dataset, num_batches=num_batches)
     
-    def train(self, epochs=100):
-        """Train the model."""
+    def train(self, epochs=100, profile_steps: Optional[Tuple[int, int]] = None):
+        """Train the model.
+        
+        Step timing and input stalls are logged every epoch and written to
+        TensorBoard. ``profile_steps`` (start, stop) traces those steps with
+        the profiler; creating a ``PROFILE`` file in the run directory while
+        training traces the next 20 steps.
+        """
         # Check GPU availability
         gpus = tf.config.list_physical_devices('GPU')
         logger.info(f"Available GPUs: {len(gpus)}")
@@ -130,18 +151,35 @@ class RxVisionTrainer:
             metrics=['accuracy']
         )
         
-        # Create data generators
-        train_generator, val_generator = self.create_data_generators()
+        # Create input pipelines
+        train_dataset, val_dataset = self.create_datasets()
         
         # Setup model checkpointing
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         model_dir = Path('models') / f"model_{timestamp}"
         model_dir.mkdir(parents=True, exist_ok=True)
         
+        # Record the cost of the architecture next to its checkpoints
+        profile = profile_model(model)
+        profile['architecture'] = self.architecture
+        with open(model_dir / 'architecture.json', 'w') as f:
+            json.dump(profile, f, indent=2)
+        suffix = checkpoint_suffix(self.architecture)
+        
+        step_timing = StepTimingCallback(
+            log_dir=str(model_dir / 'logs'),
+            batch_size=self.batch_size,
+            profile_steps=profile_steps,
+            profile_trigger=str(model_dir / 'PROFILE')
+        )
+        train_dataset = step_timing.wrap_dataset(train_dataset)
+        
         callbacks = [
+            # Step time, input wait and callback overhead
+            step_timing,
             # Save best model
             tf.keras.callbacks.ModelCheckpoint(
-                model_dir / 'best_model.h5',
+                model_dir / f'best_model{suffix}',
                 monitor='val_accuracy',
                 save_best_only=True
             ),
@@ -167,16 +205,14 @@ class RxVisionTrainer:
         # Train
         logger.info("Starting training...")
         history = model.fit(
-            train_generator,
+            train_dataset,
             epochs=epochs,
-            validation_data=val_generator,
-            callbacks=callbacks,
-            workers=8,
-            use_multiprocessing=True
+            validation_data=val_dataset,
+            callbacks=callbacks
         )
         
         # Save final model and training history
-        model.save(model_dir / 'final_model.h5')
+        model.save(model_dir / f'final_model{suffix}')
         np.save(model_dir / 'training_history.npy', history.history)
         logger.info(f"Training completed! Models saved in {model_dir}/")
         
@@ -184,9 +220,43 @@ class RxVisionTrainer:
 
 def main():
     """Main training function."""
+    parser = argparse.ArgumentParser(description="Train RxVision25")
+    parser.add_argument('--train-dir', default='data/train')
+    parser.add_argument('--val-dir', default='data/val')
+    parser.add_argument('--img-size', type=int, default=224)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--num-classes', type=int, default=15)
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1337)
+    parser.add_argument('--architecture', default=DEFAULT_ARCHITECTURE, choices=list(ARCHITECTURES))
+    parser.add_argument('--weights', default=None, choices=['imagenet'],
+                        help="Start from a pretrained backbone")
+    parser.add_argument('--cache', default='none',
+                        help="'none', a directory for an on-disk cache, or 'memory' "
+                             "(only for datasets that fit in RAM)")
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help="Only measure input pipeline images/sec")
+    parser.add_argument('--benchmark-batches', type=int, default=100)
+    parser.add_argument('--profile-steps', type=int, nargs=2, metavar=('START', 'STOP'),
+                        help="Capture a profiler trace for these training steps")
+    args = parser.parse_args()
+    
     try:
-        trainer = RxVisionTrainer()
-        trainer.train()
+        trainer = RxVisionTrainer(
+            train_dir=args.train_dir,
+            val_dir=args.val_dir,
+            img_size=args.img_size,
+            batch_size=args.batch_size,
+            num_classes=args.num_classes,
+            seed=args.seed,
+            cache={'memory': True, 'none': False}.get(args.cache, args.cache),
+            architecture=args.architecture,
+            weights=args.weights
+        )
+        if args.benchmark_input:
+            trainer.benchmark_input(num_batches=args.benchmark_batches)
+        else:
+            trainer.train(epochs=args.epochs, profile_steps=args.profile_steps)
     except Exception as e:
         logger.error(f"Training failed: {e}")
         raise
@@ -0,0 +1,252 @@
+"""
+Tests for the RxVision25 data pipeline.
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+def _write_class_images(root, extensions, size=(12, 10)):
+    """Write one solid-color image per extension into per-class directories."""
+    for i, ext in enumerate(extensions):
+        class_dir = root / f"class_{i}"
+        class_dir.mkdir(parents=True)
+        Image.new('RGB', size, color=(40 * i, 100, 200)).save(class_dir / f"pill{ext}")
+
+
+def test_create_dataset_decodes_every_accepted_extension(tmp_path):
+    """TIFF and PPM files, which tf.io.decode_image cannot read, decode via PIL."""
+    pytest.importorskip('tensorflow')
+    from src.data.pipeline import create_dataset
+
+    extensions = ['.png', '.jpg', '.bmp', '.ppm', '.tif', '.tiff']
+    _write_class_images(tmp_path, extensions)
+
+    dataset = create_dataset(str(tmp_path), img_size=8, batch_size=len(extensions))
+    images, labels = next(iter(dataset))
+    assert images.shape == (len(extensions), 8, 8, 3)
+    np.testing.assert_array_equal(np.argmax(labels, axis=-1), np.arange(len(extensions)))
+    # Lossless formats come back with their exact color
+    for i, ext in enumerate(extensions):
+        if ext != '.jpg':
+            np.testing.assert_allclose(images[i, 0, 0], np.array([40 * i, 100, 200]) / 255, atol=1e-6)
+
+
+def _write_numbered_images(root, counts, size=(6, 6)):
+    """Write ``counts[c]`` PNGs into class_<c>, each a solid color encoding (c, i)."""
+    for c, count in enumerate(counts):
+        class_dir = root / f"class_{c}"
+        class_dir.mkdir(parents=True)
+        for i in range(count):
+            Image.new('RGB', size, color=(c * 50, i * 10, 7)).save(class_dir / f"pill_{i:02d}.png")
+
+
+def test_compiled_dataset_splits_and_gathers_across_shards(tmp_path):
+    from src.data.compiled_dataset import CompiledDataset, compile_dataset
+
+    _write_numbered_images(tmp_path / 'src', [5, 3])
+    summary = compile_dataset(str(tmp_path / 'src'), str(tmp_path / 'out'), img_size=4, shard_size=3)
+    assert summary['added'] == 8
+
+    dataset = CompiledDataset(str(tmp_path / 'out'))
+    assert len(dataset) == 8
+    assert len(dataset.shards) == 3
+    assert dataset.class_names == ['class_0', 'class_1']
+
+    # flow_from_directory semantics: the first int(split * n) files per class validate
+    validation = dataset.split_indices(0.4, 'validation')
+    training = dataset.split_indices(0.4, 'training')
+    assert [dataset.entries[i]['path'] for i in validation] == [
+        'class_0/pill_00.png', 'class_0/pill_01.png', 'class_1/pill_00.png'
+    ]
+    assert sorted(np.concatenate([validation, training])) == list(range(8))
+    np.testing.assert_array_equal(dataset.split_indices(), np.arange(8))
+    with pytest.raises(ValueError):
+        dataset.split_indices(0.4)
+
+    # Rows come back in the requested order whichever shard they live in
+    indices = [7, 0, 4, 2]
+    images = dataset.gather(indices)
+    assert images.shape == (4, 4, 4, 3) and images.dtype == np.uint8
+    for image, i in zip(images, indices):
+        c = dataset.labels[i]
+        n = int(dataset.entries[i]['path'][-6:-4])
+        np.testing.assert_array_equal(image[0, 0], [c * 50, n * 10, 7])
+
+
+def test_compile_dataset_only_decodes_changed_files(tmp_path):
+    from src.data.compiled_dataset import CompiledDataset, compile_dataset
+
+    _write_numbered_images(tmp_path / 'src', [2, 2])
+    compile_dataset(str(tmp_path / 'src'), str(tmp_path / 'out'), img_size=4)
+
+    Image.new('RGB', (6, 6), color=(1, 2, 3)).save(tmp_path / 'src' / 'class_1' / 'pill_00.png')
+    (tmp_path / 'src' / 'class_0' / 'pill_01.png').unlink()
+    summary = compile_dataset(str(tmp_path / 'src'), str(tmp_path / 'out'), img_size=4)
+    assert (summary['added'], summary['removed'], summary['unchanged']) == (1, 2, 2)
+
+    dataset = CompiledDataset(str(tmp_path / 'out'))
+    assert [e['path'] for e in dataset.entries] == [
+        'class_0/pill_00.png', 'class_1/pill_00.png', 'class_1/pill_01.png'
+    ]
+    np.testing.assert_array_equal(dataset.gather([1])[0, 0, 0], [1, 2, 3])
+
+    with pytest.raises(ValueError):
+        compile_dataset(str(tmp_path / 'src'), str(tmp_path / 'out'), img_size=8)
+
+
+def test_compiled_dataset_labels_keep_empty_and_failed_classes(tmp_path):
+    """A class with no usable images still takes its label index."""
+    from src.data.compiled_dataset import CompiledDataset, compile_dataset
+
+    _write_numbered_images(tmp_path / 'src', [0, 1, 2])
+    (tmp_path / 'src' / 'class_1' / 'pill_00.png').write_bytes(b'not an image')
+    summary = compile_dataset(str(tmp_path / 'src'), str(tmp_path / 'out'), img_size=4)
+    assert summary['failed'] == ['class_1/pill_00.png']
+
+    dataset = CompiledDataset(str(tmp_path / 'out'))
+    assert dataset.class_names == ['class_0', 'class_1', 'class_2']
+    np.testing.assert_array_equal(dataset.labels, [2, 2])
+
+
+def test_batch_preprocessor_matches_reference_normalization(tmp_path):
+    from src.data.preprocessing import IMAGENET_MEAN, IMAGENET_STD, BatchPreprocessor
+
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (3, 8, 8, 3), dtype=np.uint8)
+    Image.fromarray(pixels[1]).save(tmp_path / 'pill.png')
+    with open(tmp_path / 'pill.png', 'rb') as f:
+        encoded = f.read()
+
+    preprocessor = BatchPreprocessor(target_size=(8, 8), num_workers=2)
+    batch = preprocessor([pixels[0], tmp_path / 'pill.png', encoded])
+    expected = (pixels[[0, 1, 1]] / 255.0 - np.array(IMAGENET_MEAN)) / np.array(IMAGENET_STD)
+    assert batch.dtype == np.float32
+    np.testing.assert_allclose(batch, expected, atol=1e-5)
+
+    # The per-thread buffer is reused; ``out`` keeps a batch
+    assert preprocessor([pixels[2]]).ctypes.data == batch.ctypes.data
+    kept = np.empty((1, 8, 8, 3), dtype=np.float32)
+    assert preprocessor([pixels[2]], out=kept) is kept
+    preprocessor.close()
+
+
+def test_batch_preprocessor_flattens_alpha_and_reports_failures():
+    from src.data.preprocessing import BatchPreprocessor
+
+    transparent = np.zeros((4, 4, 4), dtype=np.uint8)
+    gray = np.full((4, 4), 255, dtype=np.uint8)
+    preprocessor = BatchPreprocessor(target_size=(4, 4), mean=(0, 0, 0), std=(1, 1, 1))
+
+    errors = []
+    batch = preprocessor([transparent, b'not an image', gray], errors=errors)
+    # Transparent pixels are composited onto white
+    np.testing.assert_allclose(batch[0], 1.0)
+    np.testing.assert_allclose(batch[1], 0.0)
+    np.testing.assert_allclose(batch[2], 1.0)
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], Exception)
+
+    with pytest.raises(Exception):
+        preprocessor([b'not an image'])
+    preprocessor.close()
+
+
+def _jpeg_bytes(size, orientation=None):
+    import io
+
+    image = Image.new('RGB', size, color=(200, 30, 30))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_decode_image_uses_reduced_jpeg_decoding():
+    from src.data.preprocessing import decode_image
+
+    image, info = decode_image(_jpeg_bytes((2000, 1600)), target_size=(224, 224))
+    assert info['source_size'] == (2000, 1600)
+    # 1/4 scale is the smallest DCT scale that still covers 224x224
+    assert info['decoded_size'] == (500, 400)
+    assert image.mode == 'RGB'
+    assert min(image.size) >= 224
+
+
+def test_decode_image_applies_exif_orientation():
+    from src.data.preprocessing import decode_image
+
+    # Orientation 6: stored landscape, displayed rotated to portrait
+    image, _ = decode_image(_jpeg_bytes((64, 32), orientation=6), target_size=(16, 16))
+    assert image.size == (16, 32)
+
+
+def test_decode_image_enforces_size_limits():
+    from src.data.preprocessing import ImageTooLargeError, decode_image
+
+    data = _jpeg_bytes((400, 300))
+    with pytest.raises(ImageTooLargeError, match='bytes'):
+        decode_image(data, max_bytes=len(data) - 1)
+    with pytest.raises(ImageTooLargeError, match='pixels'):
+        decode_image(data, max_pixels=400 * 300 - 1)
+    image, _ = decode_image(data, max_bytes=len(data), max_pixels=400 * 300)
+    assert image.size == (400, 300)
+
+
+def test_decode_image_reports_decompression_bombs_as_too_large(monkeypatch):
+    from src.data.preprocessing import ImageTooLargeError, decode_image
+
+    # PIL refuses anything over twice its limit while reading the header
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(_jpeg_bytes((400, 300)))
+
+
+def _still_augmenter(**kwargs):
+    from src.data.augmentation import BatchAugmenter
+
+    settings = dict(
+        rotation_range=0, width_shift_range=0, height_shift_range=0, shear_range=0,
+        zoom_range=0, horizontal_flip=False, vertical_flip=False,
+        brightness_range=0, contrast_range=0, saturation_range=0
+    )
+    settings.update(kwargs)
+    return BatchAugmenter(**settings)
+
+
+def test_batch_augmenter_identity_and_flips_in_graph():
+    tf = pytest.importorskip('tensorflow')
+
+    images = np.random.default_rng(0).random((8, 6, 5, 3)).astype(np.float32)
+    seed = tf.constant([1, 2])
+    np.testing.assert_allclose(_still_augmenter()(images, seed=seed).numpy(), images, atol=1e-5)
+
+    # Each image is either unchanged or mirrored, and the seed fixes which
+    flipped = _still_augmenter(horizontal_flip=True)(images, seed=seed).numpy()
+    mirrored = [np.allclose(out, image[:, ::-1], atol=1e-5) for out, image in zip(flipped, images)]
+    unchanged = [np.allclose(out, image, atol=1e-5) for out, image in zip(flipped, images)]
+    assert all(m or u for m, u in zip(mirrored, unchanged))
+    assert any(mirrored) and any(unchanged)
+    again = _still_augmenter(horizontal_flip=True)(images, seed=seed).numpy()
+    np.testing.assert_array_equal(flipped, again)
+
+
+def test_batch_augmenter_stays_in_range_in_graph():
+    tf = pytest.importorskip('tensorflow')
+    from src.data.augmentation import BatchAugmenter
+
+    images = np.random.default_rng(0).random((4, 16, 16, 3)).astype(np.float32)
+    augmented = BatchAugmenter(brightness_range=0.5, contrast_range=0.5)(images, seed=tf.constant([3, 4]))
+    assert augmented.shape == images.shape and augmented.dtype == tf.float32
+    assert float(tf.reduce_min(augmented)) >= 0.0 and float(tf.reduce_max(augmented)) <= 1.0
+
+
+def test_batch_augmenter_numpy_identity():
+    pytest.importorskip('cv2')
+
+    images = np.random.default_rng(0).random((3, 6, 5, 3)).astype(np.float32)
+    out = _still_augmenter().augment_numpy(images, rng=np.random.default_rng(0))
+    np.testing.assert_allclose(out, images, atol=1e-5)
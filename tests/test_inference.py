@@ -0,0 +1,1368 @@
+"""
+Tests for the RxVision25 inference package.
+"""
+
+import asyncio
+import ipaddress
+import json
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import numpy as np
+import pytest
+
+from src.inference.batching import MicroBatcher
+from src.inference.cache import PredictionCache
+from src.inference.cascade import CascadeBackend, choose_threshold, needs_escalation
+from src.inference.encoding import accepts_binary, decode_topk, encode_topk, stack_topk
+from src.inference import embedding_index
+from src.inference.embedding_index import EmbeddingIndex
+from src.inference.executor import InferenceExecutor, OverloadedError
+from src.inference.explain import HEATMAP_SIZE, decode_heatmap, encode_heatmap
+from src.inference.fetch import FetchError, ImageFetcher
+from src.inference.metrics import LatencyTracker, MetricsRegistry, RequestMetricsMiddleware
+from src.inference.inference import run_bulk_inference
+from src.inference.model_loader import InferenceBackend, ModelRegistry, infer_backend, load_backend
+from src.inference.predictor import RxPredictor, TopK
+from src.inference.quantization import quantize_model, split_calibration
+from src.inference.streaming import MultipartSpool, UploadError, UploadTooLargeError
+from src.inference.worker_pool import WorkerPool, _Worker
+
+
+def test_executor_sheds_when_full():
+    """Requests beyond workers + queue are rejected immediately."""
+    async def scenario():
+        executor = InferenceExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+        try:
+            tasks = [asyncio.ensure_future(executor.run(release.wait, 5)) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            with pytest.raises(OverloadedError):
+                await executor.run(release.wait, 5)
+            assert executor.shed == 1
+
+            release.set()
+            await asyncio.gather(*tasks)
+            assert executor.pending == 0
+            assert executor.completed == 2
+        finally:
+            release.set()
+            executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_executor_cancelled_requests_keep_their_slot():
+    """Cancelling a request does not free its slot while the pool still runs it."""
+    async def scenario():
+        executor = InferenceExecutor(max_workers=2, max_queue=2)
+        limit = executor.max_workers + executor.max_queue
+        release = threading.Event()
+        peak = [0]
+
+        submitted = []
+        submit = executor._pool.submit
+
+        def record(*args, **kwargs):
+            future = submit(*args, **kwargs)
+            submitted.append(future)
+            return future
+
+        executor._pool.submit = record
+
+        def in_flight() -> int:
+            # Tasks the pool has accepted and not finished or dropped
+            return sum(not future.done() for future in submitted)
+
+        try:
+            for _ in range(10):
+                # Saturate the executor, then drop every request as a
+                # disconnecting client would
+                tasks = [asyncio.ensure_future(executor.run(release.wait, 5)) for _ in range(limit)]
+                await asyncio.sleep(0.02)
+                peak[0] = max(peak[0], in_flight())
+                assert executor.pending <= limit
+
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await asyncio.sleep(0)
+
+                peak[0] = max(peak[0], in_flight())
+                assert executor.pending == in_flight()
+
+            # Running tasks still hold their slots, so later rounds were shed
+            assert executor.pending == executor.max_workers
+            assert executor.shed > 0
+            assert peak[0] <= limit
+
+            release.set()
+            for _ in range(100):
+                if executor.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert executor.pending == 0
+        finally:
+            release.set()
+            executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+class _FakeProcess:
+    """Stand-in for a worker process whose liveness the test controls."""
+
+    def __init__(self, alive: bool = True):
+        self.alive = alive
+        self.exitcode = None if alive else -9
+        self.pid = None
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+
+def _fake_worker_pool(num_workers: int = 2, **kwargs):
+    """Build a running WorkerPool whose workers are fake processes."""
+    pool = WorkerPool(
+        'model.onnx', input_shape=(2, 2, 1), num_workers=num_workers,
+        max_batch_size=4, slots_per_worker=2, **kwargs
+    )
+    slot_shape = (pool.slots_per_worker, pool.max_batch_size) + pool.input_shape
+    for worker_id in range(num_workers):
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(slot_shape)) * 4)
+        worker = _Worker(worker_id, shm, np.ndarray(slot_shape, dtype=np.float32, buffer=shm.buf))
+        worker.process = _FakeProcess()
+        worker.requests = queue.Queue()
+        worker.ready = True
+        pool._workers.append(worker)
+    pool._running = True
+
+    # Respawning swaps in a fresh fake process instead of a real one
+    def spawn(worker):
+        worker.ready = False
+        worker.requests = queue.Queue()
+        worker.process = _FakeProcess()
+
+    pool._spawn = spawn
+    return pool
+
+
+def _close_fake_worker_pool(pool) -> None:
+    pool._running = False
+    for worker in pool._workers:
+        worker.ring = None
+        worker.shm.close()
+        worker.shm.unlink()
+
+
+def test_worker_pool_sheds_instead_of_blocking_on_full_worker():
+    """submit raises OverloadedError once every ring slot is taken."""
+    pool = _fake_worker_pool(num_workers=1, slot_timeout=0.05)
+    try:
+        batch = np.zeros((2, 2, 2, 1), dtype=np.float32)
+        pool.submit(batch)
+        pool.submit(batch)
+        start = time.monotonic()
+        with pytest.raises(OverloadedError):
+            pool.submit(batch)
+        assert time.monotonic() - start < 1.0
+        assert pool._workers[0].inflight == 2
+    finally:
+        _close_fake_worker_pool(pool)
+
+
+def test_worker_pool_skips_and_respawns_dead_worker():
+    """A dead worker's requests fail, its slots are reclaimed and it restarts."""
+    pool = _fake_worker_pool(num_workers=2, slot_timeout=0.05, max_restarts=1)
+    try:
+        batch = np.zeros((1, 2, 2, 1), dtype=np.float32)
+        dead, alive = pool._workers
+        futures = [pool.submit(batch), pool.submit(batch)]
+        assert dead.inflight == 1 and alive.inflight == 1
+
+        dead.process.alive = False
+        # Dead workers are never picked, however idle they look
+        pool.submit(batch)
+        assert alive.inflight == 2
+
+        pool._handle_dead(dead)
+        assert isinstance(futures[0].exception(timeout=0), RuntimeError)
+        assert dead.inflight == 0
+        assert dead.free_slots.qsize() == pool.slots_per_worker
+        assert dead.restarts == 1 and not dead.failed
+
+        # A late result from the dead process is ignored, not double-freed
+        stale = ('result', 0, dead.worker_id, 0, np.zeros((1, 3), dtype=np.float32), None)
+
+        class Results:
+            def get(self, timeout=None):
+                if stale_messages:
+                    return stale_messages.pop()
+                pool._running = False
+                raise queue.Empty
+
+        stale_messages = [stale]
+        pool._results = Results()
+        pool._collect()
+        pool._running = True
+        assert dead.free_slots.qsize() == pool.slots_per_worker
+        with pool._lock:
+            assert all(owner is alive for _, owner in pool._pending.values())
+
+        # Back in rotation once the respawned process reports ready
+        pool._handle_ready(dead.worker_id, None)
+        pool.submit(batch)
+        assert dead.inflight == 1
+
+        # Fill both workers and block one more submitter on the first one's slots
+        pool.slot_timeout = 10.0
+        pool.submit(batch)
+        assert dead.inflight == 2 and alive.inflight == 2
+        submitted = []
+        blocked = threading.Thread(target=lambda: submitted.append(pool.submit(batch)))
+        start = time.monotonic()
+        blocked.start()
+        time.sleep(0.1)
+        assert blocked.is_alive()
+
+        # Past max_restarts the worker is taken out of rotation for good
+        dead.process.alive = False
+        pool._handle_dead(dead)
+        assert dead.failed and dead.free_slots.qsize() == pool.slots_per_worker
+
+        # The blocked submitter moves to the live worker as soon as it frees a slot
+        request_id, slot, n = alive.requests.get_nowait()
+        outputs = np.zeros((n, 3), dtype=np.float32)
+        stale_messages = [('result', request_id, alive.worker_id, slot, outputs, None)]
+        pool._collect()
+        pool._running = True
+        blocked.join(timeout=5)
+        assert submitted and time.monotonic() - start < 5
+        assert alive.inflight == 2
+
+        alive.process.alive = False
+        with pytest.raises(OverloadedError):
+            pool.submit(batch)
+    finally:
+        _close_fake_worker_pool(pool)
+
+
+class _FakeBulkPredictor:
+    """Duck-typed predictor for bulk inference: one class per pixel value."""
+
+    model_path = 'model.onnx'
+    target_size = (2, 2)
+
+    def __init__(self, fail_after: Optional[int] = None, delay: float = 0.0):
+        self.fail_after = fail_after
+        self.delay = delay
+        self.calls = 0
+
+    def preprocessor(self, paths, out, errors):
+        for i, path in enumerate(paths):
+            out[i] = int(Path(path).stem)
+            errors.append(None)
+
+    def predict_tensor(self, batch, top_k):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("model crashed")
+        return [[{'class': str(int(image[0, 0, 0])), 'probability': 1.0}] for image in batch]
+
+
+def test_bulk_inference_resumes_from_checkpoint(tmp_path):
+    """A job that dies mid-way resumes after the last checkpoint, writing each image once."""
+    paths = [tmp_path / f"{i}.jpg" for i in range(10)]
+    output = tmp_path / 'predictions.jsonl'
+    kwargs = dict(batch_size=2, checkpoint_every=4, prefetch_batches=1)
+
+    with pytest.raises(RuntimeError, match="model crashed"):
+        run_bulk_inference(_FakeBulkPredictor(fail_after=3), paths, str(output), **kwargs)
+    checkpoint = json.loads((tmp_path / 'predictions.jsonl.checkpoint.json').read_text())
+    assert checkpoint['completed'] == 4
+
+    predictor = _FakeBulkPredictor()
+    summary = run_bulk_inference(predictor, paths, str(output), **kwargs)
+    assert summary['processed'] == 6 and summary['skipped'] == 4
+    assert predictor.calls == 3
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row['path'] for row in rows] == [str(path) for path in paths]
+    assert [row['predictions'][0]['class'] for row in rows] == [str(i) for i in range(10)]
+
+    # A different job must not pick up this checkpoint
+    with pytest.raises(ValueError):
+        run_bulk_inference(predictor, paths[:5], str(output), **kwargs)
+
+
+def test_bulk_inference_consumer_error_does_not_deadlock(tmp_path):
+    """The decode thread exits even when the consumer fails with a full queue."""
+    # The decoder finishes the second batch and waits to queue the end
+    # marker while the model is still failing on the first
+    paths = [tmp_path / f"{i}.jpg" for i in range(2)]
+    errors = []
+
+    def job():
+        try:
+            run_bulk_inference(
+                _FakeBulkPredictor(fail_after=0, delay=0.3), paths, str(tmp_path / 'out.jsonl'),
+                batch_size=1, prefetch_batches=1
+            )
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=job, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert not any(t.name == 'rxvision-bulk-decode' for t in threading.enumerate())
+
+
+def _multipart_body(files, boundary: str = 'rxvision-boundary') -> bytes:
+    """Encode ``(filename, data)`` pairs as a multipart ``files`` upload."""
+    body = b''
+    for filename, data in files:
+        body += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'
+        ).encode() + data + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode()
+
+
+_MULTIPART_TYPE = 'multipart/form-data; boundary=rxvision-boundary'
+
+
+def test_multipart_spool_yields_files_while_uploading(tmp_path):
+    """Each file is handed out as soon as its part ends, not after the whole body."""
+    body = _multipart_body([(f'{i}.jpg', bytes([i]) * 1000) for i in range(3)])
+    sent = [0]
+
+    async def stream():
+        for start in range(0, len(body), 256):
+            sent[0] = start + 256
+            yield body[start:start + 256]
+
+    async def scenario():
+        spool = MultipartSpool(spool_dir=str(tmp_path))
+        spool.check_request(_MULTIPART_TYPE, str(len(body)))
+        received = []
+        try:
+            async for upload in spool.parts(stream()):
+                received.append((upload.filename, spool.read(upload), sent[0]))
+        finally:
+            spool.close()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [(name, data) for name, data, _ in received] == \
+        [(f'{i}.jpg', bytes([i]) * 1000) for i in range(3)]
+    assert received[0][2] < len(body)
+
+
+def test_multipart_spool_limits_raise_typed_errors(tmp_path):
+    """Bad requests raise UploadError; size and count limits raise UploadTooLargeError."""
+    body = _multipart_body([(f'{i}.jpg', b'x' * 1000) for i in range(3)])
+
+    async def stream():
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    async def consume(spool):
+        try:
+            spool.check_request(_MULTIPART_TYPE)
+            return [upload async for upload in spool.parts(stream())]
+        finally:
+            spool.close()
+
+    with pytest.raises(UploadError) as error:
+        MultipartSpool(spool_dir=str(tmp_path)).check_request('application/json')
+    assert not isinstance(error.value, UploadTooLargeError)
+
+    with pytest.raises(UploadTooLargeError):
+        MultipartSpool(max_total_bytes=100, spool_dir=str(tmp_path)).check_request(
+            _MULTIPART_TYPE, str(len(body))
+        )
+    with pytest.raises(UploadTooLargeError, match="bytes"):
+        asyncio.run(consume(MultipartSpool(max_total_bytes=2000, spool_dir=str(tmp_path))))
+    with pytest.raises(UploadTooLargeError, match="files"):
+        asyncio.run(consume(MultipartSpool(max_files=2, spool_dir=str(tmp_path))))
+
+    # An oversized single file is kept as a per-file error, not a failed request
+    uploads = asyncio.run(consume(MultipartSpool(max_bytes=500, spool_dir=str(tmp_path))))
+    assert len(uploads) == 3 and all(upload.error for upload in uploads)
+
+
+# Fake DNS for the fetcher tests
+_HOSTS = {
+    'images.example.com': ['93.184.216.34'],
+    'cdn.example.com': ['2606:2800:220:1::1'],
+    'internal.example.com': ['10.0.0.5'],
+    'mixed.example.com': ['93.184.216.35', '192.168.1.10'],
+}
+
+
+def _fake_fetcher(handler, **kwargs) -> ImageFetcher:
+    """An ImageFetcher whose HTTP and DNS are served in-process."""
+    fetcher = ImageFetcher(**kwargs)
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def resolve(host, port):
+        try:
+            return [host] if ipaddress.ip_address(host) else []
+        except ValueError:
+            pass
+        if host not in _HOSTS:
+            raise OSError(f"unknown host {host}")
+        return _HOSTS[host]
+
+    fetcher._resolve = resolve
+    return fetcher
+
+
+def test_fetcher_rejects_non_public_hosts():
+    """Loopback, private, link-local and unresolvable hosts are never requested."""
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        return httpx.Response(200, content=b'image')
+
+    async def scenario():
+        fetcher = _fake_fetcher(handler)
+        urls = [
+            'http://127.0.0.1/pill.jpg',
+            'http://169.254.169.254/latest/meta-data/',
+            'http://[::1]:8000/pill.jpg',
+            'http://internal.example.com/pill.jpg',
+            'http://mixed.example.com/pill.jpg',
+            'http://nowhere.example.com/pill.jpg',
+            'file:///etc/passwd',
+            'https://images.example.com/pill.jpg',
+        ]
+        try:
+            return await fetcher.fetch_many(urls)
+        finally:
+            await fetcher.close()
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, FetchError) for result in results[:-1])
+    assert results[-1] == b'image'
+    assert requested == ['https://images.example.com/pill.jpg']
+
+
+def test_fetcher_checks_every_redirect_hop():
+    """Redirects are followed only to public hosts, and only up to max_redirects."""
+    def handler(request):
+        path = request.url.path
+        if path == '/to-internal':
+            return httpx.Response(302, headers={'location': 'http://10.0.0.5/secret'})
+        if path == '/to-cdn':
+            return httpx.Response(301, headers={'location': 'https://cdn.example.com/pill.jpg'})
+        if path == '/loop':
+            return httpx.Response(302, headers={'location': '/loop'})
+        if request.url.host == '10.0.0.5':
+            raise AssertionError("private host was requested")
+        return httpx.Response(200, content=b'pill')
+
+    async def scenario():
+        fetcher = _fake_fetcher(handler, max_redirects=3)
+        try:
+            return await fetcher.fetch_many([
+                'http://images.example.com/to-internal',
+                'http://images.example.com/to-cdn',
+                'http://images.example.com/loop',
+            ])
+        finally:
+            await fetcher.close()
+
+    internal, cdn, loop = asyncio.run(scenario())
+    assert isinstance(internal, FetchError) and 'non-public' in str(internal)
+    assert cdn == b'pill'
+    assert isinstance(loop, FetchError) and 'redirects' in str(loop)
+
+
+def test_fetcher_limits_per_host_concurrency_and_forgets_idle_hosts():
+    """At most max_per_host downloads run per host and idle hosts leave no state."""
+    active = {'images.example.com': 0, 'cdn.example.com': 0}
+    peak = dict(active)
+
+    async def handler(request):
+        host = request.url.host
+        active[host] += 1
+        peak[host] = max(peak[host], active[host])
+        await asyncio.sleep(0.01)
+        active[host] -= 1
+        return httpx.Response(200, content=b'x' * (10 if 'small' in request.url.path else 100))
+
+    async def scenario():
+        fetcher = _fake_fetcher(handler, max_per_host=2, max_bytes=50)
+        try:
+            results = await fetcher.fetch_many(
+                [f'http://images.example.com/small/{i}.jpg' for i in range(6)] +
+                [f'http://cdn.example.com/small/{i}.jpg' for i in range(3)] +
+                ['http://cdn.example.com/large.jpg']
+            )
+            return results, dict(fetcher._host_limits), dict(fetcher._host_users)
+        finally:
+            await fetcher.close()
+
+    results, limits, users = asyncio.run(scenario())
+    assert results[:9] == [b'x' * 10] * 9
+    assert isinstance(results[9], FetchError)
+    assert peak == {'images.example.com': 2, 'cdn.example.com': 2}
+    assert limits == {} and users == {}
+
+
+class _FixedBackend(InferenceBackend):
+    """In-process backend returning preset class probabilities."""
+
+    name = 'fixed'
+
+    def __init__(self, probabilities: np.ndarray, input_shape=(4, 4, 3)):
+        super().__init__('fixed', input_shape)
+        self.probabilities = np.asarray(probabilities, dtype=np.float32)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.resize(self.probabilities, (len(batch), self.probabilities.shape[-1]))
+
+
+def test_top_k_matches_full_sort():
+    """argpartition top-k returns the same classes and order as a full sort."""
+    rng = np.random.default_rng(0)
+    probabilities = rng.random((16, 50)).astype(np.float32)
+    for k in (1, 5, 50, 80):
+        indices, values = RxPredictor.top_k(probabilities, k)
+        expected = np.argsort(-probabilities, axis=-1, kind='stable')[:, :min(k, 50)]
+        np.testing.assert_array_equal(indices, expected)
+        np.testing.assert_array_equal(values, np.take_along_axis(probabilities, expected, axis=-1))
+
+
+def test_topk_results_keep_class_ids_when_labels_repeat(tmp_path):
+    """Binary results come from the top-k arrays, not from mapping labels back to ids."""
+    class_map = tmp_path / 'class_map.json'
+    class_map.write_text(json.dumps({'0': 'Aspirin', '1': 'Aspirin', '2': 'Ibuprofen'}))
+    probabilities = np.array([[0.1, 0.6, 0.3, 0.0]], dtype=np.float32)
+    predictor = RxPredictor(
+        'fixed', class_map_path=str(class_map), target_size=(4, 4),
+        backend=_FixedBackend(probabilities)
+    )
+
+    results = predictor.topk_results(probabilities, 3)
+    class_ids, values = stack_topk(results + [None], 3)
+    np.testing.assert_array_equal(class_ids, [[1, 2, 0], [-1, -1, -1]])
+    np.testing.assert_allclose(values, [[0.6, 0.3, 0.1], [0, 0, 0]])
+
+    labeled = predictor.label_results(results + [None])
+    assert [p['class'] for p in labeled[0]] == ['Aspirin', 'Ibuprofen', 'Aspirin']
+    assert labeled[1] is None
+    # Outputs beyond the class map are labeled by index
+    assert predictor.label_results([TopK(np.array([3]), np.array([0.0]))])[0][0]['class'] == '3'
+
+
+def test_rxtk_round_trip():
+    """encode_topk / decode_topk preserve ids, probabilities, version, time and errors."""
+    class_ids = np.array([[3, 1, 0], [-1, -1, -1], [7, 2, -1]], dtype=np.int32)
+    probabilities = np.array([[0.7, 0.2, 0.1], [0, 0, 0], [0.9, 0.1, 0]], dtype=np.float32)
+
+    body = encode_topk(class_ids, probabilities, 'v2.1', 0.25, [None, 'Invalid image', None])
+    decoded = decode_topk(body)
+    np.testing.assert_array_equal(decoded['class_ids'], class_ids)
+    np.testing.assert_array_equal(decoded['probabilities'], probabilities)
+    assert decoded['model_version'] == 'v2.1'
+    assert decoded['inference_time'] == pytest.approx(0.25)
+    assert decoded['errors'] == {1: 'Invalid image'}
+
+    empty = decode_topk(encode_topk(np.zeros((0, 5)), np.zeros((0, 5))))
+    assert empty['class_ids'].shape == (0, 5) and empty['errors'] == {}
+
+    with pytest.raises(ValueError):
+        decode_topk(b'JSON' + body[4:])
+    with pytest.raises(ValueError):
+        encode_topk(class_ids, probabilities[:, :2])
+    assert accepts_binary('application/json, application/x-rxvision-topk')
+    assert not accepts_binary(None)
+
+
+def test_cache_coalesces_concurrent_misses():
+    """Concurrent requests for one key run the computation once."""
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [{'class': 'Aspirin', 'probability': 0.9}]
+
+    async def scenario():
+        cache = PredictionCache(max_entries=10)
+        key = cache.make_key(b'image', 1)
+        results = await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(5)))
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result == results[0] for result in results)
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['coalesced'] == 4 and stats['inflight'] == 0
+
+
+def test_cache_cancelled_owner_does_not_fail_coalesced_waiters():
+    """Cancelling the first caller leaves the shared computation running."""
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [{'class': 'Aspirin', 'probability': 0.9}]
+
+    async def scenario():
+        cache = PredictionCache(max_entries=10)
+        key = cache.make_key(b'image', 1)
+        owner = asyncio.ensure_future(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache.get_or_compute(key, compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        results = await asyncio.gather(*waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return cache, key, results
+
+    cache, key, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result == [{'class': 'Aspirin', 'probability': 0.9}] for result in results)
+    assert cache.get(key) == results[0]
+    assert cache.stats()['inflight'] == 0
+
+
+def test_cache_disk_io_stays_off_the_event_loop(tmp_path):
+    """Async lookups and writes touch the disk tier only from worker threads."""
+    loop_thread = threading.get_ident()
+    disk_threads = []
+
+    cache = PredictionCache(max_entries=10, disk_dir=str(tmp_path))
+    cache.set_namespace('v1')
+    for name in ('_get_disk', '_put_disk'):
+        method = getattr(cache, name)
+
+        def record(*args, _method=method):
+            disk_threads.append(threading.get_ident())
+            return _method(*args)
+
+        setattr(cache, name, record)
+
+    async def compute():
+        return TopK(np.array([2, 0], dtype=np.int32), np.array([0.8, 0.1], dtype=np.float32))
+
+    async def scenario():
+        key = cache.make_key(b'image', 2)
+        await cache.get_or_compute(key, compute)
+        await cache.aput(cache.make_key(b'other', 2), await compute())
+        return key
+
+    key = asyncio.run(scenario())
+    assert disk_threads and loop_thread not in disk_threads
+
+    # A new instance serves the result from disk, as plain lists
+    restarted = PredictionCache(max_entries=10, disk_dir=str(tmp_path))
+    restarted.set_namespace('v1')
+    assert asyncio.run(restarted.aget(key)) == [[2, 0], [pytest.approx(0.8), pytest.approx(0.1)]]
+    assert restarted.stats()['disk_hits'] == 1
+
+
+def test_cache_prunes_disk_tier_in_background(tmp_path):
+    """Going over disk_max_entries prunes on a background thread and keeps the count consistent."""
+    cache = PredictionCache(max_entries=0, disk_dir=str(tmp_path), disk_max_entries=20)
+    cache.set_namespace('v1')
+    for i in range(25):
+        cache.put(cache.make_key(str(i).encode(), 1), [i])
+
+    for _ in range(100):
+        if not cache._pruning:
+            break
+        time.sleep(0.01)
+    on_disk = sum(1 for _ in tmp_path.rglob('*.json'))
+    stats = cache.stats()
+    assert on_disk <= 20
+    assert stats['disk_entries'] == on_disk
+    assert stats['evictions'] == 25 - on_disk
+
+
+def test_calibration_split_stays_disjoint_when_shrunk():
+    calibration, evaluation = split_calibration(1000, 200, 500)
+    assert (len(calibration), len(evaluation)) == (200, 500)
+    assert not set(calibration) & set(evaluation)
+
+    # Too few images: both samples shrink in proportion, still disjoint
+    calibration, evaluation = split_calibration(70, 200, 500)
+    assert (len(calibration), len(evaluation)) == (20, 50)
+    assert not set(calibration) & set(evaluation)
+
+    calibration, evaluation = split_calibration(2, 200, 500)
+    assert (len(calibration), len(evaluation)) == (1, 1)
+
+    with pytest.raises(ValueError):
+        split_calibration(1, 200, 500)
+    with pytest.raises(ValueError):
+        split_calibration(100, 200, 0)
+
+
+def test_quantize_refuses_split_without_held_out_images(tmp_path):
+    """The accuracy gate is never run on the calibration images."""
+    (tmp_path / 'val' / 'a').mkdir(parents=True)
+    (tmp_path / 'val' / 'a' / 'only.png').write_bytes(b'')
+    with pytest.raises(ValueError, match='at least 2'):
+        quantize_model(str(tmp_path / 'model.h5'), val_dir=str(tmp_path / 'val'))
+
+
+def test_needs_escalation_checks_confidence_and_margin():
+    probabilities = np.array([
+        [0.95, 0.04, 0.01],  # confident, wide margin
+        [0.60, 0.30, 0.10],  # low confidence
+        [0.91, 0.09, 0.00],  # confident, margin 0.82
+    ])
+    np.testing.assert_array_equal(needs_escalation(probabilities, 0.9), [False, True, False])
+    np.testing.assert_array_equal(
+        needs_escalation(probabilities, 0.9, min_margin=0.85), [False, True, True]
+    )
+    # A single class has no runner-up; its probability is the margin
+    np.testing.assert_array_equal(needs_escalation(np.array([[0.5], [1.0]]), 0.9), [True, False])
+
+
+def test_choose_threshold_matches_brute_force():
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.random(200), 2)  # repeated scores on purpose
+    fast_correct = rng.random(200) < scores
+    heavy_correct = rng.random(200) < 0.97
+
+    def cascade_accuracy(threshold):
+        escalate = scores < threshold
+        return np.mean(np.where(escalate, heavy_correct, fast_correct))
+
+    for target in (0.8, 0.9, 0.95):
+        chosen = choose_threshold(scores, fast_correct, heavy_correct, target)
+        assert chosen['accuracy'] == pytest.approx(cascade_accuracy(chosen['threshold']))
+        assert chosen['escalation_rate'] == np.mean(scores < chosen['threshold'])
+        candidates = [t for t in np.unique(scores) if cascade_accuracy(t) >= target]
+        if candidates:
+            assert chosen['target_reached']
+            assert chosen['threshold'] == min(candidates)
+
+    # Unreachable target: the most accurate threshold is returned instead
+    chosen = choose_threshold(scores, fast_correct, np.zeros(200, dtype=bool), 1.0)
+    assert not chosen['target_reached']
+    assert chosen['escalation_rate'] == 0.0
+
+
+class _RecordingBackend(_FixedBackend):
+    def __init__(self, probabilities):
+        super().__init__(probabilities)
+        self.batches = []
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        self.batches.append(batch.copy())
+        return super().predict(batch)
+
+
+def test_cascade_escalates_only_uncertain_images():
+    fast = _RecordingBackend([0.5, 0.5])
+    heavy = _RecordingBackend([0.0, 1.0])
+
+    # Confidence depends on the image: the first pixel becomes the top-1 probability
+    def screen(batch):
+        fast.batches.append(batch.copy())
+        top1 = batch[:, 0, 0, 0]
+        return np.stack([top1, 1 - top1], axis=1).astype(np.float32)
+
+    fast.predict = screen
+    cascade = CascadeBackend(fast, heavy, min_confidence=0.9)
+    # Construction probes each model once for its class count
+    assert (len(fast.batches), len(heavy.batches)) == (1, 1)
+    fast.batches.clear()
+    heavy.batches.clear()
+    batch = np.zeros((4, 4, 4, 3), dtype=np.float32)
+    batch[:, 0, 0, 0] = [0.99, 0.6, 0.95, 0.7]
+
+    probabilities = cascade.predict(batch)
+    assert len(heavy.batches) == 1
+    np.testing.assert_array_equal(heavy.batches[0][:, 0, 0, 0], np.float32([0.6, 0.7]))
+    np.testing.assert_allclose(probabilities[:, 1], [0.01, 1.0, 0.05, 1.0], atol=1e-6)
+    assert (cascade.images, cascade.escalated) == (4, 2)
+
+
+def test_cascade_rejects_models_with_different_class_counts():
+    with pytest.raises(ValueError, match='same classes'):
+        CascadeBackend(_FixedBackend([0.5, 0.5]), _FixedBackend([0.2, 0.3, 0.5]))
+    with pytest.raises(ValueError, match='same input shape'):
+        CascadeBackend(_FixedBackend([0.5, 0.5]), _FixedBackend([0.5, 0.5], input_shape=(8, 8, 3)))
+
+
+class _FakeModel:
+    def __init__(self, version: str, model_path: str):
+        self.version = version
+        self.model_path = model_path
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_registry_closes_replaced_version_after_its_last_lease():
+    unloaded = []
+    registry = ModelRegistry(_FakeModel, on_unload=lambda version, model: unloaded.append(model))
+    registry.load('v1', 'a.h5').result(timeout=5)
+
+    with registry.lease() as (version, first):
+        assert version == 'v1'
+        registry.load('v1', 'b.h5').result(timeout=5)
+        # The in-flight request keeps the replaced artifact open
+        assert not first.closed and unloaded == []
+        with registry.lease('v1') as (_, second):
+            assert second.model_path == 'b.h5'
+    assert first.closed and unloaded == [first]
+    assert not second.closed
+    registry.close()
+
+
+def test_registry_evicts_least_recently_used_inactive_version():
+    registry = ModelRegistry(_FakeModel, max_resident=2)
+    v1 = registry.load('v1', 'v1.h5').result(timeout=5)
+    registry.load('v2', 'v2.h5', activate=False).result(timeout=5)
+    with registry.lease('v2') as (_, v2_model):
+        pass
+    assert registry.active_version == v1
+
+    # v3 is inactive too; v2 goes, the active v1 stays
+    registry.load('v3', 'v3.h5', activate=False).result(timeout=5)
+    versions = {info['version']: info for info in registry.stats()['versions']}
+    assert set(versions) == {'v1', 'v3'}
+    assert v2_model.closed
+
+    with pytest.raises(ValueError):
+        registry.unload('v1')
+    with pytest.raises(KeyError):
+        with registry.lease('v2'):
+            pass
+    registry.close()
+
+
+def test_registry_keeps_serving_when_a_load_fails():
+    def loader(version, model_path):
+        if version == 'bad':
+            raise RuntimeError('corrupt artifact')
+        return _FakeModel(version, model_path)
+
+    registry = ModelRegistry(loader)
+    registry.load('v1', 'v1.h5').result(timeout=5)
+    with pytest.raises(RuntimeError):
+        registry.load('bad', 'bad.h5').result(timeout=5)
+
+    assert registry.active_version == 'v1'
+    states = {info['version']: info['state'] for info in registry.stats()['versions']}
+    assert states == {'v1': 'ready', 'bad': 'failed'}
+    registry.close()
+
+
+def test_heatmap_round_trip_at_layer_resolution():
+    heatmap = np.random.default_rng(0).random((7, 5)).astype(np.float32)
+    encoded = encode_heatmap(heatmap)
+    assert encoded['heatmap_shape'] == [7, 5]
+    assert isinstance(encoded['heatmap'], str)
+    decoded = decode_heatmap(encoded['heatmap'], encoded['heatmap_shape'])
+    # uint8 quantization: within half a step of the original
+    np.testing.assert_allclose(decoded, heatmap, atol=0.5 / 255 + 1e-6)
+
+
+def test_heatmap_is_downsampled_to_max_size():
+    heatmap = np.zeros((128, 64), dtype=np.float32)
+    heatmap[:64] = 1.0
+    encoded = encode_heatmap(heatmap)
+    assert encoded['heatmap_shape'] == [HEATMAP_SIZE, HEATMAP_SIZE // 2]
+    decoded = decode_heatmap(encoded['heatmap'], encoded['heatmap_shape'])
+    assert decoded[:HEATMAP_SIZE // 2].min() == 1.0
+    assert decoded[HEATMAP_SIZE // 2:].max() == 0.0
+    # Out-of-range values are clipped into [0, 1]
+    clipped = encode_heatmap(np.array([[-0.5, 1.5]], dtype=np.float32))
+    np.testing.assert_array_equal(decode_heatmap(**clipped), [[0.0, 1.0]])
+
+
+def test_gradcam_batch_matches_single_image_explanations():
+    tf = pytest.importorskip('tensorflow')
+    from src.inference.explain import GradCAMExplainer
+
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.Input((8, 8, 3)),
+        tf.keras.layers.Conv2D(4, 3, activation='relu', name='features'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(3, activation='softmax')
+    ])
+    explainer = GradCAMExplainer(model, (8, 8, 3))
+    assert explainer.layer_name == 'features'
+
+    batch = np.random.default_rng(1).random((4, 8, 8, 3), dtype=np.float32)
+    probabilities, heatmaps = explainer(batch)
+    np.testing.assert_allclose(probabilities, model(batch).numpy(), atol=1e-5)
+    assert heatmaps.shape == (4, 6, 6)
+    assert heatmaps.min() >= 0.0 and heatmaps.max() <= 1.0
+    for i in range(len(batch)):
+        _, single = explainer(batch[i:i + 1])
+        np.testing.assert_allclose(heatmaps[i], single[0], atol=1e-5)
+
+    with pytest.raises(ValueError):
+        explainer(batch, class_idx=3)
+
+
+def _unit_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_embedding_index_exact_search_matches_brute_force(tmp_path, monkeypatch, dtype):
+    # Several blocks, so results are merged across them
+    monkeypatch.setattr(embedding_index, 'SEARCH_BLOCK_ROWS', 64)
+    references = _unit_vectors(300, 16)
+    index = EmbeddingIndex.create(str(tmp_path / 'index'), dim=16, dtype=dtype, capacity=100)
+    index.add(references[:150], [f"ndc-{i % 30}" for i in range(150)])
+    index.add(references[150:], [f"ndc-{i % 30}" for i in range(150, 300)])
+    assert len(index) == 300
+
+    queries = _unit_vectors(5, 16, seed=1)
+    rows, scores = index.search(queries, k=10)
+    exact = queries @ references.T
+    expected = np.argsort(-exact, axis=1)[:, :10]
+    tolerance = 1e-2 if dtype == 'float16' else 2e-2
+    np.testing.assert_allclose(scores, np.take_along_axis(exact, expected, axis=1), atol=tolerance)
+    # Rows agree except where quantization swaps near-ties
+    assert np.mean(rows == expected) > 0.9
+
+    # Reopened read-only, the index serves the same rows
+    reopened = EmbeddingIndex(str(tmp_path / 'index'))
+    np.testing.assert_array_equal(reopened.search(queries, k=10)[0], rows)
+    with pytest.raises(ValueError):
+        reopened.add(references[:1], ['ndc-0'])
+
+
+def test_embedding_index_pads_results_past_its_size(tmp_path):
+    index = EmbeddingIndex.create(str(tmp_path / 'index'), dim=4)
+    rows, scores = index.search(_unit_vectors(1, 4), k=3)
+    assert rows.tolist() == [[-1, -1, -1]]
+
+    index.add(np.eye(4)[:2], ['a', 'b'])
+    rows, scores = index.search(np.array([[1.0, 0.2, 0.0, 0.0]]), k=3)
+    assert rows.tolist() == [[0, 1, -1]]
+    assert scores[0, 2] == -np.inf
+
+
+def test_embedding_index_ivf_search(tmp_path):
+    # Well separated clusters, one label per cluster
+    centers = _unit_vectors(8, 32)
+    noise = _unit_vectors(400, 32, seed=1) * 0.1
+    references = centers[np.arange(400) % 8] + noise
+    labels = [f"ndc-{i % 8}" for i in range(400)]
+    index = EmbeddingIndex.create(str(tmp_path / 'index'), dim=32)
+    index.add(references, labels)
+    index.train_ivf(nlist=8, seed=0)
+
+    queries = centers + _unit_vectors(8, 32, seed=2) * 0.05
+    exact_rows, exact_scores = index.search(queries, k=5)
+    # Probing every partition is exact search; rows whose scores differ only
+    # by matmul rounding may swap places
+    rows, scores = index.search(queries, k=5, nprobe=8)
+    np.testing.assert_array_equal(np.sort(rows), np.sort(exact_rows))
+    np.testing.assert_allclose(scores, exact_scores, atol=1e-6)
+    # One probe finds the query's own cluster
+    rows, _ = index.search(queries, k=5, nprobe=1)
+    assert all(labels[r] == f"ndc-{q}" for q in range(8) for r in rows[q])
+
+    # Rows added after training are assigned to a partition and found
+    index.add(centers[:1] * 2, ['ndc-new'])
+    nearest = index.nearest_labels(centers[:1], k=2, nprobe=1)[0]
+    assert [n['label'] for n in nearest] == ['ndc-new', 'ndc-0']
+    assert nearest[0]['reference'] == 400
+
+    reopened = EmbeddingIndex(str(tmp_path / 'index'))
+    assert reopened.nlist == 8
+    np.testing.assert_array_equal(reopened.search(queries, k=5, nprobe=1)[0][1:], rows[1:])
+
+
+def test_embedding_index_ivf_search_matches_per_query_probing(tmp_path):
+    """Grouping queries by partition returns what probing each query alone does."""
+    references = _unit_vectors(500, 16)
+    index = EmbeddingIndex.create(str(tmp_path / 'index'), dim=16)
+    index.add(references, [f"ndc-{i % 25}" for i in range(500)])
+    index.train_ivf(nlist=10, seed=0)
+
+    queries = _unit_vectors(40, 16, seed=3)
+    rows, scores = index.search(queries, k=7, nprobe=3)
+
+    # Exact scores of every row, searched only within each query's probes
+    all_rows, all_scores = index.search(queries, k=500)
+    probes = np.argsort(-(queries @ index._centroids.T), axis=1)[:, :3]
+    for q, probe in enumerate(probes):
+        candidates = set(np.concatenate([index._list_rows[p] for p in probe]).tolist())
+        allowed = [i for i, row in enumerate(all_rows[q]) if row in candidates][:7]
+        np.testing.assert_array_equal(rows[q], all_rows[q, allowed])
+        np.testing.assert_allclose(scores[q], all_scores[q, allowed], atol=1e-6)
+
+
+def test_micro_batcher_groups_concurrent_items_in_order():
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=200)
+    batcher.start()
+    try:
+        futures = [batcher.submit(i) for i in range(6)]
+        assert [f.result(timeout=5) for f in futures] == [0, 10, 20, 30, 40, 50]
+    finally:
+        batcher.stop(timeout=5)
+    # A full batch goes at once; the rest waits out max_wait and follows
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+    assert batcher.stats()['batch_sizes']['counts'] == {'2': 1, '4': 1}
+
+
+def test_micro_batcher_survives_cancelled_and_failing_items():
+    release = threading.Event()
+
+    def process(items):
+        release.wait(5)
+        if 'boom' in items:
+            raise ValueError('bad batch')
+        return items
+
+    batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0)
+    batcher.start()
+    try:
+        busy = batcher.submit('first')
+        # Give the worker time to take 'first' before queueing the rest
+        time.sleep(0.05)
+        cancelled = batcher.submit('gone')
+        assert cancelled.cancel()
+        failing = batcher.submit('boom')
+        after = batcher.submit('after')
+        release.set()
+
+        assert busy.result(timeout=5) == 'first'
+        with pytest.raises(ValueError):
+            failing.result(timeout=5)
+        assert after.result(timeout=5) == 'after'
+    finally:
+        batcher.stop(timeout=5)
+
+
+def test_metrics_render_prometheus_text():
+    registry = MetricsRegistry()
+    latency = registry.histogram('rx_latency_seconds', 'Latency', ['stage'], buckets=[0.01, 0.1])
+    errors = registry.counter('rx_errors_total', 'Errors', ['path'])
+    registry.gauge('rx_queue', 'Queue depth', lambda: {('a',): 3, ('b',): None}, ['name'])
+    registry.gauge('rx_broken', 'Broken gauge', lambda: 1 / 0)
+
+    tracker = LatencyTracker()
+    tracker.export_to(latency, 'decode')
+    for seconds in (0.005, 0.05, 0.5):
+        tracker.observe(seconds)
+    errors.inc('/predict "x"')
+
+    lines = registry.render().splitlines()
+    assert 'rx_latency_seconds_bucket{stage="decode",le="0.01"} 1' in lines
+    assert 'rx_latency_seconds_bucket{stage="decode",le="0.1"} 2' in lines
+    assert 'rx_latency_seconds_bucket{stage="decode",le="+Inf"} 3' in lines
+    assert 'rx_latency_seconds_count{stage="decode"} 3' in lines
+    assert 'rx_errors_total{path="/predict \\"x\\""} 1.0' in lines
+    assert 'rx_queue{name="a"} 3.0' in lines
+    assert not any(line.startswith('rx_queue{name="b"}') for line in lines)
+    assert '# TYPE rx_broken gauge' in lines
+
+    snapshot = tracker.snapshot()
+    assert snapshot['count'] == 3
+    assert snapshot['p50_ms'] == pytest.approx(50.0)
+    assert snapshot['max_ms'] == pytest.approx(500.0)
+
+
+def test_request_metrics_middleware_groups_unknown_paths():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ['path', 'status'])
+    errors = registry.counter('errors_total', 'Errors', ['path', 'status'])
+    duration = registry.histogram('duration_seconds', 'Duration', ['path'])
+    body_read = registry.histogram('stage_seconds', 'Stages', ['stage'])
+
+    async def app(scope, receive, send):
+        while (await receive()).get('more_body'):
+            pass
+        status = 200 if scope['path'] == '/predict' else 404
+        await send({'type': 'http.response.start', 'status': status, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    middleware = RequestMetricsMiddleware(
+        app, requests, errors, duration,
+        body_read=body_read, body_read_labels=('body_read',), known_paths=['/predict']
+    )
+
+    async def run():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await client.post('/predict', content=b'x' * 1000)
+            await client.get('/secret/123')
+
+    asyncio.run(run())
+    text = registry.render()
+    assert 'requests_total{path="/predict",status="200"} 1.0' in text
+    assert 'requests_total{path="other",status="404"} 1.0' in text
+    assert 'errors_total{path="other",status="404"} 1.0' in text
+    assert '/secret' not in text
+    assert 'stage_seconds_count{stage="body_read"} 2' in text
+
+
+def _tiny_keras_model(tf):
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential([
+        tf.keras.Input((4, 4, 3)),
+        tf.keras.layers.Conv2D(2, 3, activation='relu'),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(5, activation='softmax')
+    ])
+
+
+def test_compiled_runner_pads_and_splits_into_buckets():
+    tf = pytest.importorskip('tensorflow')
+    from src.inference.engine import CompiledModelRunner
+
+    model = _tiny_keras_model(tf)
+    runner = CompiledModelRunner(model, batch_buckets=(4, 1, 2))
+    assert runner.batch_buckets == (1, 2, 4)
+    assert [runner.bucket_for(n) for n in (1, 2, 3, 4, 9)] == [1, 2, 4, 4, 4]
+
+    batch = np.random.default_rng(0).random((9, 4, 4, 3), dtype=np.float32)
+    expected = model(batch).numpy()
+    for n in (1, 3, 9):
+        np.testing.assert_allclose(runner(batch[:n]), expected[:n], atol=1e-6)
+    # 9 images run as 4 + 4 + 1: every shape was traced exactly once
+    assert sorted(runner._concrete) == [1, 4]
+
+    with pytest.raises(ValueError):
+        runner(np.zeros((0, 4, 4, 3), dtype=np.float32))
+    with pytest.raises(ValueError):
+        runner(np.zeros((1, 5, 5, 3), dtype=np.float32))
+
+
+def test_tensorflow_backend_fast_path_matches_predict(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    from src.inference.model_loader import load_backend
+
+    model_path = tmp_path / 'model.keras'
+    _tiny_keras_model(tf).save(model_path)
+    batch = np.random.default_rng(0).random((3, 4, 4, 3), dtype=np.float32)
+
+    compiled = load_backend(str(model_path), input_shape=(4, 4, 3), batch_buckets=(1, 4))
+    compiled.warmup()
+    plain = load_backend(str(model_path), input_shape=(4, 4, 3), use_compiled=False)
+    assert compiled.name == 'tensorflow'
+    np.testing.assert_allclose(compiled.predict(batch), plain.predict(batch), atol=1e-6)
+
+
+def test_backend_is_inferred_from_the_artifact(tmp_path):
+    (tmp_path / 'exported').mkdir()
+    (tmp_path / 'exported' / 'saved_model.pb').write_bytes(b'')
+    assert infer_backend(str(tmp_path / 'exported')) == 'savedmodel'
+    assert infer_backend('models/best_model.onnx') == 'onnxruntime'
+    assert infer_backend('models/best_model_int8.tflite') == 'tflite'
+    assert infer_backend('models/best_model.h5') == 'tensorflow'
+    with pytest.raises(ValueError, match='Unknown backend'):
+        load_backend('models/best_model.h5', backend='torch')
+
+
+def test_onnx_export_matches_keras(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('tf2onnx')
+    from src.inference.model_loader import ONNXRuntimeBackend, export_onnx
+
+    model_path = tmp_path / 'model.keras'
+    model = _tiny_keras_model(tf)
+    model.save(model_path)
+    report = export_onnx(str(model_path), str(tmp_path / 'model.onnx'))
+    assert report['max_abs_diff'] <= report['atol']
+
+    backend = load_backend(str(tmp_path / 'model.onnx'), input_shape=(4, 4, 3), intra_op_threads=1)
+    batch = np.random.default_rng(0).random((3, 4, 4, 3), dtype=np.float32)
+    np.testing.assert_allclose(backend.predict(batch), model(batch).numpy(), atol=1e-5)
+    with pytest.raises(ValueError):
+        ONNXRuntimeBackend(str(tmp_path / 'model.onnx'), graph_optimization_level='max')
+
+
+def test_service_import_does_not_load_tensorflow():
+    """Startup only pays for TensorFlow when a backend needs it."""
+    import subprocess
+    import sys
+
+    code = "import sys, src.inference.service; print('tensorflow' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, timeout=120,
+        cwd=Path(__file__).resolve().parents[1]
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == 'False'
+
+
+def test_savedmodel_export_round_trip(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    from src.inference.model_loader import export_savedmodel
+
+    model_path = tmp_path / 'model.keras'
+    model = _tiny_keras_model(tf)
+    model.save(model_path)
+    report = export_savedmodel(str(model_path), str(tmp_path / 'exported'))
+    assert report['max_abs_diff'] <= report['atol']
+
+    backend = load_backend(str(tmp_path / 'exported'), input_shape=(4, 4, 3))
+    assert backend.name == 'savedmodel'
+    batch = np.random.default_rng(0).random((3, 4, 4, 3), dtype=np.float32)
+    np.testing.assert_allclose(backend.predict(batch), model(batch).numpy(), atol=1e-6)
+
+
+def test_benchmark_compare_flags_regressions_by_direction():
+    from benchmarks.common import latency_summary
+    from benchmarks.compare import compare
+
+    summary = latency_summary([0.010, 0.020, 0.030], items_per_call=4)
+    assert summary['p50_ms'] == pytest.approx(20.0)
+    assert summary['items_per_second'] == pytest.approx(200.0)
+    assert latency_summary([]) == {'count': 0}
+
+    old = {'results': {
+        'batch': {'p95_ms': 10.0, 'images_per_second': 100.0, 'count': 50},
+        'load': [{'target_rps': 20, 'achieved_rps': 20.0, 'error_rate': 0.0}]
+    }}
+    new = {'results': {
+        'batch': {'p95_ms': 10.5, 'images_per_second': 80.0, 'count': 10},
+        'load': [{'target_rps': 20, 'achieved_rps': 19.0, 'error_rate': 0.1}]
+    }}
+    rows = {name: regressed for name, _, _, _, regressed in compare(old, new, threshold=0.1)}
+    assert rows == {
+        'batch.count': False,                # neither direction
+        'batch.images_per_second': True,     # 20% slower
+        'batch.p95_ms': False,               # 5% is within the threshold
+        'load[20].achieved_rps': False,
+        'load[20].error_rate': True,         # errors appeared
+        'load[20].target_rps': False
+    }
+
+
+def _fake_service(monkeypatch, probabilities=(0.7, 0.2, 0.1)):
+    """Point the service's globals at an in-process model version 'v1'."""
+    from src.inference import service
+
+    predictor = RxPredictor('fixed', target_size=(4, 4), backend=_FixedBackend(probabilities))
+    registry = ModelRegistry(lambda version, model_path: predictor)
+    registry.load('v1', 'fixed').result(timeout=5)
+    monkeypatch.setattr(service, 'registry', registry)
+    monkeypatch.setattr(service, 'cache', None)
+    monkeypatch.setattr(service, 'executor', InferenceExecutor(max_workers=1, max_queue=8))
+    return service
+
+
+def test_stream_upload_stops_reading_while_inference_is_blocked(tmp_path, monkeypatch):
+    """Upload backpressure: a blocked model stops the body from being read."""
+    service = _fake_service(monkeypatch)
+    monkeypatch.setattr(service, 'STREAM_CHUNK_SIZE', 2)
+    monkeypatch.setattr(service, 'STREAM_SPOOL_DIR', str(tmp_path))
+
+    async def run():
+        release = asyncio.Event()
+        calls = []
+
+        async def blocked_predict(version, predictor, contents, top_k):
+            calls.append(len(contents))
+            await release.wait()
+            return [TopK(np.array([0]), np.array([1.0]))] * len(contents), [None] * len(contents)
+
+        monkeypatch.setattr(service, '_predict_contents', blocked_predict)
+        body = _multipart_body([(f'{i}.png', bytes(2048)) for i in range(40)])
+        sent = [0]
+
+        async def stream():
+            for start in range(0, len(body), 1024):
+                sent[0] += 1024
+                yield body[start:start + 1024]
+
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            request = asyncio.ensure_future(client.post(
+                '/predict/stream', content=stream(), headers={'content-type': _MULTIPART_TYPE}
+            ))
+            await asyncio.sleep(0.5)
+            stalled_at = sent[0]
+            await asyncio.sleep(0.3)
+            assert calls and sent[0] == stalled_at
+            # Only the files waiting for the model are read, a fraction of the job
+            assert stalled_at < len(body) / 2
+            assert sum(1 for p in tmp_path.rglob('*') if p.is_file()) <= 10
+
+            release.set()
+            response = await request
+
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line['index'] for line in lines] == list(range(40))
+        assert not any(p.is_file() for p in tmp_path.rglob('*'))
+
+    asyncio.run(run())
+
+
+def test_decode_upload_rejects_decompression_bombs_with_413(monkeypatch):
+    """PIL's bomb error surfaces as 413 like the service's own pixel limit."""
+    import io
+
+    from fastapi import HTTPException
+    from PIL import Image
+
+    from src.inference import service
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300)).save(buffer, format='PNG')
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    monkeypatch.setattr(service, 'MAX_IMAGE_PIXELS', 10 ** 9)
+    with pytest.raises(HTTPException) as excinfo:
+        service._decode_upload(buffer.getvalue(), (4, 4))
+    assert excinfo.value.status_code == 413
+
+
+def test_predict_endpoints_reject_non_positive_top_k():
+    """return_top_k below 1 is a 422 before any model work starts."""
+    from src.inference import service
+
+    async def run():
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            for top_k in (0, -1):
+                responses = [
+                    await client.post(
+                        f'/predict?return_top_k={top_k}', files={'file': ('a.png', b'image')}
+                    ),
+                    await client.post(
+                        f'/predict/stream?return_top_k={top_k}',
+                        content=_multipart_body([('a.png', b'image')]),
+                        headers={'content-type': _MULTIPART_TYPE}
+                    )
+                ]
+                for path in ('/predict/batch', '/predict/batch/stream'):
+                    responses.append(await client.post(
+                        path, json={'image_urls': ['https://example.com/a.png'], 'return_top_k': top_k}
+                    ))
+                for response in responses:
+                    assert response.status_code == 422
+                    assert [error['loc'][-1] for error in response.json()['detail']] == ['return_top_k']
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+"""
+Tests for RxVision25 training configuration.
+"""
+
+import time
+
+import pytest
+
+
+def test_trainer_does_not_cache_in_memory_by_default(tmp_path):
+    """Memory caching pins the whole decoded dataset in RAM, so it is opt-in."""
+    pytest.importorskip('tensorflow')
+    from src.training.train import RxVisionTrainer
+
+    (tmp_path / 'train').mkdir()
+    (tmp_path / 'val').mkdir()
+    trainer = RxVisionTrainer(train_dir=str(tmp_path / 'train'), val_dir=str(tmp_path / 'val'))
+    assert trainer.cache is False
+    assert trainer._cache_for('train') is False
+
+
+def _timing_model(steps_per_execution=1):
+    import tensorflow as tf
+
+    model = tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(1)])
+    model.compile(optimizer='sgd', loss='mse', steps_per_execution=steps_per_execution)
+    return model
+
+
+def _slow_dataset(delay):
+    """Eight batches of four rows, each taking ``delay`` seconds to produce."""
+    import numpy as np
+    import tensorflow as tf
+
+    def slow(x, y):
+        def sleep(value):
+            time.sleep(delay)
+            return value
+        x = tf.py_function(sleep, [x], tf.float32)
+        x.set_shape((None, 4))
+        return x, y
+
+    x = np.zeros((32, 4), dtype=np.float32)
+    y = np.zeros((32, 1), dtype=np.float32)
+    return tf.data.Dataset.from_tensor_slices((x, y)).batch(4).map(slow)
+
+
+def test_step_timing_attributes_input_wait_to_each_step():
+    """Each step pairs with its own batch stamp, across epochs."""
+    tf = pytest.importorskip('tensorflow')
+    from src.models.callbacks import StepTimingCallback
+
+    timing = StepTimingCallback()
+    seen = []
+
+    class Probe(tf.keras.callbacks.Callback):
+        def on_train_batch_begin(self, batch, logs=None):
+            seen.append(len(timing._ready))
+
+    model = _timing_model()
+    model.fit(
+        timing.wrap_dataset(_slow_dataset(0.02)),
+        epochs=2,
+        callbacks=[Probe(), timing],
+        verbose=0
+    )
+
+    # Nothing was stamped ahead of the step that consumed it
+    assert seen == [0] * 16
+    stats = timing.epoch_stats()
+    assert stats['steps'] == 8
+    assert stats['data_wait_ms'] >= 15
+    assert stats['input_stall_fraction'] > 0.5
+
+
+def test_step_timing_refuses_prefetch_after_the_stamp():
+    tf = pytest.importorskip('tensorflow')
+    from src.models.callbacks import StepTimingCallback
+
+    timing = StepTimingCallback()
+    dataset = timing.wrap_dataset(_slow_dataset(0)).prefetch(tf.data.AUTOTUNE)
+    with pytest.raises(ValueError, match='prefetching'):
+        _timing_model().fit(dataset, epochs=1, callbacks=[timing], verbose=0)
+
+
+def test_step_timing_refuses_multiple_steps_per_execution():
+    pytest.importorskip('tensorflow')
+    from src.models.callbacks import StepTimingCallback
+
+    timing = StepTimingCallback()
+    with pytest.raises(ValueError, match='steps_per_execution'):
+        _timing_model(steps_per_execution=2).fit(
+            timing.wrap_dataset(_slow_dataset(0)), epochs=1, callbacks=[timing], verbose=0
+        )
+
+
+def test_trainer_keeps_v1_as_the_default_architecture(tmp_path):
+    """EfficientNetV2 is opt-in; existing runs keep training the v1 model."""
+    pytest.importorskip('tensorflow')
+    from src.training.train import RxVisionTrainer
+
+    (tmp_path / 'train').mkdir()
+    trainer = RxVisionTrainer(train_dir=str(tmp_path / 'train'), img_size=32, num_classes=3)
+    assert trainer.architecture == 'rxvision-v1'
+    assert trainer.create_model().name == 'rxvision_v1'
+
+    trainer = RxVisionTrainer(
+        train_dir=str(tmp_path / 'train'), img_size=32, num_classes=3,
+        architecture='efficientnetv2-b0'
+    )
+    model = trainer.create_model()
+    assert model.name == 'efficientnetv2_b0'
+    assert model.output_shape == (None, 3)